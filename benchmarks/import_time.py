@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Import time of the covid19_analysis modules, each measured in a fresh
+interpreter as a short-lived worker or a CLI invocation would pay it.
+
+    python benchmarks/import_time.py [--repeat 5] [module ...]
+
+The 'first figure' line adds the cost of building one plotly figure after
+importing dataPlot, this is when plotly is actually imported.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+default_modules = ('covid19_analysis.dataFun',
+                   'covid19_analysis.dataMetrics',
+                   'covid19_analysis.dataHierarchy',
+                   'covid19_analysis.dataPlot',
+                   'covid19_analysis.dataPlot_datagouv',
+                   'covid19_analysis.report')
+
+# Statement timed in the child interpreter, prints the elapsed time and whether plotly was imported
+_timer = '''import sys, time
+t = time.perf_counter()
+{stmt}
+print(time.perf_counter() - t, 'plotly' in sys.modules)
+'''
+
+
+# Time one statement in a new interpreter, baseline imports are done before the timer starts
+def time_statement(stmt, baseline='', repeat=5):
+    '''Provide the median time in seconds of stmt and whether plotly was loaded'''
+    times = []
+    for _ in range(repeat):
+        code = baseline + '\n' + _timer.format(stmt=stmt)
+        out = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE,
+                             universal_newlines=True).stdout.split()
+        times.append(float(out[0]))
+    return statistics.median(times), out[1] == 'True'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Import time of covid19_analysis modules')
+    parser.add_argument('modules', nargs='*', default=default_modules, help='modules to import')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of interpreters per module')
+    args = parser.parse_args(args)
+
+    # pandas & numpy are needed by every module, they are reported on their own line
+    rows = [('pandas + numpy', time_statement('import numpy, pandas', repeat=args.repeat))]
+    for module in args.modules:
+        rows.append((module, time_statement('import ' + module, 'import numpy, pandas', args.repeat)))
+    rows.append(('first figure', time_statement(
+        'covid19_analysis.dataPlot.plotly.graph_objs.Figure()',
+        'import numpy, pandas, covid19_analysis.dataPlot', args.repeat)))
+
+    print('%-36s %10s  %s' %('import', 'time [ms]', 'plotly loaded'))
+    for name, (t, has_plotly) in rows:
+        print('%-36s %10.1f  %s' %(name, t * 1e3, has_plotly))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Deferred import of heavy optional packages. The numeric core (dataFun,
+# dataMetrics, dataQuery, dataHierarchy, dataRepair, ...) only needs pandas
+# and numpy and never imports plotly; the plotting modules (dataPlot,
+# dataPlot_datagouv) use a LazyModule so plotly and its graph_objs tree are
+# only imported when the first figure is built:
+#   plotly = LazyModule('plotly', ('plotly.graph_objs', 'plotly.subplots'))
+#   fig = plotly.graph_objs.Figure()    # plotly is imported here
+class LazyModule:
+    '''Module placeholder importing the module (and its submodules) on first attribute access
+        name:       <string> module name
+        submodules: <list> submodules imported together with the module
+        '''
+    def __init__(self, name, submodules=()):
+        self._name = name
+        self._submodules = tuple(submodules)
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            module = importlib.import_module(self._name)
+            for sub in self._submodules:
+                importlib.import_module(sub)
+            self._module = module
+        return self._module
+
+    @property
+    def loaded(self):
+        '''True once the module has been imported'''
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        # only called for attributes not found on the placeholder itself
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return '<LazyModule %s (%s)>' %(self._name, 'loaded' if self.loaded else 'not loaded')
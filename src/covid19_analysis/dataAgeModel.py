@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataPopulation as dataPopulation
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Age-structured hospital model for the datagouv data per region and age
+# class (donnees-hospitalieres-classe-age-covid19, columns reg, cl_age90,
+# jour, hosp, rea, dc). Compartments per region and age class:
+#   S -> E -> I -> recovered
+#             I -> H (hospital) -> U (intensive care, rea) -> D (deaths) / recovered
+#                  H -> D / recovered
+# The force of infection of each age class is the product of the contact
+# matrix with the share of infected of every class, one dense matrix
+# product for all regions:  lambda = beta * (I / N) @ C.T
+# All regions and age classes are integrated together (Runge-Kutta 4, one
+# step per day) as one state array. Calibration fits per region the
+# transmission rate, the initial share of infected and the scales of the
+# hospital, intensive care and death probabilities against the observed
+# hosp (= H + U), rea (= U) and dc (= D) of all age classes, on log scale.
+#
+#   model = dataAgeModel.AgeHospitalModel(change_date='2020-03-17').fit(df_age)
+#   df_nat = model.scenario(days=60, beta_factor=1.2)['hosp']
+age_classes = (9, 19, 29, 39, 49, 59, 69, 79, 89, 90)
+age_fields = ('hosp', 'rea', 'dc')
+age_model_params = ('log_beta', 'log_i0', 'log_hosp', 'log_icu', 'log_death')
+# Bounds of the parameters: transmission, initial share of infected, probability scales, change factor
+_param_bounds = np.log([[1e-3, 1e-10, 1e-2, 1e-2, 1e-2, 1e-2],
+                        [5., 1e-1, 1e2, 1e2, 1e2, 5.]])
+
+# Share of the population per age class, France 2020 (INSEE, rounded)
+default_age_shares = np.array([.116, .123, .113, .121, .129, .132, .120, .089, .048, .009])
+
+# Default probabilities per age class, calibration scales them per region:
+# hospitalization of the infected, intensive care and death of the hospitalized
+default_p_hosp = np.array([.001, .001, .005, .011, .014, .029, .058, .093, .216, .262])
+default_p_icu = np.array([.05, .10, .10, .15, .20, .25, .30, .25, .10, .05])
+default_p_death_hosp = np.array([0., 0., .005, .01, .02, .04, .08, .15, .25, .30])
+default_p_death_icu = np.array([.05, .05, .10, .10, .15, .20, .30, .40, .50, .50])
+
+
+# Contact matrix built from a mixing parameter
+def default_contact_matrix(num_ages=len(age_classes), assortativity=.5, contacts=10.):
+    '''Provide a (ages x ages) contact matrix, mix of homogeneous and within-class contacts
+        num_ages:       <int> number of age classes
+        assortativity:  <float> share of the contacts within the same age class
+        contacts:       <float> number of contacts per day and per person
+        A survey matrix (e.g. POLYMOD for France aggregated to the cl_age90 classes) can be used instead
+        '''
+    homogeneous = np.full((num_ages, num_ages), 1. / num_ages)
+    return contacts * ((1 - assortativity) * homogeneous + assortativity * np.eye(num_ages))
+
+
+# Arrays (regions x ages x days) from the long datagouv data
+def age_series(df_age, fields=age_fields):
+    '''Provide the observed series per region and age class
+        df_age:     <dataframe> datagouv data with columns reg, cl_age90, jour and the fields
+        fields:     <list> columns to extract, only those present in df_age are returned
+        Return (regions index, dates, {field: array (regions x ages x days)}), NaN when not reported.
+        The all ages rows (cl_age90 == 0) are not used
+        '''
+    df = df_age[df_age['cl_age90'] != 0]
+    regions = pd.Index(sorted(df['reg'].unique()), name='reg')
+    dates = pd.DatetimeIndex(sorted(pd.to_datetime(df['jour'].unique())))
+    ages = pd.Index(age_classes)
+
+    r = regions.get_indexer(df['reg'])
+    a = ages.get_indexer(df['cl_age90'])
+    d = dates.get_indexer(pd.to_datetime(df['jour']))
+    keep = a >= 0
+    out = {}
+    for field in fields:
+        if field in df.columns:
+            values = np.full((len(regions), len(ages), len(dates)), np.nan)
+            values[r[keep], a[keep], d[keep]] = df[field].to_numpy(dtype=float)[keep]
+            out[field] = values
+    return regions, dates, out
+
+
+class AgeHospitalModel:
+    '''Age-structured SEIR model with hospital, intensive care and deaths, per region
+        contact:        <array> (ages x ages) contact matrix, see default_contact_matrix
+        population:     <dataframe> population per region (rows, reg codes) and age class (columns, age_classes),
+                        regional totals of dataPopulation split with default_age_shares if None
+        latent:         <float> mean latent period in days (E)
+        infectious:     <float> mean infectious period in days (I)
+        hosp_stay:      <float> mean stay in hospital before intensive care, death or discharge (H)
+        icu_stay:       <float> mean stay in intensive care (U)
+        change_date:    <string/datetime> date of a change of transmission (e.g. lockdown), its factor is calibrated
+        lead:           <int> days simulated before the first observation, to grow the epidemic from its seed
+
+        fit(df_age):            calibrate the parameters of all regions
+        simulate(days):         series (region, age) x dates of all compartments
+        scenario(days, ...):    national series per age class, with a change of transmission after the data
+        '''
+
+    def __init__(self, contact=None, population=None, latent=4., infectious=5., hosp_stay=10., icu_stay=14.,
+                 change_date=None, lead=30):
+        self.contact = default_contact_matrix() if contact is None else np.asarray(contact, dtype=float)
+        self.population = population
+        self.rates = np.array([1. / latent, 1. / infectious, 1. / hosp_stay, 1. / icu_stay])
+        self.p_hosp, self.p_icu = default_p_hosp, default_p_icu
+        self.p_death_hosp, self.p_death_icu = default_p_death_hosp, default_p_death_icu
+        self.change_date = None if change_date is None else pd.Timestamp(change_date)
+        self.lead = lead
+        self.params = None
+
+    # Population (regions x ages)
+    def _population(self, regions):
+        if self.population is not None:
+            return self.population.reindex(index=regions, columns=list(age_classes)).to_numpy(dtype=float)
+        totals, _ = dataPopulation.match_population(regions, 'reg', verbose=True)
+        return totals.to_numpy()[:, None] * default_age_shares / default_age_shares.sum()
+
+    # Integrate the model, params (batch x regions x params), return {field: (batch x regions x ages x days)}
+    def _integrate(self, params, N, num_days, change_day=None, beta_factor=None, factor_day=None):
+        sigma, gamma, eta, mu = self.rates
+        beta = np.exp(params[..., 0])[..., None]
+        i0 = np.exp(params[..., 1])[..., None]
+        p_hosp = np.minimum(np.exp(params[..., 2])[..., None] * self.p_hosp, 1.)
+        p_icu = np.minimum(np.exp(params[..., 3])[..., None] * self.p_icu, 1.)
+        scale_death = np.exp(params[..., 4])[..., None]
+        p_dh = np.minimum(scale_death * self.p_death_hosp, 1. - p_icu)
+        p_du = np.minimum(scale_death * self.p_death_icu, 1.)
+        change = np.exp(params[..., 5])[..., None] if params.shape[-1] > 5 else 1.
+        contact_t = self.contact.T
+
+        # state: S, E, I, H, U, D
+        y = np.zeros((6,) + beta.shape[:-1] + N.shape[-1:])
+        y[2] = i0 * N
+        y[0] = N - y[2]
+
+        def deriv(y, b):
+            S, E, I, H, U, _ = y
+            new_inf = b * ((I / N) @ contact_t) * S
+            out_h, out_u = eta * H, mu * U
+            return np.stack([-new_inf, new_inf - sigma * E, sigma * E - gamma * I,
+                             p_hosp * gamma * I - out_h, p_icu * out_h - out_u,
+                             p_dh * out_h + p_du * out_u])
+
+        out = np.empty((num_days,) + y.shape)
+        for t in range(num_days):
+            out[t] = y
+            b = beta
+            if change_day is not None and t >= change_day:
+                b = b * change
+            if beta_factor is not None and t >= factor_day:
+                b = b * beta_factor
+            k1 = deriv(y, b)
+            k2 = deriv(y + .5 * k1, b)
+            k3 = deriv(y + .5 * k2, b)
+            k4 = deriv(y + k3, b)
+            y = y + (k1 + 2 * k2 + 2 * k3 + k4) / 6
+
+        out = np.moveaxis(out, 0, -1)
+        return {'S': out[0], 'E': out[1], 'I': out[2], 'hosp': out[3] + out[4], 'rea': out[4], 'dc': out[5]}
+
+    # Residuals on log scale of all observed values, (batch x regions x observations)
+    def _residuals(self, params, N, observed, change_day):
+        sim = self._integrate(params, N, self.lead + self._num_days, change_day)
+        res = []
+        for field, obs in observed.items():
+            model = sim[field][..., self.lead:]
+            res.append(np.where(np.isnan(obs), 0., np.log1p(np.maximum(model, 0)) - np.log1p(np.nan_to_num(obs))))
+        return np.concatenate([r.reshape(r.shape[:2] + (-1,)) for r in res], axis=-1)
+
+    def fit(self, df_age, max_iter=30, prior=1e-2, verbose=False):
+        '''Calibrate the model parameters of every region against the observed hosp, rea & dc per age class
+            df_age:     <dataframe> datagouv data with columns reg, cl_age90, jour, hosp, rea, dc
+            max_iter:   <int> maximum number of Levenberg-Marquardt iterations
+            prior:      <float> weight of the squared distance of the parameters to their initial values,
+                        keeps the parameters without data (e.g. log_icu without rea column) at their default
+            verbose:    <boolean> display the error at each iteration
+            Return the model, the fitted parameters are in model.params (regions x parameters)
+            '''
+        regions, dates, observed = age_series(df_age)
+        if not observed:
+            raise KeyError('None of the columns %s found in the data' %(', '.join(age_fields)))
+        self.regions, self.dates = regions, dates
+        self._num_days = len(dates)
+        self._N = self._population(regions)
+        change_day = None
+        if self.change_date is not None:
+            change_day = self.lead + int((self.change_date - dates[0]).days)
+        self._change_day = change_day
+
+        # initial values: R0 of 2.5, seed of 1e-5 of the population
+        names = list(age_model_params) + (['log_change'] if change_day is not None else [])
+        radius = np.max(np.abs(np.linalg.eigvals(self.contact)))
+        p0 = [np.log(2.5 * self.rates[1] / radius), np.log(1e-5), 0., 0., 0.] + ([np.log(.3)] if change_day is not None else [])
+        p0 = np.array(p0)
+        params = np.tile(p0, (len(regions), 1))
+        num_params = params.shape[1]
+        low, high = _param_bounds[:, :num_params]
+
+        lam = np.full(len(regions), 1e-2)
+        res = self._residuals(params[None], self._N, observed, change_day)[0]
+        sse = (res ** 2).sum(axis=1) + prior * ((params - p0) ** 2).sum(axis=1)
+        h = 1e-4
+        for it in range(max_iter):
+            # finite differences, all parameters perturbed in one batch
+            batch = np.repeat(params[None], num_params, axis=0)
+            batch[np.arange(num_params), :, np.arange(num_params)] += h
+            jac = (self._residuals(batch, self._N, observed, change_day) - res[None]) / h
+            jac = np.moveaxis(jac, 0, -1)
+            eye = np.eye(num_params)
+            jtj = np.einsum('rmp,rmq->rpq', jac, jac) + prior * eye
+            jtr = np.einsum('rmp,rm->rp', jac, res) + prior * (params - p0)
+            step = -np.linalg.solve(jtj + lam[:, None, None] * (jtj * eye), jtr[:, :, None])[:, :, 0]
+
+            new_params = np.clip(params + step, low, high)
+            new_res = self._residuals(new_params[None], self._N, observed, change_day)[0]
+            new_sse = (new_res ** 2).sum(axis=1) + prior * ((new_params - p0) ** 2).sum(axis=1)
+            accept = np.isfinite(new_sse) & (new_sse < sse)
+            params[accept], res[accept], sse[accept] = new_params[accept], new_res[accept], new_sse[accept]
+            lam = np.where(accept, lam / 3, lam * 4)
+            if verbose: print('iteration %d, error %.4f, %d regions improved' %(it, sse.sum(), accept.sum()))
+            if not accept.any() and (lam > 1e8).all():
+                break
+
+        self._params = params
+        self.params = pd.DataFrame(params, index=regions, columns=names)
+        num_obs = np.maximum(sum((~np.isnan(obs)).sum(axis=(1, 2)) for obs in observed.values()), 1)
+        self.rmse = pd.Series(np.sqrt((res ** 2).sum(axis=1) / num_obs), index=regions, name='rmse')
+        return self
+
+    # Series of a simulation as (region, age) x dates dataframes
+    def _frames(self, sim, dates):
+        index = pd.MultiIndex.from_product([self.regions, age_classes], names=['reg', 'cl_age90'])
+        return {field: pd.DataFrame(dataPrecision.as_metric(values[0].reshape(-1, values.shape[-1])), index=index, columns=dates)
+                for field, values in sim.items()}
+
+    def simulate(self, days=0, beta_factor=None):
+        '''Provide the fitted model over the observed days plus days ahead
+            days:           <int> number of days simulated after the last observation
+            beta_factor:    <float> change of the transmission after the last observation (e.g. .7 for new measures)
+            Return a dictionary {S, E, I, hosp, rea, dc} of dataframes, rows (reg, cl_age90), one column per day
+            '''
+        if self.params is None:
+            raise ValueError('The model is not calibrated, call fit first')
+        num_days = self.lead + self._num_days + days
+        sim = self._integrate(self._params[None], self._N, num_days, self._change_day,
+                              beta_factor, self.lead + self._num_days)
+        sim = {field: values[..., self.lead:] for field, values in sim.items()}
+        dates = pd.date_range(self.dates[0], periods=self._num_days + days)
+        return self._frames(sim, dates)
+
+    def scenario(self, days=60, beta_factor=1.):
+        '''Provide the national series per age class (age classes x days) for the days after the data
+            days:           <int> number of days simulated after the last observation
+            beta_factor:    <float> change of the transmission after the last observation
+            Return a dictionary {S, E, I, hosp, rea, dc} of dataframes, rows cl_age90, one column per day
+            '''
+        sim = self.simulate(days, beta_factor)
+        return {field: df.iloc[:, self._num_days:].groupby(level='cl_age90').sum() for field, df in sim.items()}
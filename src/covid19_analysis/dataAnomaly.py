@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Anomalies of the daily increments (weekend zeros, catch-up spikes),
+# flagged with a rolling median and MAD (median absolute deviation):
+#   anomaly(t) = |x(t) - median(t)| > threshold * scale(t)
+#   scale(t) = max(1.4826 * MAD(t), sqrt(median(t)), min_mad)
+# the square root of the median is the counting (Poisson) noise, the MAD of
+# a short window of counts can be smaller than it.
+# The window of all regions is kept sorted, one (regions x window) array.
+# Each day the value leaving the window is removed and the new value
+# inserted at its sorted position, an O(window) update vectorized over
+# the regions, so the median is read in place. The MAD is the middle
+# value of the deviations below and above the median, two sorted arrays,
+# selected by a binary search in O(log window).
+#
+#   df_daily = dataQuery.QuerySession(df_ctry).query().diff().clip(0).collect()
+#   df_mask = dataAnomaly.anomaly_mask(df_daily)
+#   dataPlot.disp_daily_cases(df_ts, 'France', anomalies='hide')
+anomaly_modes = ('show', 'hide')
+
+# Ratio between the standard deviation and the MAD of a normal distribution
+_mad_scale = 1.4826
+
+
+# MAD of sorted windows, one column per row in ascending order with the median at position half
+def _sorted_mad(window_sorted, half):
+    # deviations below the median, a[x] = m - s[half - x] for x = 0..half, and above it,
+    # b[y] = s[half + 1 + y] - m for y = 0..half - 1, both ascending. The MAD is the value
+    # of rank half of their union, i values from a and half + 1 - i from b: binary search
+    # of the first i where the next value of a is not below the last value taken from b
+    num_rows = window_sorted.shape[1]
+    flat = window_sorted.ravel()
+    cols = np.arange(num_rows)
+    m = window_sorted[half]
+    lo = np.ones(num_rows, dtype=np.int64)
+    hi = np.full(num_rows, half + 1, dtype=np.int64)
+    active = lo < hi
+    while active.any():
+        i = (lo + hi) // 2
+        more = (m - flat[(half - i) * num_rows + cols]) < (flat[(2 * half + 1 - i) * num_rows + cols] - m)
+        lo = np.where(active & more, i + 1, lo)
+        hi = np.where(active & ~more, i, hi)
+        active = lo < hi
+    a_last = m - flat[(half + 1 - lo) * num_rows + cols]
+    b_last = np.where(lo <= half, flat[(2 * half + 1 - np.minimum(lo, half)) * num_rows + cols] - m, -np.inf)
+    return np.maximum(a_last, b_last)
+
+
+# Rolling median and MAD of every row
+def rolling_median_mad(values, window=15, center=True):
+    '''Provide the rolling median and MAD of every row, two arrays with the shape of values
+        values:     <array> one row per region and one column per day
+        window:     <int> odd number of days of the window
+        center:     <boolean> window centered on the day, otherwise the window ends on the day.
+                    The windows at the edges are completed by reflection of the series
+        '''
+    if window < 3 or window % 2 == 0:
+        raise ValueError('Window must be an odd number of days above 1, not %s' %(window))
+    values = np.atleast_2d(np.nan_to_num(np.asarray(values, dtype=np.float64)))
+    num_rows, num_days = values.shape
+    half = window // 2
+    pad = (half, half) if center else (window - 1, 0)
+    mode = 'reflect' if num_days > max(pad) else 'edge'
+    # days along the first axis, the regions of one day are contiguous
+    padded = np.ascontiguousarray(np.pad(values, ((0, 0), pad), mode=mode).T)
+
+    median = np.empty((num_days, num_rows))
+    mad = np.empty((num_days, num_rows))
+    pos = np.arange(window)[:, None]
+    window_sorted = np.sort(padded[:window], axis=0)
+    for t in range(num_days):
+        if t:
+            # the value leaving the window is replaced by the new one, the values in between shift by one
+            leaving, entering = padded[t - 1], padded[t + window - 1]
+            out_pos = (window_sorted < leaving).sum(axis=0)
+            in_pos = (window_sorted < entering).sum(axis=0) - (leaving < entering)
+            up = in_pos >= out_pos
+            shifted = window_sorted.copy()
+            left = up & (pos[:-1] >= out_pos) & (pos[:-1] < in_pos)
+            shifted[:-1] = np.where(left, window_sorted[1:], window_sorted[:-1])
+            right = ~up & (pos[1:] > in_pos) & (pos[1:] <= out_pos)
+            np.copyto(shifted[1:], window_sorted[:-1], where=right)
+            window_sorted = np.where(pos == in_pos, entering, shifted)
+
+        median[t] = window_sorted[half]
+        mad[t] = _sorted_mad(window_sorted, half)
+    return median.T, mad.T
+
+
+# Rolling median and anomalies of a 2d array
+def _flags(values, window, threshold, center, min_mad):
+    median, mad = rolling_median_mad(values, window, center)
+    scale = np.maximum(np.maximum(_mad_scale * mad, np.sqrt(np.abs(median))), min_mad)
+    return median, (np.abs(values - median) > threshold * scale) & ~np.isnan(values)
+
+
+# Boolean matrix of the anomalous days
+def anomaly_mask(df_daily, window=15, threshold=3.5, center=True, min_mad=1.):
+    '''Provide a boolean matrix, True on the days where the daily increment is far from the rolling median
+        df_daily:   <dataframe/Series/array> daily increments, one row per region and one column per day
+        window:     <int> odd number of days of the rolling window
+        threshold:  <float> number of robust standard deviations (1.4826 * MAD, at least the counting noise) to flag a day
+        center:     <boolean> window centered on the day, otherwise the window ends on the day
+        min_mad:    <float> lower bound of the deviation scale, avoids flagging small changes in flat series
+        The output has the type and labels of df_daily, missing values are not flagged
+        '''
+    values = np.asarray(df_daily, dtype=np.float64)
+    _, flags = _flags(np.atleast_2d(values), window, threshold, center, min_mad)
+
+    if isinstance(df_daily, pd.DataFrame):
+        return pd.DataFrame(flags, index=df_daily.index, columns=df_daily.columns)
+    if isinstance(df_daily, pd.Series):
+        return pd.Series(flags[0], index=df_daily.index, name=df_daily.name)
+    return flags.reshape(values.shape)
+
+
+# Daily increments with the anomalies replaced
+def suppress_anomalies(df_daily, window=15, threshold=3.5, center=True, min_mad=1., fill='median'):
+    '''Provide the daily increments with the anomalous days replaced, and the boolean mask of anomalies
+        df_daily:   <dataframe/Series/array> daily increments, one row per region and one column per day
+        fill:       <string> 'median' to replace by the rolling median, 'nan' to remove the values
+        Other arguments as in anomaly_mask
+        '''
+    if fill not in ('median', 'nan'):
+        raise ValueError('Not valid fill %s, options are median, nan' %(fill))
+    values = np.asarray(df_daily, dtype=np.float64)
+    values2d = np.atleast_2d(values)
+    median, flags = _flags(values2d, window, threshold, center, min_mad)
+    filled = dataPrecision.as_metric(np.where(flags, median if fill == 'median' else np.nan, values2d))
+    if isinstance(df_daily, pd.DataFrame):
+        return (pd.DataFrame(filled, index=df_daily.index, columns=df_daily.columns),
+                pd.DataFrame(flags, index=df_daily.index, columns=df_daily.columns))
+    if isinstance(df_daily, pd.Series):
+        return (pd.Series(filled[0], index=df_daily.index, name=df_daily.name),
+                pd.Series(flags[0], index=df_daily.index, name=df_daily.name))
+    return filled.reshape(values.shape), flags.reshape(values.shape)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+import json
+import lzma
+import struct
+import zlib
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Compact storage codec for cumulative (regions x days) matrices. Rows are
+# delta encoded along time (first day kept as is), deltas are zigzag mapped
+# to unsigned integers (negative corrections stay small) and packed as
+# varints, 7 bits per byte, optionally followed by zlib or lzma. Encoding
+# and decoding are vectorized over the whole matrix. Since the stored
+# values are the daily increments, decode_daily gives them back without
+# the cumulative sum and the np.diff the plotting code would do after.
+#
+#   blob = dataCodec.encode_matrix(dataFun.get_matrix_from_JHU(df_c))
+#   df_daily = dataCodec.decode_matrix(blob, daily=True)
+# datagouv long data is stored after a pivot, e.g.
+#   df_gouv.pivot(index='dep', columns='jour', values='total_cas_confirmes')
+codec_compressors = (None, 'zlib', 'lzma')
+
+_magic = b'C19V'
+_version = 1
+
+
+# Zigzag mapping, 0, -1, 1, -2, 2 ... -> 0, 1, 2, 3, 4 ...
+def _zigzag(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _unzigzag(values):
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64)
+
+
+# Pack unsigned integers as varints (LEB128)
+def varint_encode(values):
+    '''Provide the bytes of the varint (LEB128) encoding of an array of unsigned integers'''
+    values = np.ascontiguousarray(values, dtype=np.uint64).ravel()
+    # number of bytes of each value, 7 bits per byte
+    nbytes = np.ones(values.size, dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += values >= np.uint64(1 << (7 * k))
+    offsets = np.cumsum(nbytes) - nbytes
+
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max()) if values.size else 0):
+        sel = np.flatnonzero(nbytes > k)
+        byte = (values[sel] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        # continuation bit on all bytes but the last one of each value
+        byte |= np.where(nbytes[sel] > k + 1, np.uint64(0x80), np.uint64(0))
+        out[offsets[sel] + k] = byte
+    return out.tobytes()
+
+
+# Unpack varints (LEB128)
+def varint_decode(data):
+    '''Provide the array of unsigned integers (uint64) encoded by varint_encode'''
+    data = np.frombuffer(data, dtype=np.uint8)
+    if data.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+    last = (data & 0x80) == 0
+    if not last[-1]:
+        raise ValueError('Truncated varint data')
+    starts = np.flatnonzero(np.r_[True, last[:-1]])
+    # position of each byte within its value
+    pos = np.arange(data.size) - np.repeat(starts, np.diff(np.r_[starts, data.size]))
+    payload = (data & 0x7f).astype(np.uint64) << (7 * pos).astype(np.uint64)
+    # the 7 bits groups do not overlap, their sum is their bitwise or
+    return np.add.reduceat(payload, starts)
+
+
+# Encode a (regions x days) integer array
+def encode_values(values, compress='zlib'):
+    '''Provide the delta + varint encoding of a (regions x days) integer array, without header
+        values:     <array> cumulative counts, one row per region and one column per day
+        compress:   <string> general-purpose compressor applied on the varints, None, 'zlib' or 'lzma'
+        '''
+    if compress not in codec_compressors:
+        raise ValueError('Not valid compressor %s, options are %s' %(compress, ', '.join(map(str, codec_compressors))))
+    values = np.asarray(values, dtype=np.int64)
+    deltas = np.diff(values, axis=1, prepend=0)
+    data = varint_encode(_zigzag(deltas))
+    if compress == 'zlib':
+        data = zlib.compress(data, 6)
+    elif compress == 'lzma':
+        data = lzma.compress(data)
+    return data
+
+
+# Decode a (regions x days) integer array
+def decode_values(data, shape, compress='zlib', daily=False, clip=True):
+    '''Provide the (regions x days) array encoded by encode_values
+        data:       <bytes> encoded values
+        shape:      <tuple> (regions, days)
+        compress:   <string> compressor used by encode_values
+        daily:      <boolean> return the daily increments (first day set to 0) instead of the cumulative values
+        clip:       <boolean> with daily, negative increments set to 0 as in dataRepair.daily_from_cumulative
+        '''
+    if compress == 'zlib':
+        data = zlib.decompress(data)
+    elif compress == 'lzma':
+        data = lzma.decompress(data)
+    deltas = _unzigzag(varint_decode(data))
+    if deltas.size != shape[0] * shape[1]:
+        raise ValueError('Encoded data holds %d values, expected %d' %(deltas.size, shape[0] * shape[1]))
+    deltas = deltas.reshape(shape)
+
+    if daily:
+        if shape[1]:
+            deltas[:, 0] = 0
+        if clip:
+            np.clip(deltas, 0, None, out=deltas)
+        return dataPrecision.as_counts(deltas)
+    return dataPrecision.as_counts(np.cumsum(deltas, axis=1, out=deltas))
+
+
+# Encode a matrix with its labels and dates
+def encode_matrix(df_matrix, compress='zlib'):
+    '''Provide the bytes of a (regions x days) matrix: header with labels & dates, then encoded values
+        df_matrix:  <dataframe> cumulative counts, one row per region and one column per day,
+                    see dataFun.get_matrix_from_JHU
+        compress:   <string> general-purpose compressor, None, 'zlib' or 'lzma'
+        '''
+    header = {
+        'version': _version,
+        'shape': list(df_matrix.shape),
+        'compress': compress,
+        'index': [str(label) for label in df_matrix.index],
+        'index_name': df_matrix.index.name,
+        'columns': [d.strftime('%Y-%m-%d') for d in pd.DatetimeIndex(df_matrix.columns)],
+    }
+    header = json.dumps(header).encode('utf-8')
+    payload = encode_values(df_matrix.fillna(0).to_numpy(dtype=np.int64), compress)
+    return _magic + struct.pack('<I', len(header)) + header + payload
+
+
+# Decode a matrix with its labels and dates
+def decode_matrix(data, daily=False, clip=True):
+    '''Provide the dataframe encoded by encode_matrix
+        data:   <bytes> output of encode_matrix
+        daily:  <boolean> return the daily increments (first day set to 0) instead of the cumulative values
+        clip:   <boolean> with daily, negative increments set to 0
+        '''
+    if data[:4] != _magic:
+        raise ValueError('Not a covid19_analysis encoded matrix')
+    size, = struct.unpack('<I', data[4:8])
+    header = json.loads(data[8:8 + size].decode('utf-8'))
+    if header['version'] > _version:
+        raise ValueError('Encoded matrix version %d is not supported' %(header['version']))
+
+    values = decode_values(data[8 + size:], tuple(header['shape']), header['compress'], daily, clip)
+    return pd.DataFrame(values, index=pd.Index(header['index'], name=header['index_name']),
+                        columns=pd.to_datetime(header['columns']))
+
+
+# Write an encoded matrix to a file
+def write_matrix(path, df_matrix, compress='zlib'):
+    '''Write a (regions x days) matrix to a file with encode_matrix, return the number of bytes written'''
+    data = encode_matrix(df_matrix, compress)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+# Read an encoded matrix from a file
+def read_matrix(path, daily=False, clip=True):
+    '''Read a (regions x days) matrix written by write_matrix, see decode_matrix'''
+    with open(path, 'rb') as f:
+        return decode_matrix(f.read(), daily, clip)
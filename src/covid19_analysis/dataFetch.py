@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import asyncio
+import concurrent.futures
+import io
+import json
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Function library to download the datasets used along the notebooks.
+# All sources are requested concurrently over a pooled session, and
+# conditional requests (ETag / Last-Modified) avoid downloading again
+# files that did not change since the last run. When a source cannot be
+# reached, the content of its last download is used if there is one.
+
+# Define path from online repo
+repo_url = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/'
+cases_path = 'master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv'
+recov_path = 'master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_recovered_global.csv'
+death_path = 'master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv'
+cases_us_path = 'master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv'
+death_us_path = 'master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_US.csv'
+
+# Hospital data from Santé publique France on data.gouv.fr
+datagouv_url = 'https://www.data.gouv.fr/fr/datasets/r/63352e38-d353-4b54-bfd1-f1b3ee1cabd7'
+
+# Column separator per source (JHU files use the default ',')
+sources_sep = {'datagouv': ';'}
+
+# In-memory validators and contents, used when no cache directory is given
+_memory_cache = {}
+
+
+# Define the list of sources to download
+def default_sources(jhu_url=repo_url, gouv_url=datagouv_url, us_counties=False):
+    '''Provide the dictionary of sources as {name: url}, the three JHU series plus datagouv
+        jhu_url:    <string> base url of the JHU repository, change it to use a mirror or a local server
+        gouv_url:   <string> url of the datagouv hospital file
+        us_counties:<boolean> add the JHU US county series as 'cases_us' & 'death_us'
+        '''
+    sources = {
+        'cases': jhu_url + cases_path,
+        'death': jhu_url + death_path,
+        'recov': jhu_url + recov_path,
+        'datagouv': gouv_url,
+    }
+    if us_counties:
+        sources['cases_us'] = jhu_url + cases_us_path
+        sources['death_us'] = jhu_url + death_us_path
+    return sources
+
+
+# Build a http session with a connection pool and a retry policy
+def build_session(pool_size=4, retries=3, backoff=.5):
+    '''Provide a requests session sharing its connections among all downloads
+        pool_size:  <int> maximum number of connections kept open per host
+        retries:    <int> number of retries on connection errors and 429/5xx responses
+        backoff:    <float> backoff factor between retries in seconds
+        '''
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# Read the cached validators and content for one source
+def _load_cached(name, url, cache_dir):
+    if cache_dir is None:
+        return _memory_cache.get(url, (None, None))
+
+    meta_file = os.path.join(cache_dir, name + '.json')
+    data_file = os.path.join(cache_dir, name + '.data')
+    if not (os.path.isfile(meta_file) and os.path.isfile(data_file)):
+        return None, None
+    with open(meta_file, 'r') as f:
+        meta = json.load(f)
+    if meta.get('url') != url:
+        return None, None
+    with open(data_file, 'rb') as f:
+        content = f.read()
+    return meta, content
+
+
+# Store the validators and content of one source
+def _save_cached(name, url, cache_dir, meta, content):
+    if cache_dir is None:
+        _memory_cache[url] = (meta, content)
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, name + '.data'), 'wb') as f:
+        f.write(content)
+    with open(os.path.join(cache_dir, name + '.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+# Download one source, asking the server only for changes since last download
+def fetch_source(session, name, url, cache_dir=None, timeout=30, verbose=False):
+    '''Download one source using a conditional request, return the file content as bytes
+        session:    <Session> http session from build_session
+        name:       <string> name of the source, used for the cache files
+        url:        <string> url of the file
+        cache_dir:  <string> folder where contents and validators are kept, in-memory cache if None
+        timeout:    <float> timeout in seconds for each request
+        verbose:    <boolean> display message for the user about cache usage
+        If the request fails after its retries, the cached content is returned when there is one
+        '''
+    meta, content = _load_cached(name, url, cache_dir)
+
+    headers = {}
+    if meta is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        resp = session.get(url, headers=headers, timeout=timeout)
+        if resp.status_code == 304 and content is None:
+            # validators without content, download the whole file
+            resp = session.get(url, timeout=timeout)
+        if resp.status_code != 304:
+            resp.raise_for_status()
+    except requests.RequestException as err:
+        if content is None:
+            raise
+        print('Warning: %s not downloaded (%s), content of the last download is used' %(name, err))
+        return content
+
+    if resp.status_code == 304:
+        if verbose: print('%s not modified, cached content is used' %(name))
+        return content
+
+    meta = {
+        'url': url,
+        'etag': resp.headers.get('ETag'),
+        'last_modified': resp.headers.get('Last-Modified'),
+    }
+    _save_cached(name, url, cache_dir, meta, resp.content)
+    if verbose: print('%s downloaded, %d bytes' %(name, len(resp.content)))
+    return resp.content
+
+
+# Download all sources concurrently
+async def fetch_sources_async(sources, cache_dir=None, pool_size=4, retries=3, timeout=30, verbose=False):
+    '''Download all sources concurrently, return a dictionary {name: bytes}
+        sources:    <dict> {name: url} of the files to download, see default_sources
+        cache_dir:  <string> folder where contents and validators are kept, in-memory cache if None
+        pool_size:  <int> number of concurrent downloads and pooled connections
+        retries:    <int> number of retries per file
+        timeout:    <float> timeout in seconds for each request
+        verbose:    <boolean> display message for the user about downloads
+        '''
+    loop = asyncio.get_event_loop()
+    session = build_session(pool_size, retries)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=pool_size) as pool:
+            tasks = [loop.run_in_executor(pool, fetch_source, session, name, url, cache_dir, timeout, verbose)
+                     for name, url in sources.items()]
+            contents = await asyncio.gather(*tasks)
+    finally:
+        session.close()
+    return dict(zip(sources.keys(), contents))
+
+
+# Blocking call to download all sources concurrently
+def fetch_sources(sources=None, cache_dir=None, pool_size=4, retries=3, timeout=30, verbose=False):
+    '''Download all sources concurrently from a script or a notebook, return a dictionary {name: bytes}
+        sources:    <dict> {name: url} of the files to download, default_sources() by default
+        cache_dir:  <string> folder where contents and validators are kept, in-memory cache if None
+        pool_size:  <int> number of concurrent downloads and pooled connections
+        retries:    <int> number of retries per file
+        timeout:    <float> timeout in seconds for each request
+        verbose:    <boolean> display message for the user about downloads
+        '''
+    if sources is None:
+        sources = default_sources()
+    coro = fetch_sources_async(sources, cache_dir, pool_size, retries, timeout, verbose)
+    try:
+        running = asyncio.get_event_loop().is_running()
+    except RuntimeError:
+        running = False
+    if not running:
+        return _run_coroutine(coro)
+
+    # an event loop is already running (jupyter), run the download in its own thread
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_run_coroutine, coro).result()
+
+
+# Run a coroutine until complete in a new event loop (asyncio.run needs python 3.7)
+def _run_coroutine(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+# Parse downloaded bytes into a dataframe
+def read_source(content, sep=','):
+    '''Provide a dataframe from the content of a downloaded csv file
+        content:    <bytes> file content returned by fetch_sources
+        sep:        <string> column separator
+        Numeric columns follow the dataPrecision policy
+        '''
+    return dataPrecision.compact_frame(pd.read_csv(io.BytesIO(content), sep=sep))
+
+
+# Parse all downloaded sources
+def read_sources(contents):
+    '''Provide a dictionary {name: dataframe} from the output of fetch_sources
+        contents:   <dict> {name: bytes} as returned by fetch_sources
+        '''
+    return {name: read_source(content, sources_sep.get(name, ',')) for name, content in contents.items()}
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+import math
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Growth curves fitted to the last days of every region at once, and
+# short-term forecasts of the cumulative counts. Models, t in days since
+# the first day of the window:
+#   'exponential':  y(t) = A * exp(b * t),                  params log_A, rate
+#   'logistic':     y(t) = K / (1 + exp(-r * (t - t0))),    params log_K, rate, t0
+# The initial values come from a closed-form log-linear regression, then a
+# damped Gauss-Newton (Levenberg-Marquardt) refinement runs on the original
+# scale with the normal equations of all regions solved as one batch.
+# Intervals combine the parameters covariance (delta method) and the
+# residual variance of each region.
+#
+#   fit = dataForecast.fit_growth(df_ctry, 'logistic', window=21)
+#   fc = fit.forecast(days=14, region='France')
+#   dataPlot.disp_cum_jhu(ts_case, ts_recov, ts_death, 'France', forecast=fc)
+growth_models = ('exponential', 'logistic')
+_model_params = {'exponential': ('log_A', 'rate'), 'logistic': ('log_K', 'rate', 't0')}
+
+
+# Quantile of the standard normal distribution, by bisection of erf
+def _normal_quantile(p):
+    lo, hi = -10., 10.
+    for _ in range(80):
+        mid = (lo + hi) / 2
+        if 0.5 * (1 + math.erf(mid / math.sqrt(2))) < p:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+# Model values and jacobian, t is (days,) or (regions, days)
+def _model_eval(model, params, t):
+    with np.errstate(over='ignore', invalid='ignore'):
+        if model == 'exponential':
+            f = np.exp(params[:, 0:1] + params[:, 1:2] * t)
+            jac = np.stack([f, t * f], axis=-1)
+        else:
+            K = np.exp(params[:, 0:1])
+            r, t0 = params[:, 1:2], params[:, 2:3]
+            f = K / (1 + np.exp(-r * (t - t0)))
+            slope = f * (1 - f / K)
+            jac = np.stack([f, slope * (t - t0), -slope * r], axis=-1)
+    return f, jac
+
+
+# Closed-form log-linear fit of log(y) = a + b * t over the positive values
+def _loglinear(y, t):
+    mask = y > 0
+    logy = np.log(np.where(mask, y, 1.))
+    s0 = mask.sum(axis=1)
+    st, stt = (mask * t).sum(axis=1), (mask * t * t).sum(axis=1)
+    sy, sty = (mask * logy).sum(axis=1), (mask * t * logy).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b = (s0 * sty - st * sy) / (s0 * stt - st * st)
+        a = (sy - b * st) / s0
+    return a, b, mask
+
+
+# Initial parameters of a model
+def _initial_params(model, y, t):
+    a, b, mask = _loglinear(y, t)
+    if model == 'exponential':
+        return np.stack([a, b], axis=1), mask
+    # logistic: early phase as the exponential, capacity twice the last value
+    y_last = y[:, -1]
+    rate = np.maximum(np.nan_to_num(b), 0.01)
+    K = np.maximum(2 * y_last, y_last + 1)
+    t0 = t[-1] + np.log(K / np.maximum(y_last, 1) - 1) / rate
+    return np.stack([np.log(K), rate, t0], axis=1), mask
+
+
+# Batched Levenberg-Marquardt
+def _refine(model, params, y, t, valid, max_iter, tol):
+    num_regions, num_params = params.shape
+    eye = np.eye(num_params)
+    lam = np.full(num_regions, 1e-3)
+    f, jac = _model_eval(model, params, t)
+    sse = np.where(valid, ((y - f) ** 2).sum(axis=1), np.nan)
+    active = valid & np.isfinite(sse)
+    converged = np.zeros(num_regions, dtype=bool)
+
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        rows = np.flatnonzero(active)
+        J, res = jac[rows], (y - f)[rows]
+        jtj = np.einsum('rtp,rtq->rpq', J, J)
+        jtr = np.einsum('rtp,rt->rp', J, res)
+        damped = jtj + lam[rows, None, None] * (jtj * eye + 1e-12 * eye)
+        step = np.linalg.solve(damped, jtr[:, :, None])[:, :, 0]
+
+        new_params = params[rows] + step
+        new_f, new_jac = _model_eval(model, new_params, t)
+        new_sse = ((y[rows] - new_f) ** 2).sum(axis=1)
+        accept = np.isfinite(new_sse) & (new_sse <= sse[rows])
+
+        # converged when the accepted step barely changes the error
+        small = accept & (sse[rows] - new_sse <= tol * np.maximum(sse[rows], 1.))
+        acc = rows[accept]
+        params[acc], f[acc], jac[acc], sse[acc] = new_params[accept], new_f[accept], new_jac[accept], new_sse[accept]
+        lam[rows] = np.where(accept, lam[rows] / 3, lam[rows] * 4)
+
+        converged[rows[small]] = True
+        active[rows[small | (lam[rows] > 1e10)]] = False
+    return params, sse, converged
+
+
+class GrowthFit:
+    '''Result of fit_growth: parameters of the growth model of every region and forecasts
+        model:      <string> 'exponential' or 'logistic'
+        index:      <Index> region labels
+        dates:      <DatetimeIndex> days of the fitted window
+        params:     <dataframe> fitted parameters per region (NaN when the region could not be fitted)
+        rmse:       <Series> root mean square error of the fit per region
+        converged:  <Series> True when the refinement converged
+        '''
+
+    def __init__(self, model, index, dates, values, params, sse, converged, num_days):
+        self.model = model
+        self.index = index
+        self.dates = dates
+        self._values = values
+        self._params = params
+        self._dof = np.maximum(num_days - params.shape[1], 1)
+        self._sigma2 = sse / self._dof
+        self.params = pd.DataFrame(params, index=index, columns=list(_model_params[model]))
+        self.rmse = pd.Series(np.sqrt(sse / np.maximum(num_days, 1)), index=index, name='rmse')
+        self.converged = pd.Series(converged, index=index, name='converged')
+
+        # parameters covariance at the solution
+        _, jac = _model_eval(model, np.nan_to_num(params), np.arange(len(dates), dtype=float))
+        jtj = np.einsum('rtp,rtq->rpq', jac, jac)
+        cov = np.full(jtj.shape, np.nan)
+        ok = np.isfinite(params).all(axis=1) & np.isfinite(jtj).all(axis=(1, 2))
+        ok[ok] = np.abs(np.linalg.det(jtj[ok])) > 0
+        cov[ok] = np.linalg.inv(jtj[ok]) * self._sigma2[ok, None, None]
+        self._cov = cov
+
+    def fitted(self):
+        '''Provide the fitted curves over the window as a dataframe (regions x days)'''
+        f, _ = _model_eval(self.model, self._params, np.arange(len(self.dates), dtype=float))
+        return pd.DataFrame(dataPrecision.as_metric(f), index=self.index, columns=self.dates)
+
+    def forecast(self, days=7, level=0.95, region=None):
+        '''Provide the projection of the cumulative counts for the days after the window
+            days:   <int> number of days ahead
+            level:  <float> probability of the interval
+            region: <string> only this region, the output holds Series instead of dataframes
+            Return a dictionary {'mean', 'lower', 'upper'} of dataframes (regions x future days),
+            the lower bound never goes below the last observed value
+            '''
+        t = len(self.dates) - 1 + np.arange(1, days + 1, dtype=float)
+        mean, jac = _model_eval(self.model, self._params, t)
+        with np.errstate(invalid='ignore'):
+            var = np.einsum('rdp,rpq,rdq->rd', jac, self._cov, jac) + self._sigma2[:, None]
+        half = _normal_quantile(0.5 + level / 2) * np.sqrt(np.maximum(var, 0))
+        last = self._values[:, -1:]
+        lower = np.maximum(mean - half, last)
+        upper = np.maximum(mean + half, mean)
+
+        dates = self.dates[-1] + pd.to_timedelta(np.arange(1, days + 1), unit='D')
+        out = {name: pd.DataFrame(dataPrecision.as_metric(values), index=self.index, columns=dates)
+               for name, values in (('mean', mean), ('lower', lower), ('upper', upper))}
+        if region is not None:
+            out = {name: df.loc[region] for name, df in out.items()}
+        return out
+
+
+# Fit a growth model to the last days of every region
+def fit_growth(df_matrix, model='exponential', window=21, end=None, max_iter=200, tol=1e-9):
+    '''Fit a growth model to the cumulative counts of the last window days of all regions at once,
+    return a GrowthFit
+        df_matrix:  <dataframe> cumulative data, one row per region and one column per day
+        model:      <string> 'exponential' or 'logistic'
+        window:     <int> number of days fitted
+        end:        <string/datetime> last date of the window, last date of the data by default
+        max_iter:   <int> maximum number of refinement iterations
+        tol:        <float> relative decrease of the squared error below which a fit has converged
+        Regions need positive counts on at least as many days as the model has parameters plus one
+        '''
+    if model not in growth_models:
+        raise ValueError('Not valid model %s, options are %s' %(model, ', '.join(growth_models)))
+    dates = pd.DatetimeIndex(df_matrix.columns)
+    t_end = len(dates) - 1 if end is None else int(dates.searchsorted(pd.Timestamp(end), side='right')) - 1
+    if t_end < 0:
+        raise ValueError('No data before %s' %(end))
+    t_start = max(t_end - window + 1, 0)
+
+    y = df_matrix.iloc[:, t_start:t_end + 1].to_numpy(dtype=float)
+    y = np.nan_to_num(y)
+    t = np.arange(y.shape[1], dtype=float)
+    params, mask = _initial_params(model, y, t)
+    num_points = mask.sum(axis=1)
+    valid = (num_points > params.shape[1]) & np.isfinite(params).all(axis=1)
+    params[~valid] = 0.
+
+    params, sse, converged = _refine(model, params, y, t, valid, max_iter, tol)
+    params[~valid] = np.nan
+    sse[~valid] = np.nan
+    # the squared error sums over all days of the window, zero days included, so do the degrees of freedom
+    num_days = np.full(len(y), y.shape[1])
+    return GrowthFit(model, df_matrix.index, dates[t_start:t_end + 1], y, params, sse, converged & valid, num_days)
@@ -4,6 +4,11 @@ import pandas as pd
 import numpy as np
 import re
 import math
+import collections
+import hashlib
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
 
 from covid19_analysis import __version__
 
@@ -44,15 +49,87 @@ def doubling_time_equation(pop_init, num_day, grow_rate):
         new_pop = np.ceil(pop_init * math.e ** (np.array(num_day) * np.log(2) / grow_rate))
     return new_pop
 
+# Fingerprint of the content of a dataframe
+def frame_fingerprint(df):
+    '''Provide a digest (hex string) of the labels and values of a dataframe, equal digests mean equal content.
+    The numeric columns are hashed as one float64 array, the other columns as text
+        df:     <dataframe> any dataframe, e.g. the dataset read from JHU repository
+        '''
+    numeric = df.select_dtypes(include=[np.number, 'bool'])
+    other = df.columns.difference(numeric.columns, sort=False)
+    digest = hashlib.blake2b(repr(df.shape).encode('utf-8'), digest_size=16)
+    for labels in (df.index, numeric.columns, other):
+        digest.update('\x00'.join(map(str, labels)).encode('utf-8') + b'\x01')
+    if numeric.shape[1]:
+        digest.update(np.ascontiguousarray(numeric.to_numpy(dtype=np.float64)).tobytes())
+    if len(other):
+        digest.update('\x00'.join(map(str, df[other].to_numpy().ravel())).encode('utf-8'))
+    return digest.hexdigest()
+
+class ResultCache:
+    '''Memoization of results with a bounded size, the least recently used result is dropped first
+        maxsize:    <int> maximum number of results kept, 0 disables the cache
+
+        get(key, compute):  cached result of key, compute() is called and stored on a miss
+        info():             dictionary with hits, misses, size & maxsize
+        clear():            drop all results and reset the statistics
+        '''
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+        self.misses += 1
+        result = compute()
+        if self.maxsize > 0:
+            self._results[key] = result
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+        return result
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._results), 'maxsize': self.maxsize}
+
+    def clear(self):
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+
+# Results of get_timeseries_from_JHU, keyed by the fingerprint of the dataset and the arguments
+timeseries_cache = ResultCache(maxsize=256)
+
 # Provide a timeseries for a define country from JHU dataset
-def get_timeseries_from_JHU(df_jhu, country_name, mainland = True, verbose=True):
+def get_timeseries_from_JHU(df_jhu, country_name, mainland = True, verbose=True, cache=True):
     '''Provide a timeseries for a define country from JHU dataset. 
         df_jhu:         <dataframe> Dataset read from JHU repository
         country_name:   <string> Name of the country within the JHU country list
         mainland:       <boolean> Allows to choose between have only mainland data or all places data, True by default
         verbose:        <boolean> Display message for the user from data extraction
+        cache:          <boolean> Reuse the result of a previous call on the same data (see timeseries_cache),
+                        the messages of the extraction are displayed again
         '''
-    if country_name is 'all':
+    if cache:
+        key = (frame_fingerprint(df_jhu), country_name, mainland, dataPrecision.get_dtype_mode())
+        ts_country, messages = timeseries_cache.get(key, lambda: _timeseries_from_JHU(df_jhu, country_name, mainland))
+        ts_country = ts_country.copy()
+    else:
+        ts_country, messages = _timeseries_from_JHU(df_jhu, country_name, mainland)
+    if verbose:
+        for message in messages:
+            print(message)
+    return ts_country
+
+# Extract the timeseries of a country from JHU dataset, with the messages for the user
+def _timeseries_from_JHU(df_jhu, country_name, mainland):
+    messages = []
+    if country_name == 'all':
         # Calculate the sum of all cases
         temp_array = df_jhu.sum(axis=0, numeric_only=True)
         df_out = df_jhu.head(1).copy()
@@ -65,13 +142,13 @@ def get_timeseries_from_JHU(df_jhu, country_name, mainland = True, verbose=True)
         
         # check if exist more than one Province/Region
         if list_province.size > 1:
-            if verbose: print('Warning: %s has several Province/State' %(country_name))
+            messages.append('Warning: %s has several Province/State' %(country_name))
             if any(pd.isna(list_province)):
-                if verbose: print('Warning: Only mainland was taken for %s' %(country_name))
+                messages.append('Warning: Only mainland was taken for %s' %(country_name))
                 df_out = df_jhu.loc[(df_jhu['Country/Region'] == country_name) & (pd.isna(df_jhu['Province/State']))]
             
             else:
-                if verbose: print('Warning: data for %s is the sum of all Provice/State' %(country_name))
+                messages.append('Warning: data for %s is the sum of all Provice/State' %(country_name))
                 # calculate aggregate data
                 df_tmp = df_jhu.loc[df_jhu['Country/Region'] == country_name]
                 if country_name == 'US': # 'US' special case
@@ -95,8 +172,54 @@ def get_timeseries_from_JHU(df_jhu, country_name, mainland = True, verbose=True)
                 df_out[c] = temp_array[c]
 
     # get timeseries
-    ts_country = pd.Series(data=df_out.iloc[0][4:].fillna(0).values, index=pd.to_datetime(df_out.columns[4:]), dtype=int)
-    return ts_country
+    values = np.array(df_out.iloc[0][4:].fillna(0).values, dtype=np.int64)
+    ts_country = pd.Series(data=dataPrecision.as_counts(values), index=pd.to_datetime(df_out.columns[4:]))
+    return ts_country, messages
+
+# Provide the whole JHU dataset as a matrix, one row per place and one column per day
+def get_matrix_from_JHU(df_jhu):
+    '''Provide a dataframe with all the timeseries from JHU dataset, one row per Province/State and one column per day.
+        df_jhu:         <dataframe> Dataset read from JHU repository
+        Rows are labelled with the country name for mainland data and as 'Country - Province' for the other places
+        '''
+    country = df_jhu['Country/Region'].astype(str)
+    province = df_jhu['Province/State']
+    labels = country.where(pd.isna(province), country + ' - ' + province.astype(str))
+
+    values = dataPrecision.as_counts(df_jhu.iloc[:, 4:].fillna(0).to_numpy(dtype=np.int64))
+    return pd.DataFrame(values, index=pd.Index(labels.values, name='region'), columns=pd.to_datetime(df_jhu.columns[4:]))
+
+# Find for every region the first day above a threshold
+def threshold_crossing(df_matrix, threshold):
+    '''Provide an array with the position of the first day above threshold for each row, -1 if never reached
+        df_matrix:  <dataframe> cumulative data, one row per region and one column per day
+        threshold:  <int> population threshold
+        '''
+    above = df_matrix.to_numpy() > threshold
+    return np.where(above.any(axis=1), above.argmax(axis=1), -1)
+
+# Align all regions on the first day above a threshold (days since outbreak)
+def align_on_threshold(df_matrix, threshold=None, first_idx=None, num_days=None):
+    '''Provide a dataframe (regions x days since threshold) where day 0 is the first day above threshold,
+        padded with NaN after the last day of data and for regions that never reach the threshold
+        df_matrix:  <dataframe> cumulative data, one row per region and one column per day
+        threshold:  <int> population threshold
+        first_idx:  <array> day 0 position per row, used instead of threshold (see threshold_crossing)
+        num_days:   <int> number of days to keep, all days by default
+        '''
+    values = df_matrix.to_numpy(dtype=float)
+    if first_idx is None:
+        first_idx = threshold_crossing(df_matrix, threshold)
+    first_idx = np.asarray(first_idx)
+    if num_days is None:
+        num_days = values.shape[1]
+
+    # position in the original matrix of each (region, days since) cell
+    pos = first_idx[:, None] + np.arange(num_days)
+    valid = (first_idx[:, None] >= 0) & (pos < values.shape[1])
+    aligned = np.take_along_axis(values, np.where(valid, pos, 0), axis=1)
+    aligned[~valid] = np.nan
+    return pd.DataFrame(dataPrecision.as_metric(aligned), index=df_matrix.index, columns=pd.RangeIndex(num_days, name='days_since'))
 
 # Allow to select one country from the JHU dataset (merger all regions or just mainland)
 def select_country(df_all, country_name, just_mainland = True):
@@ -139,7 +262,7 @@ def mov_avg(data_set, periods=3, conv_mode = 'full'):
         conv_mode : select among 'valid', 'same', 'full'
     '''
     weights = np.ones(periods) / periods
-    return np.convolve(data_set, weights, mode=conv_mode)
+    return dataPrecision.as_metric(np.convolve(data_set, weights, mode=conv_mode))
 
 # Ancient function. Define a new dataframe from JHU dataframe by reshaping columns by rows and excluding some variables (lat & long)
 def recreate_df(raw_df):
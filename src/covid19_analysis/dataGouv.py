@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+import covid19_analysis.dataPopulation as dataPopulation
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Dense storage of the datagouv hospital data (donnees-hospitalieres-covid19,
+# columns dep, sexe, jour, hosp, rea, rad, dc). The long file holds one row
+# per department, sex (0 all, 1 men, 2 women) and day; only the sexe == 0
+# rows are kept, as one (departments x days x metrics) array. Regional and
+# national totals are computed once by one product with the department ->
+# region membership matrix (regions from dataPopulation.get_regions), so
+# the series of any department, region or of the country are slices of the
+# stored arrays.
+#
+#   tensor = dataGouv.HospitalTensor.from_csv('donnees-hospitalieres-covid19.csv')
+#   dataPlot_datagouv.disp_dep_hosp(tensor.department('75'), 'Paris')
+#   df_rea = tensor.matrix('rea', level='reg')
+hospital_metrics = ('hosp', 'rea', 'rad', 'dc')
+tensor_levels = ('dep', 'reg', 'nat')
+
+
+# Department codes as strings, '1' & 1 -> '01', '2A' kept
+def dep_codes(codes):
+    '''Provide the department codes as strings of at least two characters'''
+    return pd.Index([str(c).strip().zfill(2) for c in codes])
+
+
+class HospitalTensor:
+    '''Dense (departments x days x metrics) array of the datagouv hospital data, with regional and national totals
+        df_gouv:    <dataframe> datagouv hospital data, columns dep, jour, the metrics and optionally sexe
+                    (only the sexe == 0 rows are used)
+        metrics:    <list> columns stored, by default the hospital_metrics present in df_gouv
+
+        deps, regs, dates:              department codes, region codes & days of the arrays
+        values, reg_values, nat_values: (deps x days x metrics), (regs x days x metrics) & (days x metrics) arrays
+        dep_reg:                        position in regs of the region of every department
+        reported:                       (deps x days) True where the file has a row, days without row are 0
+        department(code), region(code), nation():   dataframe (days x metrics) with a jour column
+        matrix(metric, level):                      dataframe (codes x days) of one metric
+        '''
+
+    def __init__(self, df_gouv, metrics=None):
+        if 'sexe' in df_gouv.columns:
+            df_gouv = df_gouv[df_gouv['sexe'] == 0]
+        if metrics is None:
+            metrics = [m for m in hospital_metrics if m in df_gouv.columns]
+        missing = [m for m in metrics if m not in df_gouv.columns]
+        if missing:
+            raise KeyError('Metrics not found in the data: %s' %(', '.join(missing)))
+        self.metrics = tuple(metrics)
+
+        deps = dep_codes(df_gouv['dep'])
+        jours = pd.to_datetime(df_gouv['jour'])
+        dep_pos, self.deps = pd.factorize(deps, sort=True)
+        self.deps.name = 'dep'
+        self.dates = pd.date_range(jours.min(), jours.max(), name='jour') if len(df_gouv) else pd.DatetimeIndex([], name='jour')
+        day_pos = self.dates.get_indexer(jours)
+
+        cells = dep_pos * len(self.dates) + day_pos
+        if len(np.unique(cells)) != len(cells):
+            raise ValueError('Several rows for the same department and day, sexe or age classes not filtered')
+        values = np.zeros((len(self.deps), len(self.dates), len(self.metrics)), dtype=np.int64)
+        values[dep_pos, day_pos] = df_gouv[list(self.metrics)].fillna(0).to_numpy(dtype=np.int64)
+        self.values = dataPrecision.as_counts(values)
+        self.reported = np.zeros((len(self.deps), len(self.dates)), dtype=bool)
+        self.reported[dep_pos, day_pos] = True
+
+        # department -> region membership, one product for all regional totals
+        dep_regions = dataPopulation.get_regions()
+        regions = [dep_regions.get(d) for d in self.deps]
+        unknown = [d for d, r in zip(self.deps, regions) if r is None]
+        if unknown:
+            print('Warning: no region for departments %s, kept as their own region' %(', '.join(unknown)))
+        regions = [r if r is not None else 'dep ' + d for r, d in zip(regions, self.deps)]
+        self.dep_reg, self.regs = pd.factorize(pd.Index(regions), sort=True)
+        self.regs.name = 'reg'
+        weights = np.zeros((len(self.regs), len(self.deps)))
+        weights[self.dep_reg, np.arange(len(self.deps))] = 1
+        flat = values.reshape(len(self.deps), -1)
+        # integer counts are exact in float64 up to 2**53
+        self.reg_values = dataPrecision.as_counts(np.rint(weights @ flat).astype(np.int64).reshape((len(self.regs),) + values.shape[1:]))
+        self.nat_values = dataPrecision.as_counts(values.sum(axis=0))
+
+        self._dep_pos = {d: k for k, d in enumerate(self.deps)}
+        self._reg_pos = {r: k for k, r in enumerate(self.regs)}
+
+    @classmethod
+    def from_csv(cls, path, metrics=None):
+        '''Read a datagouv hospital file (';' separated) and build its tensor'''
+        return cls(pd.read_csv(path, sep=';', dtype={'dep': str}), metrics)
+
+    # Series of one block (days x metrics) as a dataframe with a jour column
+    def _frame(self, block):
+        df = pd.DataFrame(block, index=self.dates, columns=list(self.metrics))
+        df.insert(0, 'jour', self.dates)
+        return df
+
+    def department(self, code):
+        '''Provide the series of one department (code as '75', 75 or '2A'), dataframe days x (jour, metrics)'''
+        return self._frame(self.values[self._dep_pos[dep_codes([code])[0]]])
+
+    def region(self, code):
+        '''Provide the series of one region (code as '11' or 11), dataframe days x (jour, metrics)'''
+        return self._frame(self.reg_values[self._reg_pos[str(code).zfill(2)]])
+
+    def nation(self):
+        '''Provide the national series, dataframe days x (jour, metrics)'''
+        return self._frame(self.nat_values)
+
+    def matrix(self, metric='hosp', level='dep'):
+        '''Provide a dataframe with one row per department (or region) and one column per day
+            metric:     <string> one of the stored metrics
+            level:      <string> 'dep', 'reg' or 'nat' (one row 'France')
+            '''
+        if level not in tensor_levels:
+            raise ValueError('Not valid level %s, options are %s' %(level, ', '.join(tensor_levels)))
+        k = self.metrics.index(metric)
+        if level == 'dep':
+            return pd.DataFrame(self.values[:, :, k], index=self.deps, columns=self.dates)
+        if level == 'reg':
+            return pd.DataFrame(self.reg_values[:, :, k], index=self.regs, columns=self.dates)
+        return pd.DataFrame(self.nat_values[None, :, k], index=pd.Index(['France'], name='nat'), columns=self.dates)
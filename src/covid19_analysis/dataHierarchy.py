@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataFun as dataFun
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Precomputed aggregates of the JHU dataset: Province/State -> country
+# (mainland and total) -> world. All aggregates are computed together as
+# one product between a membership matrix and the (places x days) data,
+# so lookups are only row selections. The mainland rules are the same as
+# in dataFun.get_timeseries_from_JHU. cached_index shares one index per
+# dataset content between the plotting functions.
+
+
+class HierarchyIndex:
+    '''Index of the JHU dataset with all country and world aggregates computed once
+        df_jhu:     <dataframe> Dataset read from JHU repository
+
+        country(name, mainland=True):   timeseries of a country, as dataFun.get_timeseries_from_JHU
+        province(name, province=None):  timeseries of one Province/State row
+        world():                        timeseries of the sum of all places
+        matrix(ctry_list, mainland):    dataframe (countries x days) for several countries
+        update(df_jhu):                 refresh the aggregates with a new version of the dataset
+        '''
+
+    def __init__(self, df_jhu):
+        self._build(df_jhu)
+
+    # Compute the membership matrix and all the aggregates
+    def _build(self, df_jhu):
+        country = df_jhu['Country/Region'].astype(str)
+        province = df_jhu['Province/State']
+        codes, self.countries = pd.factorize(country)
+        num_places, num_ctry = len(df_jhu), len(self.countries)
+
+        self.dates = pd.to_datetime(df_jhu.columns[4:])
+        self._keys = list(zip(country, province.fillna('')))
+        self._places = {key: pos for pos, key in enumerate(self._keys)}
+        self._values = dataPrecision.as_counts(df_jhu.iloc[:, 4:].fillna(0).to_numpy(dtype=np.int64))
+
+        # mainland rows: the only row, else the row without Province/State,
+        # else all the provinces (US counties 'County, ST' excluded)
+        no_prov = pd.isna(province).to_numpy()
+        groups = pd.DataFrame({'code': codes, 'no_prov': no_prov}).groupby('code')['no_prov']
+        num_rows = groups.transform('size').to_numpy()
+        has_main = groups.transform('any').to_numpy()
+        us_county = ((country == 'US') & province.fillna('').str.contains(', ', regex=False)).to_numpy()
+        mainland = (num_rows == 1) | (has_main & no_prov) | (~has_main & ~us_county)
+
+        # membership: countries total, countries mainland, world
+        places = np.arange(num_places)
+        weights = np.zeros((2 * num_ctry + 1, num_places))
+        weights[codes, places] = 1
+        weights[num_ctry + codes[mainland], places[mainland]] = 1
+        weights[-1] = 1
+        self._weights = weights
+        self._aggregates = self._reduce(self._values)
+
+    # Grouped sums of the places for some days, one matrix product
+    def _reduce(self, values):
+        # integer counts are exact in float64 up to 2**53
+        return dataPrecision.as_counts(np.rint(self._weights @ values).astype(np.int64))
+
+    # Provide a row of the aggregates as a timeseries
+    def _series(self, row):
+        return pd.Series(data=row, index=self.dates)
+
+    def country(self, country_name, mainland=True):
+        '''Provide the timeseries of a country
+            country_name:   <string> Name of the country within the JHU country list, 'all' for the world
+            mainland:       <boolean> only mainland data (True) or the sum of all places
+            '''
+        if country_name == 'all':
+            return self.world()
+        code = self.countries.get_loc(country_name)
+        if mainland:
+            code += len(self.countries)
+        return self._series(self._aggregates[code])
+
+    def province(self, country_name, province_name=None):
+        '''Provide the timeseries of one Province/State, None for the row without Province/State'''
+        pos = self._places[(country_name, '' if province_name is None else province_name)]
+        return self._series(self._values[pos])
+
+    def world(self):
+        '''Provide the timeseries of the sum of all places'''
+        return self._series(self._aggregates[-1])
+
+    def matrix(self, ctry_list=None, mainland=True):
+        '''Provide a dataframe with one row per country and one column per day
+            ctry_list:  <list> string list with countries, all countries if None. 'all' gives a row
+                        with the sum of all places, as country('all')
+            mainland:   <boolean> only mainland data (True) or the sum of all places
+            '''
+        if ctry_list is None:
+            ctry_list = list(self.countries)
+        codes = self.countries.get_indexer(ctry_list)
+        world = np.array([c == 'all' for c in ctry_list], dtype=bool)
+        if ((codes < 0) & ~world).any():
+            missing = [c for c, code, w in zip(ctry_list, codes, world) if code < 0 and not w]
+            raise KeyError('Countries not found in the data: %s' %(', '.join(missing)))
+        if mainland:
+            codes = codes + len(self.countries)
+        codes = np.where(world, len(self._aggregates) - 1, codes)
+        return pd.DataFrame(self._aggregates[codes], index=pd.Index(ctry_list, name='country'), columns=self.dates)
+
+    def update(self, df_jhu):
+        '''Refresh the index with a new version of the dataset. Only the days with changed values and
+        the new days are reduced again, the index is rebuilt if places were added or removed.
+            df_jhu:     <dataframe> Dataset read from JHU repository
+            Return the number of days reduced again
+            '''
+        keys = list(zip(df_jhu['Country/Region'].astype(str), df_jhu['Province/State'].fillna('')))
+        new_dates = pd.to_datetime(df_jhu.columns[4:])
+        num_days = len(self.dates)
+        if keys != self._keys or not new_dates[:num_days].equals(self.dates):
+            self._build(df_jhu)
+            return len(self.dates)
+
+        values = dataPrecision.as_counts(df_jhu.iloc[:, 4:].fillna(0).to_numpy(dtype=np.int64))
+        changed = np.flatnonzero((values[:, :num_days] != self._values).any(axis=0))
+        if changed.size:
+            reduced = self._reduce(values[:, changed])
+            # revised counts may need a wider storage type
+            self._aggregates = self._aggregates.astype(np.result_type(self._aggregates, reduced), copy=False)
+            self._aggregates[:, changed] = reduced
+        if len(new_dates) > num_days:
+            self._aggregates = np.hstack([self._aggregates, self._reduce(values[:, num_days:])])
+
+        self._values = values
+        self.dates = new_dates
+        return changed.size + len(new_dates) - num_days
+
+
+# Indexes of the datasets already seen, keyed by their fingerprint
+index_cache = dataFun.ResultCache(maxsize=8)
+
+
+# Shared index of a dataset
+def cached_index(df_jhu):
+    '''Provide the HierarchyIndex of a dataset, built only once for a given content (see dataFun.frame_fingerprint).
+    The index is shared between the callers, its update method must not be called
+        df_jhu:     <dataframe> Dataset read from JHU repository
+        '''
+    key = (dataFun.frame_fingerprint(df_jhu), dataPrecision.get_dtype_mode())
+    return index_cache.get(key, lambda: HierarchyIndex(df_jhu))
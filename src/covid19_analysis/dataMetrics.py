@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Function library for the metrics derived from cumulative counts
+# (daily cases, rolling mean, growth ratio & doubling time), computed
+# for all regions of a (regions x days) matrix at once. The engine keeps
+# the running state per region, so adding a new day only costs one
+# update per region instead of a recomputation of the whole history.
+# Outputs are stored following the dataPrecision policy (int32/float32 in
+# 'compact' mode), the running sums stay int64.
+
+
+# Calculate all derived metrics over the full history
+def compute_metrics(cum_values, window=7):
+    '''Full recomputation of the derived metrics, return a dictionary of (regions x days) arrays
+        cum_values: <array> cumulative counts, one row per region and one column per day
+        window:     <int> number of days of the rolling mean and of the doubling time
+        Output keys:
+            'daily':    daily increments, negative corrections set to 0, first day set to 0
+            'rolling':  trailing rolling mean of the daily increments over window days
+            'growth':   ratio between consecutive days cumulative counts (0 when undefined)
+            'doubling': doubling time in days over the last window days (NaN without growth)
+        '''
+    cum = np.asarray(cum_values, dtype=np.int64)
+    num_days = cum.shape[1]
+
+    daily = np.zeros_like(cum)
+    daily[:, 1:] = np.diff(cum, axis=1).clip(0)
+
+    # rolling sums from the cumulative sum of the daily cases
+    csum = np.cumsum(daily, axis=1)
+    roll_sum = csum.copy()
+    roll_sum[:, window:] -= csum[:, :-window]
+    count = np.minimum(np.arange(1, num_days + 1), window)
+    rolling = roll_sum / count
+
+    growth = np.zeros(cum.shape)
+    growth[:, 1:] = _growth_ratio(cum[:, 1:], cum[:, :-1])
+
+    # doubling time against the value window days before (or the first day)
+    lag = np.minimum(np.arange(num_days), window)
+    doubling = _doubling_time(cum, cum[:, np.arange(num_days) - lag], lag)
+
+    return {'daily': dataPrecision.as_counts(daily), 'rolling': dataPrecision.as_metric(rolling),
+            'growth': dataPrecision.as_metric(growth), 'doubling': dataPrecision.as_metric(doubling)}
+
+
+# Growth ratio between two days, zero if the previous day is zero
+def _growth_ratio(cum_now, cum_prev):
+    prev = np.where(cum_prev == 0, 1, cum_prev)
+    return np.where(cum_prev == 0, 0., cum_now / prev)
+
+
+# Doubling time given the counts lag days before, NaN if no growth
+def _doubling_time(cum_now, cum_prev, lag):
+    valid = (cum_prev > 0) & (cum_now > cum_prev)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(valid, cum_now / np.where(valid, cum_prev, 1), 2.)
+        doubling = lag * np.log(2) / np.log(ratio)
+    return np.where(valid, doubling, np.nan)
+
+
+class MetricsEngine:
+    '''Stateful engine for the derived metrics of a (regions x days) cumulative matrix
+        df_matrix:  <dataframe> cumulative counts, one row per region and one column per day,
+                    see dataFun.get_matrix_from_JHU
+        window:     <int> number of days of the rolling mean and of the doubling time
+        check:      <boolean> test mode, every update is compared to a full recomputation
+
+    New days are added with append (one day) or update (all new columns of a refreshed matrix).
+    Only the running sums and the last window days are used, so each day costs O(regions).
+    Revised past values are not taken into account, build a new engine in that case.
+    '''
+
+    def __init__(self, df_matrix, window=7, check=False):
+        self.window = window
+        self.check = check
+        self.index = df_matrix.index
+        self._dates = list(df_matrix.columns)
+
+        values = df_matrix.to_numpy(dtype=np.int64)
+        num_regions, num_days = values.shape
+        self._count_dtype = dataPrecision.count_dtype(values)
+        self._metric_dtype = dataPrecision.metric_dtype()
+        self._size = 0
+        self._alloc(num_regions, max(2 * num_days, 16))
+        self._size = num_days
+
+        metrics = compute_metrics(values, window)
+        self._cum[:, :num_days] = values
+        for key in ('daily', 'rolling', 'growth', 'doubling'):
+            self._arrays[key][:, :num_days] = metrics[key]
+        # running sum of the daily cases within the last window days
+        self._roll_sum = metrics['daily'][:, max(0, num_days - window):].sum(axis=1, dtype=np.int64)
+
+    # Allocate storage, extra columns avoid a copy for every new day
+    def _alloc(self, num_regions, capacity):
+        old_size = self._size
+        cum = np.zeros((num_regions, capacity), dtype=self._count_dtype)
+        arrays = {
+            'daily': np.zeros((num_regions, capacity), dtype=self._count_dtype),
+            'rolling': np.zeros((num_regions, capacity), dtype=self._metric_dtype),
+            'growth': np.zeros((num_regions, capacity), dtype=self._metric_dtype),
+            'doubling': np.full((num_regions, capacity), np.nan, dtype=self._metric_dtype),
+        }
+        if old_size:
+            cum[:, :old_size] = self._cum[:, :old_size]
+            for key in arrays:
+                arrays[key][:, :old_size] = self._arrays[key][:, :old_size]
+        self._cum = cum
+        self._arrays = arrays
+
+    # Add one day of cumulative counts
+    def append(self, date, values):
+        '''Add a new day to the engine and update all derived metrics
+            date:   <datetime> date of the new column, must be after the last date
+            values: <array/Series> cumulative counts per region (a Series is aligned on region labels)
+            '''
+        if self._dates and pd.Timestamp(date) <= pd.Timestamp(self._dates[-1]):
+            raise ValueError('Date %s is not after the last date of the engine' %(date))
+        if isinstance(values, pd.Series):
+            values = values.reindex(self.index).fillna(0).to_numpy()
+        values = np.asarray(values, dtype=np.int64)
+        if values.shape != (len(self.index),):
+            raise ValueError('Expected %d values, one per region' %(len(self.index)))
+
+        t = self._size
+        if dataPrecision.count_dtype(values).itemsize > self._count_dtype.itemsize:
+            # counts outgrow the storage type, widen it
+            self._count_dtype = dataPrecision.count_dtype(values)
+            self._alloc(len(self.index), self._cum.shape[1])
+        if t == self._cum.shape[1]:
+            self._alloc(len(self.index), 2 * t)
+        win = self.window
+        cum, daily = self._cum, self._arrays['daily']
+
+        cum[:, t] = values
+        if t == 0:
+            daily[:, t] = 0
+            self._arrays['growth'][:, t] = 0
+        else:
+            daily[:, t] = (values - cum[:, t - 1]).clip(0)
+            self._arrays['growth'][:, t] = _growth_ratio(values, cum[:, t - 1])
+
+        # update running sum: add the new day, drop the day leaving the window
+        self._roll_sum += daily[:, t]
+        if t >= win:
+            self._roll_sum -= daily[:, t - win]
+        self._arrays['rolling'][:, t] = self._roll_sum / min(t + 1, win)
+
+        lag = min(t, win)
+        self._arrays['doubling'][:, t] = _doubling_time(values, cum[:, t - lag], lag)
+
+        self._dates.append(pd.Timestamp(date))
+        self._size += 1
+
+        if self.check:
+            self.verify()
+
+    # Add all new days from a refreshed matrix
+    def update(self, df_matrix):
+        '''Add to the engine all the columns of df_matrix dated after the last date of the engine
+            df_matrix:  <dataframe> refreshed cumulative matrix with the same regions
+            '''
+        df_new = df_matrix.reindex(self.index).fillna(0)
+        if self._dates:
+            df_new = df_new.loc[:, df_new.columns > self._dates[-1]]
+        for date in df_new.columns:
+            self.append(date, df_new[date].to_numpy())
+
+    # Compare the engine state with a full recomputation
+    def verify(self):
+        '''Test mode: recompute all metrics from the cumulative counts and check they are identical'''
+        metrics = compute_metrics(self._cum[:, :self._size], self.window)
+        for key, values in metrics.items():
+            stored = self._arrays[key][:, :self._size]
+            values = values.astype(stored.dtype)
+            # NaN compared equal to NaN (no equal_nan option in numpy 1.18)
+            if values.shape != stored.shape or not ((values == stored) | (np.isnan(values) & np.isnan(stored))).all():
+                raise AssertionError('Incremental %s differs from the full recomputation' %(key))
+        return True
+
+    # Output the metric as a (regions x days) dataframe
+    def _frame(self, values):
+        return pd.DataFrame(values[:, :self._size], index=self.index, columns=pd.DatetimeIndex(self._dates))
+
+    @property
+    def cumulative(self):
+        '''<dataframe> cumulative counts'''
+        return self._frame(self._cum)
+
+    @property
+    def daily(self):
+        '''<dataframe> daily increments, negative corrections set to 0'''
+        return self._frame(self._arrays['daily'])
+
+    @property
+    def rolling(self):
+        '''<dataframe> trailing rolling mean of the daily increments'''
+        return self._frame(self._arrays['rolling'])
+
+    @property
+    def growth(self):
+        '''<dataframe> growth ratio between consecutive days'''
+        return self._frame(self._arrays['growth'])
+
+    @property
+    def doubling(self):
+        '''<dataframe> doubling time in days over the last window days'''
+        return self._frame(self._arrays['doubling'])
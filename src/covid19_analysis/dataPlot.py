@@ -2,12 +2,19 @@
 
 import pandas as pd
 import numpy as np
-import plotly
 import datetime
 import math
 
 # import local functions
+import covid19_analysis.dataAnomaly as dataAnomaly
 import covid19_analysis.dataFun as dataFun
+from covid19_analysis._lazy import LazyModule
+import covid19_analysis.dataHierarchy as dataHierarchy
+import covid19_analysis.dataPrecision as dataPrecision
+import covid19_analysis.dataQuery as dataQuery
+import covid19_analysis.dataRates as dataRates
+import covid19_analysis.dataRepair as dataRepair
+import covid19_analysis.dataSeasonal as dataSeasonal
 #import covid19_analysis.dataPlot as dataPlot
 
 
@@ -17,42 +24,52 @@ __author__ = "J SAYRITUPAC"
 __copyright__ = "J SAYRITUPAC"
 __license__ = "mit"
 
+# plotly is only imported when the first figure is built
+plotly = LazyModule('plotly', ('plotly.graph_objs', 'plotly.subplots'))
+
 
 # Report daily cases evolution for last three months
-def last_daily_cases(df_data, ctry_list, num_days=3*31, rolling_win=True, df_type='cases'):
+def last_daily_cases(df_data, ctry_list, num_days=3*31, rolling_win=True, df_type='cases', repair=None, weekday_adjust=False, center=True, base=None, show=True):
     '''Display countries last days daily cases trend
         df_data:    <dataframe> contain all countries daily data
         ctry_list:  <list> string list with countries to display
         num_days:   <int> set the number of days to display rolling back from the last day
-        rolling_win:<boolean> set weakly rolling window with center on the day
+        rolling_win:<boolean> set weakly rolling window
         df_type:    <string> define the type of data displayed, optiones are 'cases', 'recover' & 'fatalities'
+        repair:     <string> spread negative daily cases over earlier days ('backfill' or 'proportional'), clipped if None
+        weekday_adjust:<boolean> remove the day-of-week reporting cycle of every country (see dataSeasonal)
+        center:     <boolean> rolling window centered on the day, otherwise ending on the day. A new day changes
+                    the last centered means, use center=False for figures updated with base
+        base:       <figure> figure already displayed, (figure, update from base) is returned instead (see figure_patch)
+        show:       <boolean> display the figure, the figure is returned in all cases
     '''
 
     # define graph object
     fig = plotly.graph_objs.Figure()
 
-    # Loop per country, display daily evolution for last three months
-    for c in ctry_list:
-        ts_c = dataFun.get_timeseries_from_JHU(df_data, c, verbose=False)
-        
-        # calculate daily cases (set to 0 if no cases)
-        data_temp = np.array(ts_c[1:], dtype=int)  - np.array(ts_c[:-1], dtype=int)
-        ts_c_daily = pd.Series(data_temp, index=ts_c.index[1:]).clip(0)
-        
-        if rolling_win:
-            # moving average, 7 days centered in day
-            ts_c_daily = ts_c_daily.rolling(7, min_periods=1, center=True).mean()
-        
+    # Daily cases for all countries (set to 0 if no cases) as one query
+    df_ctry = dataHierarchy.cached_index(df_data).matrix(ctry_list)
+    if repair is not None:
+        df_ctry, _ = dataRepair.repair_cumulative(df_ctry, repair)
+    query = dataQuery.QuerySession(df_ctry).query().diff().clip(0)
+    if weekday_adjust:
+        # weekday factors fitted on the whole history of every country
+        df_adjusted = dataSeasonal.weekly_decomposition(query.collect())['adjusted']
+        query = dataQuery.QuerySession(df_adjusted).query()
+    if rolling_win:
+        # moving average, 7 days centered in day or ending on the day
+        query = query.rolling(7, center=center)
+    # keep a define time interval
+    df_daily = query.window(num_days=num_days).collect()
 
-        # Plot graph for a define time interval
-        mask = (ts_c_daily.index >= (ts_c_daily.index[-1] - pd.Timedelta(num_days, unit='days')))
-        
+    # Loop per country, display daily evolution for last three months
+    for c in df_daily.index:
         fig.add_trace(
             plotly.graph_objs.Scatter(
                 mode = 'lines',
                 name = c,
-                x = ts_c_daily.index[mask],
-                y = ts_c_daily[mask],
+                x = df_daily.columns,
+                y = df_daily.loc[c],
                 line=dict(width = 1.5),
             )
         )
@@ -66,16 +83,22 @@ def last_daily_cases(df_data, ctry_list, num_days=3*31, rolling_win=True, df_typ
     )
 
     fig.update_yaxes(showgrid=True, gridwidth=.3, gridcolor='gainsboro')
-    fig.show()
+    if base is not None:
+        return fig, figure_patch(fig, base)
+    if show:
+        fig.show()
+    return fig
 
 
 # Report growth rates over time
-def growth_rates(data_ts, label = 'Cases ', trend_line = False, y_range = [1, 1.07], Percentage=True):
-    '''Display growth rates over time for cases/cures/fatalities for one dataset array'''
+def growth_rates(data_ts, label = 'Cases ', trend_line = False, y_range = [1, 1.07], Percentage=True, show=True):
+    '''Display growth rates over time for cases/cures/fatalities for one dataset array
+        show:       <boolean> display the figure, the figure is returned in all cases
+        '''
     # fill nan values with previous values
-    data_tmp = data_ts.fillna(method='bfill')
+    data_tmp = data_ts.bfill()
     # calculate growth rates
-    data_tmp = np.array(data_tmp, dtype=int)
+    data_tmp = dataPrecision.as_counts(np.array(data_tmp, dtype=np.int64))
     if Percentage:  # display results as a growing percentage
         growth_ratio = 100 * (dataFun.safe_div(data_tmp[1:], data_tmp[:-1]) -1)
     else:
@@ -118,12 +141,13 @@ def growth_rates(data_ts, label = 'Cases ', trend_line = False, y_range = [1, 1.
     else:
         fig.update_yaxes(range=y_range)
 
-    fig.show()
+    if show:
+        fig.show()
     return fig
 
 
 # Plot countries growing ratio and doubling time chars
-def growing_ratio_countries(df_data, ctry_list, pop_th=100, num_days=37, df_source='JHU', day_filter = np.nan, clear_pop = False ):
+def growing_ratio_countries(df_data, ctry_list, pop_th=100, num_days=37, df_source='JHU', day_filter = np.nan, clear_pop = False, show=True):
     '''Display countries cases over time compare to standards doubling-time ratios
         df_data:    <dataframe> contain all countries daily data
         ctry_list:  <list> string list with countries to display
@@ -132,6 +156,7 @@ def growing_ratio_countries(df_data, ctry_list, pop_th=100, num_days=37, df_sour
         df_source:  <str> set the dataframe data source, options are: 'JHU' (default), 'SPF', 'raw_data'
         day_filter: <str> define a date string as a time filter, no filter as default
         clear_pop:  <bool> substract population from first day, useful if counting from a different day from first outbreak
+        show:       <boolean> display the figure, the figure is returned in all cases
         
     Graph inspired on the work or Lisa Charlotte ROST, designer & blogger at Datawrapper (March 2020)
     https://lisacharlotterost.de/
@@ -143,27 +168,27 @@ def growing_ratio_countries(df_data, ctry_list, pop_th=100, num_days=37, df_sour
 
     # Extract timeseries & add trace to figure
     if df_source == 'JHU':
-        max_cases = 1
-        for country_name in ctry_list:    
-            ts_country = dataFun.get_timeseries_from_JHU(df_data, country_name)
+        df_ctry = dataHierarchy.cached_index(df_data).matrix(ctry_list)
 
-            # post first-outbreak filters
-            if not pd.isna(day_filter):    # a time filter is included
-                ts_country = ts_country[ts_country.index >= day_filter]
-
-                if clear_pop:   # substract first date population
-                    ts_country -= ts_country[0]
+        # post first-outbreak filters
+        if not pd.isna(day_filter):    # a time filter is included
+            df_ctry = df_ctry.loc[:, df_ctry.columns >= day_filter]
 
+            if clear_pop:   # substract first date population
+                df_ctry = df_ctry.sub(df_ctry.iloc[:, 0], axis=0)
 
-            if max_cases < np.max(ts_country):
-                max_cases = np.max(ts_country)
+        max_cases = max(1, df_ctry.to_numpy().max())
 
+        # align all countries on their first day above the threshold
+        df_aligned = dataFun.align_on_threshold(df_ctry, pop_th*.5)
+        for country_name, ts_days in df_aligned.iterrows():
+            ts_days = ts_days.dropna()
             fig_gr.add_trace(
             plotly.graph_objs.Scatter(
                 mode = 'lines',
                 #mode = 'lines+markers',
-                x = np.array(range(0, ts_country[ts_country > pop_th*.5].size)),
-                y = ts_country[ts_country > pop_th*.5],
+                x = ts_days.index,
+                y = ts_days,
                 name = country_name
             ))
 
@@ -190,40 +215,30 @@ def growing_ratio_countries(df_data, ctry_list, pop_th=100, num_days=37, df_sour
             ))
 
     elif df_source == 'SPF':
-        ts_cases = pd.Series(data=df_data.cas_confirmes.fillna(0).values, index=df_data.date)
-        ts_ftlts = pd.Series(data=df_data.deces.fillna(0).values, index=df_data.date)
-        
+        df_fr = pd.DataFrame([df_data.cas_confirmes.fillna(0).to_numpy(), df_data.deces.fillna(0).to_numpy()],
+                             index=['Cases', 'Fatalities'], columns=pd.Index(df_data.date))
+
         # post first-outbreak filters
         if not pd.isna(day_filter):    # a time filter is included
-                ts_cases[ts_cases.index >= day_filter]
-                ts_ftlts[ts_ftlts.index >= day_filter]
-
-                if clear_pop:   # substract first date population
-                    ts_cases = ts_cases - ts_country[0]
-                    ts_ftlts = ts_ftlts - ts_country[0]  
+            df_fr = df_fr.loc[:, df_fr.columns >= day_filter]
 
+            if clear_pop:   # substract first date population
+                df_fr = df_fr.sub(df_fr.iloc[:, 0], axis=0)
 
-        t_idx = ts_cases > pop_th
-        # trace french cases
-        fig_gr.add_trace(
-            plotly.graph_objs.Scatter(
-                #mode = 'lines',
-                mode = 'lines+markers',
-                x = np.array(range(0, ts_cases[t_idx].size)),
-                y = ts_cases[t_idx],
-                name = 'Cases',
-                line=dict(color='CornflowerBlue'),
-                #marker=dict(color='CornflowerBlue')
-            ))
-        # trace french fatalities
-        fig_gr.add_trace(
+        # align cases & fatalities on the first day of cases above the threshold
+        first_idx = dataFun.threshold_crossing(df_fr.loc[['Cases']], pop_th)
+        df_aligned = dataFun.align_on_threshold(df_fr, first_idx=np.repeat(first_idx, 2))
+        colors = {'Cases': 'CornflowerBlue', 'Fatalities': 'Black'}
+        for name, ts_days in df_aligned.iterrows():
+            ts_days = ts_days.dropna()
+            fig_gr.add_trace(
             plotly.graph_objs.Scatter(
                 #mode = 'lines',
                 mode = 'lines+markers',
-                x = np.array(range(0, ts_ftlts[t_idx].size)),
-                y = ts_ftlts[t_idx],
-                name = 'Fatalities',
-                line=dict(color='Black'),
+                x = ts_days.index,
+                y = ts_days,
+                name = name,
+                line=dict(color=colors[name]),
             ))
         # set graph extra details
         fig_gr.update_layout(
@@ -231,11 +246,13 @@ def growing_ratio_countries(df_data, ctry_list, pop_th=100, num_days=37, df_sour
             title_x = .5
         )
 
-    fig_gr.show()
+    if show:
+        fig_gr.show()
+    return fig_gr
 
 
 # Plot countries growing ratio and doubling time chars
-def growing_ratio_country(df_data, pop_th=100, num_days=90, df_source=None, date_filter = None, clear_pop = False ):
+def growing_ratio_country(df_data, pop_th=100, num_days=90, df_source=None, date_filter = None, clear_pop = False, show=True):
     '''Display countries cases over time compare to standards doubling-time ratios
         df_data:    <dataframe> contain all countries daily data
         pop_th:     <int> population threshold, allows to set chart starting point
@@ -243,6 +260,7 @@ def growing_ratio_country(df_data, pop_th=100, num_days=90, df_source=None, date
         df_source:  <str> set the dataframe data source, options are: 'JHU' (default), 'SPF', 'raw_data'
         date_filter:<str> define a date string as a time filter, default: no filter (None)
         clear_pop:  <bool> substract population from first day, useful if counting from a different day from first outbreak
+        show:       <boolean> display the figure, the figure is returned in all cases
         
     Graph inspired on the work or Lisa Charlotte ROST, designer & blogger at Datawrapper (March 2020)
     https://lisacharlotterost.de/
@@ -271,14 +289,18 @@ def growing_ratio_country(df_data, pop_th=100, num_days=90, df_source=None, date
             ts_cases -= ts_cases[0]
             ts_ftlts -= ts_ftlts[0]  
 
-    # plot the doubling rate over time
-    t_idx = ts_cases > pop_th
+    # plot the doubling rate over time, cases & fatalities aligned on the cases threshold
+    df_ts = pd.DataFrame([ts_cases.values, ts_ftlts.values], index=['Cases', 'Fatalities'])
+    t_idx = dataFun.threshold_crossing(df_ts.loc[['Cases']], pop_th)
+    df_aligned = dataFun.align_on_threshold(df_ts, first_idx=t_idx.repeat(2))
+    ts_cases_d = df_aligned.loc['Cases'].dropna()
+    ts_ftlts_d = df_aligned.loc['Fatalities'].dropna()
     # trace cases
     fig_gr.add_trace(
         plotly.graph_objs.Scatter(
             mode = 'lines+markers', #'lines'
-            x = np.arange(0, len(t_idx)),
-            y = ts_cases[t_idx],
+            x = ts_cases_d.index,
+            y = ts_cases_d,
             name = 'Cases',
             line=dict(color='CornflowerBlue'),
             #marker=dict(color='CornflowerBlue')
@@ -287,8 +309,8 @@ def growing_ratio_country(df_data, pop_th=100, num_days=90, df_source=None, date
     fig_gr.add_trace(
         plotly.graph_objs.Scatter(
             mode = 'lines+markers', # 'lines',
-            x = np.arange(0, len(t_idx)),
-            y = ts_ftlts[t_idx],
+            x = ts_ftlts_d.index,
+            y = ts_ftlts_d,
             name = 'Fatalities',
             line=dict(color='Black'),
         ))
@@ -300,7 +322,9 @@ def growing_ratio_country(df_data, pop_th=100, num_days=90, df_source=None, date
     # correct y axis
     fig_gr.update_yaxes(range=[math.log10(pop_th), np.maximum(math.log10(np.max(ts_cases))+.2, math.log10(pop_th)+3.5)])
     
-    fig_gr.show()
+    if show:
+        fig_gr.show()
+    return fig_gr
 
 
 # Explore the growing rate over time (call chart growing rate countries)
@@ -376,12 +400,13 @@ def doublingtime_chart(pop_th=100, num_days=37):
 
 
 # Countries comparison
-def disp_countries_comp(df_data, ctry_list, mask=0, plot_type='line'):
+def disp_countries_comp(df_data, ctry_list, mask=0, plot_type='line', show=True):
     '''Routine to plot countries cases over time so a visual comparison is possible
         df_data:    <dataframe> information from JHU for each case per country over time
         ctry_list:  <list> string list with countries to compare
         mask:       <boolean> vector with period to display, all period by default (0)
         plot_type:  TO BE DONE LATER
+        show:       <boolean> display the figure, the figure is returned in all cases
 
     '''
     fig = plotly.graph_objs.Figure()
@@ -432,17 +457,21 @@ def disp_countries_comp(df_data, ctry_list, mask=0, plot_type='line'):
     fig.update_yaxes(showgrid=True, gridwidth=.3, gridcolor='gainsboro')
     fig.update_yaxes(range=[np.log10(np.min(ctry_ts[mask])+1), np.log10(ctry_max)+.5])
 
-    fig.show()
+    if show:
+        fig.show()
+    return fig
 
 
 # Generate recoveries and fatalities rates for JHU dataframe source
-def disp_country_rates_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0):
+def disp_country_rates_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0, lag_adjusted=False, show=True):
     '''Routine to display the evolution of recovery and fatalies rates compare to all cases reported by JHU datasource
         ts_case:    <timeserie> information over time for each case
         ts_recov:   <timeserie> information over time for each recovery
         ts_death:   <timeserie> information over time for each fatality
         loc_name:   <string> name of the location under study
         mask:       <boolean> vector with period to display, all period by default (0)
+        lag_adjusted:<boolean> add the rates adjusted by the delay to the outcome as lines (see dataRates)
+        show:       <boolean> display the figure, the figure is returned in all cases
 
         '''
     # Check for time filter
@@ -452,6 +481,8 @@ def disp_country_rates_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0):
     # Calculate rates faces to total cases diagnosed
     rate_recov = dataFun.safe_div(ts_recov.values, ts_case.values) *100
     rate_death = dataFun.safe_div(ts_death.values, ts_case.values) *100   
+    if lag_adjusted:
+        rates = dataRates.lag_adjusted_rates(ts_case, ts_recov, ts_death)
 
     # display rates
     fig = plotly.subplots.make_subplots(rows=2, cols=1)
@@ -463,6 +494,15 @@ def disp_country_rates_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0):
         name = 'Recoveries',
         marker = dict(color = 'darkseagreen', line=dict(color='forestgreen', width=1.5)),
     )
+    if lag_adjusted:
+        fig.add_scatter(
+            row=1, col=1,
+            mode = 'lines',
+            x = ts_case.index[mask],
+            y = rates['recovery'].values[mask] *100,
+            name = 'Recoveries (lag adjusted)',
+            line = dict(color='forestgreen', width=2, dash='dash'),
+        )
     fig.update_xaxes(title_text="Time [Days]", row=1, col=1)
     fig.update_yaxes(title_text="Percentage [%]", row=1, col=1, showgrid=True, gridwidth=.3, gridcolor='gainsboro')
 
@@ -473,6 +513,15 @@ def disp_country_rates_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0):
         name = 'Fatalities',
         marker = dict(color = 'DimGray', line=dict(color='Black', width=1.5)),
     )
+    if lag_adjusted:
+        fig.add_scatter(
+            row=2, col=1,
+            mode = 'lines',
+            x = ts_case.index[mask],
+            y = rates['fatality'].values[mask] *100,
+            name = 'Fatalities (lag adjusted)',
+            line = dict(color='Black', width=2, dash='dash'),
+        )
     fig.update_xaxes(title_text="Time [Days]", row=2, col=1)
     fig.update_yaxes(title_text="Percentage [%]", row=2, col=1, showgrid=True, gridwidth=.3, gridcolor='gainsboro')
 
@@ -481,18 +530,24 @@ def disp_country_rates_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0):
         title_x = .5,
         plot_bgcolor='white')
     
-    fig.show()
+    if show:
+        fig.show()
+    return fig
 
 
 
 # Generate cumulative graph over time for JHU dataframe source
-def disp_cum_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0):
+def disp_cum_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0, forecast=None, base=None, show=True):
     '''Routine to display the normal/log tendency of the cumulated cases for JHU datasource only
         ts_case:    <timeserie> information over time for each case
         ts_recov:   <timeserie> information over time for each recovery
         ts_death:   <timeserie> information over time for each fatality
         loc_name:   <string> name of the location under study
         mask:       <boolean> vector with period to display, default=0 all period
+        forecast:   <dict> projection of the cases {'mean', 'lower', 'upper'} timeseries,
+                    see dataForecast.GrowthFit.forecast with region=loc_name
+        base:       <figure> figure already displayed, (figure, update from base) is returned instead (see figure_patch)
+        show:       <boolean> display the figure, the figure is returned in all cases
 
         '''
     # Check for time filter
@@ -528,6 +583,27 @@ def disp_cum_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0):
             name = 'Fatalities',
             marker=dict(color='black')
     ))
+    # projection of the cases with its interval
+    if forecast is not None:
+        fc_dates = forecast['mean'].index
+        fig.add_trace(
+            plotly.graph_objs.Scatter(
+                x=np.concatenate([fc_dates, fc_dates[::-1]]),
+                y=np.concatenate([forecast['upper'].to_numpy(), forecast['lower'].to_numpy()[::-1]]),
+                fill='toself',
+                fillcolor='rgba(100, 149, 237, .2)',
+                line=dict(width=0),
+                hoverinfo='skip',
+                name = 'Forecast interval',
+        ))
+        fig.add_trace(
+            plotly.graph_objs.Scatter(
+                mode='lines',
+                x=fc_dates,
+                y=forecast['mean'],
+                name = 'Forecast',
+                line=dict(color='CornflowerBlue', dash='dash')
+        ))
 
     if ts_case.max() > 100:
         fig.update_layout(yaxis_title = 'Cases [Log]', yaxis_type="log")
@@ -543,16 +619,27 @@ def disp_cum_jhu(ts_case, ts_recov, ts_death, loc_name, mask=0):
 
     fig.update_yaxes(showgrid=True, gridwidth=.3, gridcolor='gainsboro')
     
-    fig.show()
+    if base is not None:
+        return fig, figure_patch(fig, base)
+    if show:
+        fig.show()
+    return fig
 
 
 # Generate a graph in original axis with current active cases
-def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False):
+def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False, repair=None, anomalies=None, center=True, base=None, show=True):
     '''Display daily cases evolution for confirmed & fatalities for two different data sources. 
         df_data:    <dataframe> daily information per case
         loc_name:   <string> name of the location under study
         df_source:  <string> select the type of dataframe source
         trend: display a trend line for each plot (default: False)
+        repair:     <string> spread negative daily cases over earlier days ('backfill' or 'proportional'), clipped if None
+        anomalies:  <string> reporting glitches flagged by dataAnomaly, 'show' to mark them, 'hide' to replace them
+                    by the rolling median in bars & trends, not checked if None
+        center:     <boolean> anomaly window centered on the day, otherwise ending on the day (use center=False for
+                    figures updated with base, a new day then leaves the days already displayed unchanged)
+        base:       <figure> figure already displayed, (figure, update from base) is returned instead (see figure_patch)
+        show:       <boolean> display the figure, the figure is returned in all cases
         
         '''
     if df_source == 'SPF':
@@ -560,10 +647,10 @@ def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False)
         date_time = pd.DataFrame(index=df_data.date).index
 
         # Daily cases       
-        cases_d = np.insert(np.diff(df_data.cas_confirmes).clip(0), 0, 0)
+        cases_d = dataRepair.daily_from_cumulative(df_data.cas_confirmes, repair)
 
         # daily fatalities
-        fatal_d = np.insert(np.diff(df_data.deces).clip(0) ,0, 0)
+        fatal_d = dataRepair.daily_from_cumulative(df_data.deces, repair)
 
         # daily recov
         recov_d = 0
@@ -572,9 +659,9 @@ def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False)
         # time vector
         date_time = pd.DataFrame(index=df_data.date).index
         # Daily cases       
-        cases_d = np.insert(np.diff(df_data.total_cas_confirmes).clip(0), 0, 0)
+        cases_d = dataRepair.daily_from_cumulative(df_data.total_cas_confirmes, repair)
         # daily fatalities
-        fatal_d = np.insert(np.diff(df_data.total_deces_hopital).clip(0) ,0, 0)
+        fatal_d = dataRepair.daily_from_cumulative(df_data.total_deces_hopital, repair)
         recov_d = 0 # daily recov
 
 
@@ -583,13 +670,13 @@ def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False)
         date_time = df_data.index
 
         # Daily cases
-        cases_d = np.insert(np.diff(df_data.cases).clip(0), 0, 0)
+        cases_d = dataRepair.daily_from_cumulative(df_data.cases, repair)
 
         # Daily fatalities
-        fatal_d = np.insert(np.diff(df_data.death).clip(0) ,0, 0)
+        fatal_d = dataRepair.daily_from_cumulative(df_data.death, repair)
 
         # Daily recovery
-        recov_d = np.insert(np.diff(df_data.recov).clip(0) ,0, 0)
+        recov_d = dataRepair.daily_from_cumulative(df_data.recov, repair)
 
     else:
         print('Error: Not valid value for df_source')
@@ -599,6 +686,25 @@ def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False)
     if mask is None:
         mask = date_time >= date_time[0]
 
+    # Flag reporting glitches
+    flags = {}
+    if anomalies is not None:
+        if anomalies not in dataAnomaly.anomaly_modes:
+            print('Error: Not valid value for anomalies')
+            return
+        series = {'cases': cases_d, 'fatal': fatal_d}
+        if df_source == 'JHU':
+            series['recov'] = recov_d
+        for key, values in series.items():
+            # the first day is 0 by construction, not checked
+            values = np.asarray(values)
+            fixed, flag = dataAnomaly.suppress_anomalies(values[1:], center=center)
+            flags[key] = np.insert(flag, 0, False)
+            if anomalies == 'hide':
+                series[key] = np.insert(fixed, 0, values[0])
+        cases_d, fatal_d = series['cases'], series['fatal']
+        recov_d = series.get('recov', recov_d)
+
     # Build plot for daily variation
     fig = plotly.graph_objs.Figure()
 
@@ -611,7 +717,8 @@ def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False)
             name = 'Cases'
     ))
     if trend:
-        cases_trend = dataFun.mov_avg(cases_d[mask], 7)
+        # trailing mean, one value per day as the bars
+        cases_trend = dataFun.mov_avg(cases_d[mask], 7)[:len(date_time[mask])]
         fig.add_trace(
         plotly.graph_objs.Scatter(
             x = date_time[mask],
@@ -629,7 +736,8 @@ def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False)
             name = 'Fatalities'
     ))
     if trend:
-        cases_trend = dataFun.mov_avg(fatal_d[mask], 7)
+        # trailing mean, one value per day as the bars
+        cases_trend = dataFun.mov_avg(fatal_d[mask], 7)[:len(date_time[mask])]
         fig.add_trace(
         plotly.graph_objs.Scatter(
             x = date_time[mask],
@@ -648,6 +756,21 @@ def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False)
                 name = 'Recoveries'
         ))
 
+    if anomalies == 'show':
+        # mark the flagged days over their bars
+        names = {'cases': 'Cases', 'fatal': 'Fatalities', 'recov': 'Recoveries'}
+        values = {'cases': cases_d, 'fatal': fatal_d, 'recov': recov_d}
+        for key, flag in flags.items():
+            flag = flag & np.asarray(mask)
+            fig.add_trace(
+            plotly.graph_objs.Scatter(
+                mode = 'markers',
+                x = date_time[flag],
+                y = np.asarray(values[key])[flag],
+                marker = dict(color = 'Crimson', symbol = 'x', size = 8),
+                name = names[key] + ' anomalies'
+            ))
+
     fig.update_layout(
         plot_bgcolor='white', 
         #barmode = 'stack',
@@ -658,27 +781,32 @@ def disp_daily_cases(df_data, loc_name, df_source='JHU', mask=None, trend=False)
     )
     fig.update_yaxes(showgrid=True, gridwidth=.3, gridcolor='gainsboro')
 
-    fig.show()
+    if base is not None:
+        return fig, figure_patch(fig, base)
+    if show:
+        fig.show()
+    return fig
 
 
 # Generate a graph in original axis with current active cases
-def disp_current_cases(df_data, loc_name, pop_factor=1, source=None):
+def disp_current_cases(df_data, loc_name, pop_factor=1, source=None, show=True):
     '''Display current cases from cumulative and fatalities 
         df_data:    <dataframe> daily information per case
         loc_name:   <string> name of the location under study
         pop_factor: <integer> mutiplicative factor for yaxis chart
+        show:       <boolean> display the figure, the figure is returned in all cases
         
         '''
     # Calculate current cases from confimed & fatalities
     if source is 'datagouv':
-        fat_c = np.array(df_data.total_deces_hopital, dtype=int)
+        fat_c = dataPrecision.as_counts(np.array(df_data.total_deces_hopital, dtype=np.int64))
         fat_c[fat_c<0] = 0
-        liv_c = np.array(df_data.total_cas_confirmes, dtype=int) - fat_c
+        liv_c = dataPrecision.as_counts(np.array(df_data.total_cas_confirmes, dtype=np.int64)) - fat_c
 
     else:        
-        fat_c = np.array(df_data.deces, dtype=int)
+        fat_c = dataPrecision.as_counts(np.array(df_data.deces, dtype=np.int64))
         fat_c[fat_c<0] = 0
-        liv_c = np.array(df_data.cas_confirmes, dtype=int) - fat_c
+        liv_c = dataPrecision.as_counts(np.array(df_data.cas_confirmes, dtype=np.int64)) - fat_c
     
     # Build plot for basic data display
     fig = plotly.graph_objs.Figure()
@@ -714,17 +842,20 @@ def disp_current_cases(df_data, loc_name, pop_factor=1, source=None):
         title = 'Current active cases in ' + loc_name + datetime.datetime.today().strftime(', %B %d, %Y'),
         title_x = .5
     )
-    fig.show()
+    if show:
+        fig.show()
+    return fig
 
 
 # Generate a cumulative chart for SPF datasets
-def disp_cumulative(df_data, loc_name, pop_factor=1, source=None):
+def disp_cumulative(df_data, loc_name, pop_factor=1, source=None, show=True):
     '''Routine to display the normal/log tendency of the cumulated cases
         df_data:        <dataframe> information over time for each case
         loc_name:     <string> name of the location under study
         pop_factor:     <int> multiplicative factor for number of cases
                         default value 1, for other values is display in the 
                         vertical axis the multiplicative magnitude
+        show:       <boolean> display the figure, the figure is returned in all cases
         
         '''
     if source is 'datagouv':
@@ -766,4 +897,76 @@ def disp_cumulative(df_data, loc_name, pop_factor=1, source=None):
     )
     fig.update_yaxes(showgrid=True, gridwidth=.3, gridcolor='gainsboro')
 
-    fig.show()
\ No newline at end of file
+    if show:
+        fig.show()
+    return fig
+
+
+# Points of a trace as arrays, x as datetime64 when the axis is a date
+def _trace_points(trace):
+    x, y = getattr(trace, 'x', None), getattr(trace, 'y', None)
+    if x is None or y is None:
+        return None, None
+    x = np.asarray(x)
+    if x.dtype.kind not in 'Mfiu':
+        try:
+            x = np.asarray(pd.to_datetime(x)).astype('datetime64[ns]')
+        except (ValueError, TypeError):
+            return None, None
+    return x, np.asarray(y, dtype=float)
+
+
+# Values of a patch, compatible with JSON & plotly.js
+def _patch_values(values):
+    if values.dtype.kind == 'M':
+        return np.datetime_as_string(values, unit='s').tolist()
+    return [None if np.isnan(v) else float(v) for v in values.astype(float)]
+
+
+# Update of a figure already displayed
+def figure_patch(fig, base):
+    '''Provide the update from the figure base to fig as plotly.js calls, None if the traces differ (new
+    figure needed). Traces whose points shown in base are unchanged only send their new points:
+        Plotly.extendTraces(div, patch['extend']['data'], patch['extend']['traces'], patch['extend']['maxPoints'])
+    the other traces (e.g. centered rolling means, revised values) are sent in full:
+        Plotly.restyle(div, patch['restyle']['data'], patch['restyle']['traces'])
+        fig:    <figure> figure built with the new data
+        base:   <figure> figure already displayed, built by the same function with the previous data
+                (the figure returned with the previous update, or the first figure)
+        The layout (titles, axes) is not part of the patch
+        '''
+    if len(fig.data) != len(base.data):
+        return None
+    extend = {'data': {'x': [], 'y': []}, 'traces': [], 'maxPoints': {'x': [], 'y': []}}
+    restyle = {'data': {'x': [], 'y': []}, 'traces': []}
+    num_points = 0
+    for pos, (trace, old) in enumerate(zip(fig.data, base.data)):
+        if trace.type != old.type:
+            return None
+        x, y = _trace_points(trace)
+        old_x, old_y = _trace_points(old)
+        if x is None or old_x is None:
+            continue
+        if len(x) == len(old_x) and len(y) == len(old_y) and np.array_equal(x, old_x) and np.allclose(y, old_y, rtol=1e-9, atol=0, equal_nan=True):
+            continue
+        # points after the last point of base, the points before must be the tail of base
+        # extendTraces appends to x & y, both must have one value per point
+        appendable = len(old_x) > 0 and len(x) == len(y) and len(old_x) == len(old_y) and \
+            (np.diff(x) > 0).all() and (np.diff(old_x) > 0).all()
+        if appendable:
+            first_new = int(np.searchsorted(x, old_x[-1], side='right'))
+            appendable = 0 < first_new <= len(old_x) and np.array_equal(x[:first_new], old_x[-first_new:]) and \
+                np.allclose(y[:first_new], old_y[-first_new:], rtol=1e-9, atol=0, equal_nan=True)
+        if appendable:
+            extend['data']['x'].append(_patch_values(x[first_new:]))
+            extend['data']['y'].append(_patch_values(y[first_new:]))
+            extend['traces'].append(pos)
+            extend['maxPoints']['x'].append(len(x))
+            extend['maxPoints']['y'].append(len(x))
+            num_points += len(x) - first_new
+        else:
+            restyle['data']['x'].append(_patch_values(x))
+            restyle['data']['y'].append(_patch_values(y))
+            restyle['traces'].append(pos)
+            num_points += len(x)
+    return {'extend': extend, 'restyle': restyle, 'points': num_points}
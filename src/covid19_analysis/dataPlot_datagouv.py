@@ -2,12 +2,13 @@
 
 import pandas as pd
 import numpy as np
-import plotly
 import datetime
 import math
 
 # import local functions
 import covid19_analysis.dataFun as dataFun
+from covid19_analysis._lazy import LazyModule
+import covid19_analysis.dataRepair as dataRepair
 
 
 from covid19_analysis import __version__
@@ -16,15 +17,19 @@ __author__ = "J SAYRITUPAC"
 __copyright__ = "J SAYRITUPAC"
 __license__ = "mit"
 
+# plotly is only imported when the first figure is built
+plotly = LazyModule('plotly', ('plotly.graph_objs', 'plotly.subplots'))
+
 
 # Function library to treat and plot results that comes from
 # the french dataset. Variables and graph are adapted to those
 # dataframes.
 
 # Report daily evolution at hospital for one department
-def disp_dep_hosp(df_donnes, nom_dep):
+def disp_dep_hosp(df_donnes, nom_dep, show=True):
     '''
     Display daily evolution at deparment hospital
+        show:       <boolean> display the figure, the figure is returned in all cases
     '''
     fig = plotly.graph_objs.Figure()
     # Ajout trace des cas d'hospitalisation
@@ -72,12 +77,15 @@ def disp_dep_hosp(df_donnes, nom_dep):
     )
     fig.update_yaxes(showgrid=True, gridwidth=.3, gridcolor='gainsboro')
 
-    fig.show()
+    if show:
+        fig.show()
+    return fig
 
     # display current cases in hospital divided by age
-def disp_regions_comp(df_data, y_log=False):
+def disp_regions_comp(df_data, y_log=False, show=True):
     ''' Display cases per region
         df_data:    <dataframe> daily hospitalizations for regions and age categorie    
+        show:       <boolean> display the figure, the figure is returned in all cases
     '''
     dict_regions_code = {'84' : 'Auvergne-Rhône-Alpes', '27' : 'Bourgogne-Franche-Comté', '53' : 'Bretagne',
                      '24' : 'Centre-Val de Loire', '94' : 'Corse', '44' : 'Grand Est', 
@@ -116,16 +124,19 @@ def disp_regions_comp(df_data, y_log=False):
         title_x = .5
     )
     
-    fig.show()
+    if show:
+        fig.show()
+    return fig
 
 # Generate a cumulative chart
-def disp_cumulative(df_data, loc_name, pop_factor=1, source='datagouv'):
+def disp_cumulative(df_data, loc_name, pop_factor=1, source='datagouv', show=True):
     '''Routine to display the normal/log tendency of the cumulated cases
         df_data:        <dataframe> information over time for each case
         loc_name:       <string> name of the location under study
         pop_factor:     <int> multiplicative factor for number of cases
                         default value 1, for other values is display in the 
                         vertical axis the multiplicative magnitude
+        show:       <boolean> display the figure, the figure is returned in all cases
         
         '''
     if source is 'datagouv':
@@ -168,25 +179,29 @@ def disp_cumulative(df_data, loc_name, pop_factor=1, source='datagouv'):
     )
     fig.update_yaxes(showgrid=True, gridwidth=.3, gridcolor='gainsboro')
 
-    fig.show()
+    if show:
+        fig.show()
+    return fig
 
 
 # Generate a graph in original axis with current active cases
-def disp_daily_cases(df_data, loc_name, df_source='datagouv', trend=False):
+def disp_daily_cases(df_data, loc_name, df_source='datagouv', trend=False, repair=None, show=True):
     '''Display daily cases evolution for confirmed & fatalities. 
         df_data:    <dataframe> daily information per case
         loc_name:   <string> name of the location under study
         df_source:  <string> select the type of dataframe source
         trend: display a trend line for each plot (default: False)
+        repair:     <string> spread negative daily fatalities over earlier days ('backfill' or 'proportional'), clipped if None
+        show:       <boolean> display the figure, the figure is returned in all cases
         
         '''
     if df_source is 'datagouv':
         # time vector
         date_time = pd.DataFrame(index=df_data.jour).index
-        # Daily cases       
-        cases_d = np.insert(np.diff(df_data.hosp).clip(0), 0, 0)
+        # Daily cases, hosp is a stock that can fall: negative days are clipped, not repaired
+        cases_d = dataRepair.daily_from_cumulative(df_data.hosp)
         # daily fatalities
-        fatal_d = np.insert(np.diff(df_data.dc).clip(0) ,0, 0)
+        fatal_d = dataRepair.daily_from_cumulative(df_data.dc, repair)
         recov_d = 0 # daily recov
 
     else:
@@ -243,4 +258,6 @@ def disp_daily_cases(df_data, loc_name, df_source='datagouv', trend=False):
     )
     fig.update_yaxes(showgrid=True, gridwidth=.3, gridcolor='gainsboro')
 
-    fig.show()
\ No newline at end of file
+    if show:
+        fig.show()
+    return fig
\ No newline at end of file
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+import os
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Population reference table bundled with the package (data/population.csv)
+# and per-capita normalization of (regions x days) matrices. Levels of the
+# table and their codes:
+#   'jhu':  JHU labels, country name or 'Country - Province' as given by
+#           dataFun.get_matrix_from_JHU and dataHierarchy.HierarchyIndex
+#   'dep':  datagouv department codes ('01', '2A', '971', ...)
+#   'reg':  datagouv region codes ('11', '84', '01', ...)
+# Figures are 2020 estimates (UN World Population Prospects, INSEE). The
+# department rows give their region code (column region), the table is the
+# only department -> region mapping of the package. Region rows are the sums
+# of their department rows, and the countries JHU reports as the sum of all
+# their provinces (China with Hong Kong & Macau, Australia, Canada) are the
+# sums of their province rows, as the mainland aggregates.
+population_file = os.path.join(os.path.dirname(__file__), 'data', 'population.csv')
+population_levels = ('jhu', 'dep', 'reg')
+
+_population_table = None
+
+
+# Read the bundled population table once
+def population_table():
+    '''Provide the bundled population table as a dataframe with columns level, code, name, population & region'''
+    global _population_table
+    if _population_table is None:
+        _population_table = pd.read_csv(population_file, dtype={'code': str, 'region': str}, keep_default_na=False)
+    return _population_table
+
+
+# Format datagouv codes as in the population table
+def _format_codes(codes, level):
+    if level == 'jhu':
+        return pd.Index(codes).astype(str)
+    # datagouv files may read codes as integers: 1 -> '01', 971 -> '971', '2A' unchanged
+    return pd.Index([str(c).zfill(2) for c in codes])
+
+
+# Population of each level code
+def get_population(level='jhu'):
+    '''Provide a Series with the population indexed by code for one level of the table
+        level:  <string> 'jhu', 'dep' or 'reg'
+        '''
+    if level not in population_levels:
+        raise ValueError('Not valid level %s, options are %s' %(level, ', '.join(population_levels)))
+    table = population_table()
+    table = table[table['level'] == level]
+    return pd.Series(table['population'].to_numpy(dtype=float), index=table['code'].to_numpy(), name='population')
+
+
+# Region of each department
+def get_regions():
+    '''Provide a Series with the region code (2016 regions) indexed by department code'''
+    table = population_table()
+    table = table[table['level'] == 'dep']
+    return pd.Series(table['region'].to_numpy(), index=table['code'].to_numpy(), name='region')
+
+
+# Join the population table with a list of labels
+def match_population(labels, level='jhu', verbose=True):
+    '''Provide the population aligned with labels (NaN when unknown) and the list of unmatched labels
+        labels:     <list/Index> JHU labels, department or region codes
+        level:      <string> 'jhu', 'dep' or 'reg'
+        verbose:    <boolean> display a warning with the unmatched labels
+        '''
+    codes = _format_codes(labels, level)
+    pop = get_population(level)
+    pos = pop.index.get_indexer(codes)
+    values = np.where(pos >= 0, pop.to_numpy()[pos], np.nan)
+
+    missing = [label for label, p in zip(labels, pos) if p < 0]
+    if missing and verbose:
+        print('Warning: no population for %d labels: %s' %(len(missing), ', '.join(map(str, missing))))
+    return pd.Series(values, index=pd.Index(labels), name='population'), missing
+
+
+# Normalize a matrix by the population of each region
+def per_capita(df_matrix, level='jhu', per=1e5, population=None, verbose=True):
+    '''Provide the values per `per` people (per 100k by default), rows without population are set to NaN
+        df_matrix:  <dataframe> any metric, one row per region and one column per day
+        level:      <string> level of the row labels, 'jhu', 'dep' or 'reg'
+        per:        <int> number of people of the output unit
+        population: <Series> population per row label, the bundled table is used if None
+        verbose:    <boolean> display a warning with the rows without population
+        '''
+    if population is None:
+        population, _ = match_population(df_matrix.index, level, verbose)
+    else:
+        population = population.reindex(df_matrix.index)
+        if verbose and population.isna().any():
+            missing = population.index[population.isna()]
+            print('Warning: no population for %d labels: %s' %(len(missing), ', '.join(map(str, missing))))
+
+    pop = population.to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(pop > 0, per / pop, np.nan)
+    return pd.DataFrame(dataPrecision.as_metric(df_matrix.to_numpy() * scale[:, None]), index=df_matrix.index, columns=df_matrix.columns)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import contextlib
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Package-wide precision policy for the stored arrays: counts (cumulative
+# and daily cases) and derived metrics (rolling means, ratios, doubling
+# times, per capita values). Modes:
+#   'default':  int64 counts & float64 metrics, as numpy/pandas defaults
+#   'compact':  int32 counts & float32 metrics, about half the memory
+#   'auto':     smallest of int16/int32/int64 holding the counts with room
+#               for their differences, float32 metrics
+# Only the outputs follow the policy, sums and rolling means are still
+# computed in int64/float64. Counts outside the int32 range stay int64.
+#
+#   dataPrecision.set_dtype_mode('compact')
+#   with dataPrecision.dtype_mode('auto'):
+#       df_us = dataUS.CountyIndex(df_us_raw).matrix()
+dtype_modes = ('default', 'compact', 'auto')
+
+_dtype_mode = 'default'
+_count_types = (np.int16, np.int32, np.int64)
+
+
+# Select the policy for the whole package
+def set_dtype_mode(mode):
+    '''Set the precision policy, 'default', 'compact' or 'auto' (see dtype_modes)'''
+    global _dtype_mode
+    if mode not in dtype_modes:
+        raise ValueError('Not valid dtype mode %s, options are %s' %(mode, ', '.join(dtype_modes)))
+    _dtype_mode = mode
+
+
+def get_dtype_mode():
+    '''Provide the current precision policy'''
+    return _dtype_mode
+
+
+# Temporary policy, e.g. for one dataset
+@contextlib.contextmanager
+def dtype_mode(mode):
+    '''Context manager setting the precision policy within a with block'''
+    previous = _dtype_mode
+    set_dtype_mode(mode)
+    try:
+        yield
+    finally:
+        set_dtype_mode(previous)
+
+
+# Integer type of the counts
+def count_dtype(values=None):
+    '''Provide the numpy dtype used to store counts
+        values: <array> counts to store, used by 'auto' and to keep int64 beyond the int32 range
+        '''
+    if _dtype_mode == 'default':
+        return np.dtype(np.int64)
+    if values is None:
+        return np.dtype(np.int32)
+    values = np.asarray(values)
+    if values.size == 0:
+        return np.dtype(_count_types[0] if _dtype_mode == 'auto' else np.int32)
+
+    # twice the largest magnitude, so differences of two counts also fit
+    bound = 2 * max(abs(int(values.min())), abs(int(values.max())))
+    types = _count_types if _dtype_mode == 'auto' else _count_types[1:]
+    for dtype in types:
+        if bound <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+# Float type of the derived metrics
+def metric_dtype():
+    '''Provide the numpy dtype used to store derived metrics'''
+    return np.dtype(np.float64 if _dtype_mode == 'default' else np.float32)
+
+
+# Cast integer counts following the policy
+def as_counts(values):
+    '''Provide the counts as an array of the policy integer type (no copy if already of that type)
+        values: <array> integer counts, without NaN
+        '''
+    values = np.asarray(values)
+    return values.astype(count_dtype(values), copy=False)
+
+
+# Cast derived metrics following the policy
+def as_metric(values):
+    '''Provide the metric as an array of the policy float type (no copy if already of that type)'''
+    return np.asarray(values, dtype=metric_dtype())
+
+
+# Downcast the numeric columns of a source dataframe
+def compact_frame(df):
+    '''Provide the dataframe with its numeric columns stored following the policy, unchanged in 'default' mode
+        df:     <dataframe> source data (JHU, datagouv, ...)
+        Float columns are only downcast when float32 keeps their values exactly
+        (counts with missing values or coordinates stay float64)
+        '''
+    if _dtype_mode == 'default':
+        return df
+    dtypes = {}
+    for col in df.columns:
+        kind = df[col].dtype.kind
+        if kind in 'iu':
+            dtype = count_dtype(df[col].to_numpy())
+        elif kind == 'f':
+            values = df[col].to_numpy()
+            exact = np.all((values.astype(np.float32) == values) | np.isnan(values))
+            dtype = metric_dtype() if exact else values.dtype
+        else:
+            continue
+        if dtype != df[col].dtype:
+            dtypes[col] = dtype
+    return df.astype(dtypes) if dtypes else df
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+import collections
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Lazy query pipeline over a (regions x days) matrix. Each method of
+# Query only records a step of the plan; collect() resolves the rows and
+# the range of days really needed by the plan, takes them once from the
+# matrix and runs all steps in place over that single block. Results are
+# kept by the session so plans sharing the same first steps reuse them.
+#
+#   session = QuerySession(dataFun.get_matrix_from_JHU(df_c))
+#   df_daily = session.query().select(['France', 'Italy']).diff().clip(0).rolling(7).window(num_days=90).collect()
+
+
+class QuerySession:
+    '''Hold the data of the queries and the results of the plans already run
+        df_matrix:  <dataframe> data with one row per region and one column per day,
+                    see dataFun.get_matrix_from_JHU
+        cache_size: <int> maximum number of results kept in the session
+        '''
+
+    def __init__(self, df_matrix, cache_size=32):
+        self.index = df_matrix.index
+        self.dates = pd.DatetimeIndex(df_matrix.columns)
+        self.values = df_matrix.to_numpy()
+        self.cache_size = cache_size
+        self._positions = pd.Series(np.arange(len(self.index)), index=self.index)
+        self._cache = collections.OrderedDict()
+
+    # Start a new query over the session data
+    def query(self):
+        '''Provide an empty query (all regions, all days) bound to this session'''
+        return Query(self)
+
+    # Drop all the results kept by the session
+    def clear(self):
+        '''Clear the results cache, needed if the session data was modified in place'''
+        self._cache.clear()
+
+    # Positions of the regions within the matrix
+    def _rows(self, labels):
+        if labels is None:
+            return np.arange(len(self.index))
+        missing = [l for l in labels if l not in self._positions.index]
+        if missing:
+            raise KeyError('Regions not found in the data: %s' %(', '.join(map(str, missing))))
+        return self._positions.loc[list(labels)].to_numpy()
+
+    # Find the longest cached prefix of a plan covering the needed days
+    def _lookup(self, rows_key, steps, ranges):
+        for k in range(len(steps), 0, -1):
+            entry = self._cache.get((rows_key, steps[:k]))
+            if entry is None:
+                continue
+            data, start, end = entry
+            need_start, need_end = ranges[k]
+            if start <= need_start and end >= need_end:
+                self._cache.move_to_end((rows_key, steps[:k]))
+                return k, entry
+        return 0, None
+
+    # Keep the result of a plan
+    def _store(self, key, entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+class Query:
+    '''Lazy query over the data of a QuerySession, every method returns a new query with one more step.
+        Steps are applied in the order they are given, as if each one produced a new matrix:
+            select(labels):                 keep only some regions
+            diff(first=None):               daily increments from cumulative data
+            clip(lower=0, upper=None):      bound the values, NaN are kept
+            rolling(periods, center=False): rolling mean, partial windows at the data edges (as min_periods=1)
+            window(start, end, num_days):   keep a range of days
+            normalize(factor):              divide by a number or by a Series indexed by region
+        '''
+
+    def __init__(self, session, labels=None, steps=()):
+        self.session = session
+        self.labels = labels
+        self.steps = steps
+
+    def _add(self, *step):
+        return Query(self.session, self.labels, self.steps + (step,))
+
+    def select(self, labels):
+        '''Keep the regions in labels (string or list of strings), in that order'''
+        if isinstance(labels, str):
+            labels = [labels]
+        labels = tuple(labels)
+        if self.labels is not None:
+            missing = [l for l in labels if l not in self.labels]
+            if missing:
+                raise KeyError('Regions not selected by the query: %s' %(', '.join(map(str, missing))))
+        return Query(self.session, labels, self.steps)
+
+    def diff(self, first=None):
+        '''Difference between consecutive days. first: value of the first day, the day is dropped if None'''
+        return self._add('diff', first)
+
+    def clip(self, lower=0, upper=None):
+        '''Bound the values between lower and upper (None for no bound)'''
+        return self._add('clip', lower, upper)
+
+    def rolling(self, periods=7, center=False):
+        '''Rolling mean over periods days, trailing or centered on the day'''
+        return self._add('rolling', int(periods), bool(center))
+
+    def window(self, start=None, end=None, num_days=None):
+        '''Keep days between start and end dates (included), or the last num_days days before the last date'''
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        return self._add('window', start, end, num_days)
+
+    def normalize(self, factor):
+        '''Divide values by factor, a number, a Series with one value per region or an array with one
+        value per region of the query, in the order of its rows'''
+        if isinstance(factor, pd.Series):
+            factor = tuple(factor.items())
+        elif isinstance(factor, np.ndarray):
+            # the steps are keys of the session cache, the array is kept by its content
+            factor = ('array', np.ascontiguousarray(factor, dtype=np.float64).ravel().tobytes())
+        return self._add('normalize', factor)
+
+    def collect(self):
+        '''Run the plan as one pass over the data, return a dataframe (regions x days)'''
+        session = self.session
+        rows = session._rows(self.labels)
+        index = session.index[rows]
+        rows_key = None if self.labels is None else self.labels
+
+        ranges, edges = _plan_ranges(self.steps, session.dates)
+        k, entry = session._lookup(rows_key, self.steps, ranges)
+        start, end = ranges[k]
+        if entry is None:
+            # the only copy taken from the session data, all steps run in place over it
+            data = session.values[rows, start:end].astype(float)
+        else:
+            cached, c_start, c_end = entry
+            data = cached[:, start - c_start:end - c_start].astype(float)
+
+        for i in range(k, len(self.steps)):
+            data = _run_step(self.steps[i], data, ranges[i][0], ranges[i + 1], edges[i], index)
+        start, end = ranges[-1]
+
+        # steps run in float64 and the cache keeps float64, so a cached prefix gives the same
+        # numbers as a full run; only the returned frame follows the precision policy
+        data.flags.writeable = False
+        session._store((rows_key, self.steps), (data, start, end))
+        return pd.DataFrame(np.array(data, dtype=dataPrecision.metric_dtype()), index=index,
+                            columns=session.dates[start:end])
+
+
+# Days needed before and after each day by a step
+def _step_margin(step):
+    if step[0] == 'diff':
+        return 1, 0
+    if step[0] == 'rolling':
+        periods, center = step[1], step[2]
+        if center:
+            return periods // 2, (periods - 1) // 2
+        return periods - 1, 0
+    return 0, 0
+
+
+# Compute the range of days each step needs, from the last step back to the data
+def _plan_ranges(steps, dates):
+    '''Return the [start, end) ranges of days before each step plus after the last one,
+    and the [lo, hi) edges of the data seen before each step plus after the last one'''
+    # forward: data edges after each step, first day dropped by diff, days kept by window
+    lo, hi = 0, len(dates)
+    edges = [(lo, hi)]
+    for step in steps:
+        if step[0] == 'diff' and step[1] is None:
+            lo = min(lo + 1, hi)
+        elif step[0] == 'window':
+            w_start, w_end, w_days = step[1:]
+            if w_days is not None and hi > lo:
+                last_start = dates[hi - 1] - pd.Timedelta(w_days, unit='days')
+                w_start = last_start if w_start is None else max(w_start, last_start)
+            if w_start is not None:
+                lo = max(lo, int(dates.searchsorted(w_start, side='left')))
+            if w_end is not None:
+                hi = min(hi, int(dates.searchsorted(w_end, side='right')))
+            hi = max(lo, hi)
+        edges.append((lo, hi))
+
+    # backward: days needed before each step to get the days needed after it
+    start, end = edges[-1]
+    ranges = [(start, end)]
+    for step, (e_lo, e_hi) in zip(reversed(steps), reversed(edges[:-1])):
+        before, after = _step_margin(step)
+        start, end = max(start - before, e_lo), min(end + after, e_hi)
+        ranges.append((start, end))
+    ranges.reverse()
+    return ranges, edges
+
+
+# Run one step of the plan over the current block of data
+def _run_step(step, data, start, out_range, edges, index):
+    out_start, out_end = out_range
+    name = step[0]
+
+    if name == 'diff':
+        data[:, 1:] -= data[:, :-1].copy()
+        if start == edges[0] and step[1] is not None:
+            data[:, 0] = step[1]
+
+    elif name == 'clip':
+        np.clip(data, step[1], step[2], out=data)
+
+    elif name == 'rolling':
+        data = _rolling_mean(data, step[1], step[2])
+
+    elif name == 'normalize':
+        factor = step[1]
+        if isinstance(factor, tuple) and factor and factor[0] == 'array':
+            factor = np.frombuffer(factor[1], dtype=np.float64)
+            factor = factor[:, None] if factor.size > 1 else factor
+        elif isinstance(factor, tuple):
+            factor = pd.Series(dict(factor)).reindex(index).to_numpy(dtype=float)[:, None]
+        data /= factor
+
+    return data[:, out_start - start:out_end - start]
+
+
+# Rolling mean ignoring NaN, based on cumulative sums
+def _rolling_mean(data, periods, center):
+    before, after = (periods // 2, (periods - 1) // 2) if center else (periods - 1, 0)
+    num_days = data.shape[1]
+
+    valid = ~np.isnan(data)
+    csum = np.zeros((data.shape[0], num_days + 1))
+    np.cumsum(np.where(valid, data, 0), axis=1, out=csum[:, 1:])
+    ccount = np.zeros((data.shape[0], num_days + 1))
+    np.cumsum(valid, axis=1, out=ccount[:, 1:])
+
+    # window [j - before, j + after] limited to the block, the block is limited to the data edges
+    pos = np.arange(num_days)
+    lo = np.maximum(pos - before, 0)
+    hi = np.minimum(pos + after + 1, num_days)
+    total = csum[:, hi] - csum[:, lo]
+    count = ccount[:, hi] - ccount[:, lo]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(total, count, out=data)
+    data[count == 0] = np.nan
+    return data
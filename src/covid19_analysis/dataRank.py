@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Ranking of the regions of a (regions x days) cumulative matrix, e.g. to
+# build the ctry_list given to the plotting functions:
+#   df_ctry = dataHierarchy.HierarchyIndex(df_c).matrix()
+#   ctry_list = list(dataRank.top_regions(df_ctry, 'new', n=10).index)
+# Only the n selected regions are sorted, the selection itself is a
+# partial sort (argpartition) over all regions.
+rank_metrics = ('total', 'new', 'growth', 'doubling', 'per_capita')
+
+
+# Calculate one metric for all regions at a given date
+def region_metric(df_matrix, metric='total', window=7, end=None, population=None):
+    '''Provide a Series with the metric of each region
+        df_matrix:  <dataframe> cumulative data, one row per region and one column per day
+        metric:     <string> 'total':       cumulative value at the end date
+                             'new':         new cases within the last window days
+                             'growth':      ratio between the end date and window days before (0 if undefined)
+                             'doubling':    doubling time in days over the last window days (NaN without growth)
+                             'per_capita':  cumulative value per 100k people
+        window:     <int> number of days used by 'new', 'growth' & 'doubling'
+        end:        <string/datetime> last date considered, last date of the data by default
+        population: <Series> population per region, required by 'per_capita'
+        '''
+    dates = pd.DatetimeIndex(df_matrix.columns)
+    t_end = len(dates) - 1 if end is None else int(dates.searchsorted(pd.Timestamp(end), side='right')) - 1
+    if t_end < 0:
+        raise ValueError('No data before %s' %(end))
+    t_start = max(t_end - window, 0)
+
+    values = df_matrix.to_numpy()
+    cum_end = values[:, t_end].astype(float)
+    cum_start = values[:, t_start].astype(float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'total':
+            result = cum_end
+        elif metric == 'new':
+            result = cum_end - cum_start
+        elif metric == 'growth':
+            result = np.where(cum_start > 0, cum_end / cum_start, 0.)
+        elif metric == 'doubling':
+            grow = (cum_start > 0) & (cum_end > cum_start)
+            result = np.where(grow, (t_end - t_start) * np.log(2) / np.log(cum_end / cum_start), np.nan)
+        elif metric == 'per_capita':
+            if population is None:
+                raise ValueError('Metric per_capita requires the population per region')
+            pop = population.reindex(df_matrix.index).to_numpy(dtype=float)
+            result = np.where(pop > 0, cum_end / pop * 1e5, np.nan)
+        else:
+            raise ValueError('Not valid metric %s, options are %s' %(metric, ', '.join(rank_metrics)))
+
+    return pd.Series(result, index=df_matrix.index, name=metric)
+
+
+# Select the first regions for a metric
+def top_regions(df_matrix, metric='total', n=10, largest=True, window=7, end=None, population=None):
+    '''Provide a Series with the n regions with the largest (or smallest) metric, sorted
+        df_matrix:  <dataframe> cumulative data, one row per region and one column per day
+        metric:     <string> metric used for the ranking, see region_metric
+        n:          <int> number of regions to return
+        largest:    <boolean> top regions (True) or bottom regions (False), e.g. False for shortest doubling times
+        window:     <int> number of days used by 'new', 'growth' & 'doubling'
+        end:        <string/datetime> last date considered, last date of the data by default
+        population: <Series> population per region, required by 'per_capita'
+        Regions with an undefined metric (NaN) are never selected
+        '''
+    metric_ts = region_metric(df_matrix, metric, window, end, population)
+    values = metric_ts.to_numpy()
+    valid = np.flatnonzero(~np.isnan(values))
+    keys = -values[valid] if largest else values[valid]
+
+    n = min(n, valid.size)
+    if n <= 0:
+        return metric_ts.iloc[[]]
+    # partial selection of the n first, then sort only those
+    sel = valid[np.argpartition(keys, n - 1)[:n]] if n < valid.size else valid
+    sel = sel[np.argsort(-values[sel] if largest else values[sel], kind='stable')]
+    return metric_ts.iloc[sel]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+import math
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Lag-adjusted recovery and fatality rates. The same day ratio
+# deaths / cases underestimates the fatality rate while cases grow, the
+# recent cases did not have time to die or recover yet. The adjusted rate
+# divides by the cases whose outcome is expected to be known, the
+# cumulative cases convolved with the delay distribution from report to
+# death (or recovery):
+#   fatality(t) = deaths(t) / sum_k p(k) * cases(t - k)
+# The convolution runs along the days of all regions at once, by FFT for
+# long delay distributions and by shifted sums for short ones.
+#
+#   rates = dataRates.lag_adjusted_rates(df_case, df_recov, df_death)
+#   rates['fatality'].loc['France']
+rate_methods = ('auto', 'fft', 'direct')
+# Delays from report to death & recovery, gamma distribution (mean, standard deviation) in days
+default_death_delay = (13., 8.)
+default_recovery_delay = (14., 6.)
+
+
+# Discretized gamma distribution of a delay
+def delay_distribution(mean, sd, max_days=60):
+    '''Provide the probabilities of a delay of 0, 1 ... max_days-1 days, gamma distribution evaluated at
+    the middle of each day and normalized to sum 1
+        mean:       <float> mean delay in days
+        sd:         <float> standard deviation in days
+        max_days:   <int> number of days of the distribution
+        '''
+    if mean <= 0 or sd <= 0:
+        raise ValueError('Delay mean and standard deviation must be positive')
+    shape, scale = (mean / sd) ** 2, sd ** 2 / mean
+    days = np.arange(max_days) + .5
+    log_pdf = (shape - 1) * np.log(days) - days / scale - math.lgamma(shape) - shape * math.log(scale)
+    pmf = np.exp(log_pdf - log_pdf.max())
+    return pmf / pmf.sum()
+
+
+# Causal convolution of every row with a distribution
+def convolve_delay(values, pmf, method='auto'):
+    '''Provide out[:, t] = sum_k pmf[k] * values[:, t - k] for all rows, values before the first day are 0
+        values:     <array> one row per region and one column per day
+        pmf:        <array> delay distribution, see delay_distribution
+        method:     <string> 'fft', 'direct' (one shifted sum per day of the distribution) or 'auto'
+        '''
+    if method not in rate_methods:
+        raise ValueError('Not valid method %s, options are %s' %(method, ', '.join(rate_methods)))
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    pmf = np.asarray(pmf, dtype=np.float64)
+    num_days, num_lags = values.shape[1], min(len(pmf), values.shape[1])
+    if method == 'auto':
+        method = 'fft' if num_lags > 16 else 'direct'
+
+    if method == 'direct':
+        out = np.zeros_like(values)
+        for k in range(num_lags):
+            out[:, k:] += pmf[k] * values[:, :num_days - k]
+        return out
+
+    # zero padding to a power of 2 above the full convolution length, no wrap around
+    size = 1 << int(num_days + num_lags - 1).bit_length()
+    spectrum = np.fft.rfft(values, size, axis=1) * np.fft.rfft(pmf[:num_lags], size)
+    out = np.fft.irfft(spectrum, size, axis=1)[:, :num_days]
+    # rounding errors of the transform around 0
+    return np.clip(out, 0, None)
+
+
+# Rate of outcomes over the cases with a known outcome
+def _adjusted_rate(outcome, cases, pmf, method, min_cases):
+    known = convolve_delay(cases, pmf, method)
+    rate = np.zeros_like(known)
+    np.divide(outcome, known, out=rate, where=known >= min_cases)
+    return rate
+
+
+# Recovery & fatality rates adjusted by the delay to the outcome
+def lag_adjusted_rates(cases, recovered, deaths, death_delay=default_death_delay,
+                       recovery_delay=default_recovery_delay, max_days=60, method='auto', min_cases=1):
+    '''Provide the recovery and fatality rates over time, the outcomes divided by the cumulative cases
+    shifted by the delay distribution to the outcome
+        cases:          <dataframe/Series> cumulative cases, one row per region and one column per day, or one timeseries
+        recovered:      <dataframe/Series> cumulative recoveries, same layout
+        deaths:         <dataframe/Series> cumulative fatalities, same layout
+        death_delay:    <tuple> mean & standard deviation in days of the delay from report to death
+        recovery_delay: <tuple> mean & standard deviation in days of the delay from report to recovery
+        max_days:       <int> length of the delay distributions
+        method:         <string> convolution method, 'fft', 'direct' or 'auto'
+        min_cases:      <float> rates are 0 while fewer cases have a known outcome
+        Return a dictionary {'recovery', 'fatality'} of rates (fraction of 1) with the layout of cases
+        '''
+    is_series = isinstance(cases, pd.Series)
+    values = [np.atleast_2d(np.nan_to_num(np.asarray(df, dtype=np.float64))) for df in (cases, recovered, deaths)]
+    if values[1].shape != values[0].shape or values[2].shape != values[0].shape:
+        raise ValueError('Cases, recoveries and fatalities must have the same shape')
+    cum_cases, cum_recov, cum_death = values
+
+    out = {
+        'recovery': _adjusted_rate(cum_recov, cum_cases, delay_distribution(*recovery_delay, max_days), method, min_cases),
+        'fatality': _adjusted_rate(cum_death, cum_cases, delay_distribution(*death_delay, max_days), method, min_cases),
+    }
+    if is_series:
+        return {key: pd.Series(dataPrecision.as_metric(rate[0]), index=cases.index) for key, rate in out.items()}
+    return {key: pd.DataFrame(dataPrecision.as_metric(rate), index=cases.index, columns=cases.columns)
+            for key, rate in out.items()}
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataFun as dataFun
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Comparison of the JHU series of France with the national totals of the
+# french sources. Both sides are sorted by date, their dates are merged in
+# one sorted axis (union) and each source is placed on it by searchsorted,
+# no join on labels. The discrepancy metrics of all indicators are then
+# computed together on the (indicators x days) arrays, and the days missing
+# in one source within its own coverage are reported as gaps (runs of
+# consecutive days).
+#
+#   out = dataReconcile.reconcile_france(df_gouv, df_c, df_d, df_r)
+#   out['metrics']      # one row per indicator
+#   out['gaps']         # source, indicator, start, end, days
+reconcile_indicators = ('cases', 'deaths', 'recovered')
+
+# Columns of the national totals per source, summed when several are given
+gouv_columns = {
+    'datagouv': {
+        'cases': ('total_cas_confirmes',),
+        'deaths': ('total_deces_hopital', 'total_deces_ehpad'),
+        'recovered': ('total_gueris',),
+    },
+    'SPF': {
+        'cases': ('cas_confirmes',),
+        'deaths': ('deces', 'deces_ehpad'),
+        'recovered': ('gueris',),
+    },
+}
+
+
+# Sorted dates & values of a series, last value kept for duplicated dates
+def _sorted_series(dates, values):
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(dates, kind='stable')
+    dates, values = dates[order], values[order]
+    last = np.r_[dates[1:] != dates[:-1], True] if dates.size else np.zeros(0, dtype=bool)
+    return dates[last], values[last]
+
+
+# National totals of a french source as (indicator, dates, values)
+def _gouv_series(df_gouv, gouv_source):
+    if gouv_source not in gouv_columns:
+        raise ValueError('Not valid source %s, options are %s' %(gouv_source, ', '.join(gouv_columns)))
+    df = df_gouv
+    if 'granularite' in df.columns:
+        df = df[df['granularite'] == 'pays']
+    out = {}
+    for indicator, columns in gouv_columns[gouv_source].items():
+        present = [c for c in columns if c in df.columns]
+        if present:
+            values = df[present].apply(pd.to_numeric, errors='coerce').sum(axis=1, min_count=1)
+            # the first column is required, the others (e.g. nursing homes) are added when reported
+            values = values.where(df[present[0]].notna())
+            keep = values.notna().to_numpy()
+            out[indicator] = _sorted_series(df['date'].to_numpy()[keep], values.to_numpy()[keep])
+    return out
+
+
+# Runs of consecutive True values, (start, end) positions included
+def _runs(flags):
+    edges = np.diff(np.r_[0, flags.astype(np.int8), 0])
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+
+# Align JHU France with the national totals of a french source
+def reconcile_france(df_gouv, df_case, df_death=None, df_recov=None, gouv_source='datagouv',
+                     country='France', mainland=False):
+    '''Provide the JHU and french series of France on one date axis, their discrepancies and gaps
+        df_gouv:        <dataframe> national totals, datagouv (date, total_cas_confirmes, total_deces_hopital ...)
+                        or SPF chiffres-cles (date, cas_confirmes, deces ..., the 'pays' rows are used)
+        df_case:        <dataframe> JHU confirmed cases dataset
+        df_death:       <dataframe> JHU fatalities dataset, optional
+        df_recov:       <dataframe> JHU recoveries dataset, optional
+        gouv_source:    <string> 'datagouv' or 'SPF'
+        country:        <string> country of the JHU datasets
+        mainland:       <boolean> JHU mainland only, False to add the overseas places as the national totals do
+        Return a dictionary:
+            'aligned':  dataframe (dates x (indicator, 'jhu'/'gouv'/'diff')), NaN where a source has no value
+            'metrics':  dataframe (indicators x metrics), over the days reported by both sources:
+                        days, mean_abs_diff, mean_rel_diff, max_abs_diff, max_diff_date, last_date, last_diff,
+                        last_rel_diff & daily_corr (correlation of the daily increments); diff = jhu - gouv
+            'gaps':     dataframe with the runs of days missing in one source, between its first and last
+                        reported days, while the other reports; columns source, indicator, start, end, days
+        '''
+    jhu = {}
+    for indicator, df_jhu in zip(reconcile_indicators, (df_case, df_death, df_recov)):
+        if df_jhu is not None:
+            ts = dataFun.get_timeseries_from_JHU(df_jhu, country, mainland, verbose=False)
+            jhu[indicator] = _sorted_series(ts.index, ts.to_numpy())
+    gouv = _gouv_series(df_gouv, gouv_source)
+    indicators = [i for i in reconcile_indicators if i in jhu and i in gouv]
+    if not indicators:
+        raise ValueError('No indicator reported by both sources')
+
+    # one sorted date axis, each source placed on it by position
+    dates = np.unique(np.concatenate([s[0] for i in indicators for s in (jhu[i], gouv[i])]))
+    values = np.full((2, len(indicators), len(dates)), np.nan)
+    for k, indicator in enumerate(indicators):
+        for side, series in enumerate((jhu[indicator], gouv[indicator])):
+            values[side, k, np.searchsorted(dates, series[0])] = series[1]
+    v_jhu, v_gouv = values
+    diff = v_jhu - v_gouv
+    both = ~np.isnan(diff)
+
+    # metrics of all indicators at once, over the days of both sources
+    num_days = both.sum(axis=1)
+    abs_diff = np.where(both, np.abs(diff), 0.)
+    rel_diff = np.where(both & (v_gouv != 0), np.abs(diff) / np.where(v_gouv != 0, np.abs(v_gouv), 1), 0.)
+    rel_days = (both & (v_gouv != 0)).sum(axis=1)
+    max_pos = np.where(both, np.abs(diff), -1).argmax(axis=1)
+    last_pos = np.where(both.any(axis=1), len(dates) - 1 - both[:, ::-1].argmax(axis=1), 0)
+    rows = np.arange(len(indicators))
+
+    # daily increments on the days where both sources report the day and the day before
+    pair = both[:, 1:] & both[:, :-1]
+    d_jhu = np.where(pair, np.diff(v_jhu, axis=1), 0.)
+    d_gouv = np.where(pair, np.diff(v_gouv, axis=1), 0.)
+    num_pairs = np.maximum(pair.sum(axis=1), 1)
+    c_jhu = np.where(pair, d_jhu - (d_jhu.sum(axis=1) / num_pairs)[:, None], 0.)
+    c_gouv = np.where(pair, d_gouv - (d_gouv.sum(axis=1) / num_pairs)[:, None], 0.)
+    norm = np.sqrt((c_jhu ** 2).sum(axis=1) * (c_gouv ** 2).sum(axis=1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.where(norm > 0, (c_jhu * c_gouv).sum(axis=1) / norm, np.nan)
+        metrics = pd.DataFrame({
+            'days': num_days,
+            'mean_abs_diff': abs_diff.sum(axis=1) / num_days,
+            'mean_rel_diff': rel_diff.sum(axis=1) / rel_days,
+            'max_abs_diff': np.abs(diff[rows, max_pos]),
+            'max_diff_date': pd.DatetimeIndex(dates[max_pos]),
+            'last_date': pd.DatetimeIndex(dates[last_pos]),
+            'last_diff': diff[rows, last_pos],
+            'last_rel_diff': diff[rows, last_pos] / v_gouv[rows, last_pos],
+            'daily_corr': corr,
+        }, index=pd.Index(indicators, name='indicator'))
+    no_overlap = num_days == 0
+    metrics.loc[no_overlap, metrics.columns.drop('days')] = np.nan
+
+    # gaps: days missing in one source, between its own first and last days, while the other reports
+    reported = ~np.isnan(values)
+    first = reported.argmax(axis=2)
+    last = values.shape[2] - 1 - reported[:, :, ::-1].argmax(axis=2)
+    days = np.arange(len(dates))
+    covered = reported.any(axis=2)[:, :, None] & (days >= first[:, :, None]) & (days <= last[:, :, None])
+    gaps = []
+    for side, source in enumerate(('jhu', gouv_source)):
+        for k, indicator in enumerate(indicators):
+            starts, ends = _runs(covered[side, k] & ~reported[side, k] & reported[1 - side, k])
+            gaps += [(source, indicator, dates[s], dates[e], e - s + 1) for s, e in zip(starts, ends)]
+    df_gaps = pd.DataFrame(gaps, columns=['source', 'indicator', 'start', 'end', 'days'])
+
+    columns = pd.MultiIndex.from_product([indicators, ['jhu', 'gouv', 'diff']], names=['indicator', 'source'])
+    aligned = np.stack([v_jhu, v_gouv, diff], axis=1).reshape(-1, len(dates)).T
+    df_aligned = pd.DataFrame(dataPrecision.as_metric(aligned), index=pd.DatetimeIndex(dates, name='date'), columns=columns)
+    return {'aligned': df_aligned, 'metrics': metrics, 'gaps': df_gaps}
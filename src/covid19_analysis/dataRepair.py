@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Repair of the negative daily increments found in cumulative series
+# (backfill corrections published by JHU or datagouv). Instead of clipping
+# the negative day, the correction is spread over the earlier days so the
+# repaired daily cases always add up to the reported cumulative totals.
+# Available rules, all computed at once for every region:
+#   'backfill':     remove the correction from the latest days first, the
+#                   cumulative becomes its running minimum from the end
+#   'proportional': scale down all earlier daily cases, in proportion of
+#                   their value, by the ratio of the totals after and before
+repair_rules = ('backfill', 'proportional')
+
+
+# Missing values of a (regions x days) array replaced by the last value before (0 at the start)
+def _fill_missing(values):
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    last = np.maximum.accumulate(np.where(missing, -1, np.arange(values.shape[1])), axis=1)
+    filled = np.where(last >= 0, np.take_along_axis(values, np.maximum(last, 0), axis=1), 0)
+    return np.maximum(filled, 0), missing
+
+
+# Repaired cumulative values for a (regions x days) array, missing values are kept missing
+def _repair_values(values, rule):
+    if rule not in repair_rules:
+        raise ValueError('Not valid repair rule %s, options are %s' %(rule, ', '.join(repair_rules)))
+    cum, missing = _fill_missing(values)
+    fixed = _repair_filled(cum, rule)
+    fixed[missing] = np.nan
+    return fixed
+
+
+# Repair of cumulative values without missing values
+def _repair_filled(cum, rule):
+    if rule == 'backfill':
+        return np.minimum.accumulate(cum[:, ::-1], axis=1)[:, ::-1]
+
+    elif rule == 'proportional':
+        # each drop scales all previous increments by total after / total before
+        factor = np.ones_like(cum)
+        drop = cum[:, 1:] < cum[:, :-1]
+        factor[:, 1:][drop] = cum[:, 1:][drop] / cum[:, :-1][drop]
+        # increments of day j are scaled by the factors of all later days
+        later = np.ones_like(cum)
+        later[:, :-1] = np.cumprod(factor[:, :0:-1], axis=1)[:, ::-1]
+        daily = np.diff(cum, axis=1, prepend=0).clip(0)
+        return np.cumsum(daily * later, axis=1)
+
+
+# Repair the negative daily increments of cumulative series
+def repair_cumulative(df_matrix, rule='backfill'):
+    '''Provide repaired cumulative values, without negative daily increments, and the audit of the corrections
+        df_matrix:  <dataframe> cumulative values, one row per region and one column per day
+                    (a Series is treated as one region)
+        rule:       <string> how corrections are spread over earlier days, 'backfill' or 'proportional'
+        Return (repaired values, audit) where audit is a dataframe with one row per negative increment:
+            region, date, correction (negative increment), total_before, total_after, rule
+        '''
+    is_series = isinstance(df_matrix, pd.Series)
+    df_in = df_matrix.to_frame().T if is_series else df_matrix
+    values = df_in.to_numpy(dtype=float)
+    fixed = _repair_values(values, rule)
+
+    # audit table of all negative increments, a drop across missing days is reported on the day after them
+    cum, _ = _fill_missing(values)
+    rows, cols = np.nonzero(cum[:, 1:] < cum[:, :-1])
+    audit = pd.DataFrame({
+        'region': df_in.index[rows],
+        'date': df_in.columns[cols + 1],
+        'correction': cum[rows, cols + 1] - cum[rows, cols],
+        'total_before': cum[rows, cols],
+        'total_after': cum[rows, cols + 1],
+        'rule': rule,
+    })
+
+    if rule == 'backfill' and np.issubdtype(df_in.to_numpy().dtype, np.integer):
+        fixed = dataPrecision.as_counts(fixed.astype(np.int64))
+    else:
+        fixed = dataPrecision.as_metric(fixed)
+    df_fixed = pd.DataFrame(fixed, index=df_in.index, columns=df_in.columns)
+    if is_series:
+        return df_fixed.iloc[0].rename(df_matrix.name), audit
+    return df_fixed, audit
+
+
+# Daily increments from a cumulative series, first day set to 0
+def daily_from_cumulative(data_ts, repair=None):
+    '''Provide the daily increments of a cumulative series as an array, with 0 for the first day
+        data_ts:    <timeserie/array> cumulative values
+        repair:     <string> None to clip negative increments to 0 (values are lost),
+                    otherwise the repair rule used to spread corrections, see repair_cumulative
+        '''
+    values = np.asarray(data_ts)
+    if repair is None:
+        return np.insert(np.diff(values).clip(0), 0, 0)
+    fixed = _repair_values(values[None, :], repair)[0]
+    if repair == 'backfill' and np.issubdtype(values.dtype, np.integer):
+        return dataPrecision.as_counts(np.insert(np.diff(fixed.astype(np.int64)), 0, 0))
+    return dataPrecision.as_metric(np.insert(np.diff(fixed), 0, 0))
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+import concurrent.futures
+import os
+import re
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Function library for the JHU daily reports (csse_covid_19_daily_reports),
+# one MM-DD-YYYY.csv file per day. The columns changed over time:
+#   until 02-29-2020:   Province/State, Country/Region, Last Update, Confirmed, Deaths, Recovered
+#   03-01-2020:         + Latitude, Longitude
+#   from 03-22-2020:    FIPS, Admin2, Province_State, Country_Region, Last_Update, Lat, Long_,
+#                       Confirmed, Deaths, Recovered, Active, Combined_Key
+#   later:              + Incidence_Rate & Case-Fatality_Ratio, renamed Incident_Rate & Case_Fatality_Ratio
+# All files are normalized to report_columns, parsed by a pool of processes
+# and kept in a cache so a new run only parses the new or modified files.
+# daily_reports_timeseries builds the wide layout of the JHU time series,
+# usable by dataFun.get_timeseries_from_JHU and dataHierarchy.HierarchyIndex.
+report_columns = ('date', 'FIPS', 'Admin2', 'Province_State', 'Country_Region', 'Lat', 'Long_',
+                  'Confirmed', 'Deaths', 'Recovered', 'Active', 'Incident_Rate', 'Case_Fatality_Ratio')
+report_fields = ('Confirmed', 'Deaths', 'Recovered', 'Active', 'Incident_Rate', 'Case_Fatality_Ratio')
+report_counts = ('Confirmed', 'Deaths', 'Recovered', 'Active')
+
+# Older column names
+_renamed_columns = {
+    'Province/State': 'Province_State',
+    'Country/Region': 'Country_Region',
+    'Last Update': 'Last_Update',
+    'Latitude': 'Lat',
+    'Longitude': 'Long_',
+    'Incidence_Rate': 'Incident_Rate',
+    'Case-Fatality_Ratio': 'Case_Fatality_Ratio',
+}
+
+# Country names used by the first reports, as named in the time series
+country_aliases = {
+    'Mainland China': 'China',
+    'Hong Kong': 'China',
+    'Macau': 'China',
+    'South Korea': 'Korea, South',
+    'Republic of Korea': 'Korea, South',
+    'Iran (Islamic Republic of)': 'Iran',
+    'Taiwan': 'Taiwan*',
+    'UK': 'United Kingdom',
+    'Viet Nam': 'Vietnam',
+    'Russian Federation': 'Russia',
+    'Czech Republic': 'Czechia',
+    'Republic of Moldova': 'Moldova',
+    'occupied Palestinian territory': 'West Bank and Gaza',
+    'Ivory Coast': "Cote d'Ivoire",
+    'The Bahamas': 'Bahamas',
+    'Bahamas, The': 'Bahamas',
+    'The Gambia': 'Gambia',
+    'Gambia, The': 'Gambia',
+    'Cape Verde': 'Cabo Verde',
+    'East Timor': 'Timor-Leste',
+    'Vatican City': 'Holy See',
+    'Republic of Ireland': 'Ireland',
+    'North Ireland': 'United Kingdom',
+}
+# Places reported as countries, kept as Province/State of their country
+_country_provinces = {'Hong Kong': 'Hong Kong', 'Macau': 'Macau'}
+
+_file_pattern = re.compile(r'^(\d{2})-(\d{2})-(\d{4})\.csv$')
+
+
+# Date of a daily report from its file name
+def report_date(file_name):
+    '''Provide the date of a daily report from its MM-DD-YYYY.csv file name, None for other files'''
+    match = _file_pattern.match(os.path.basename(file_name))
+    if match is None:
+        return None
+    month, day, year = match.groups()
+    return pd.Timestamp(int(year), int(month), int(day))
+
+
+# Parse and normalize one daily report
+def read_daily_report(path):
+    '''Provide a dataframe with the report_columns from one daily report file
+        path:   <string> path to a MM-DD-YYYY.csv file
+        '''
+    df = pd.read_csv(path, encoding='utf-8-sig', dtype={'FIPS': str})
+    df.columns = [_renamed_columns.get(c.strip(), c.strip()) for c in df.columns]
+
+    # text columns: strip, empty and 'None' values as missing
+    for col in ('Admin2', 'Province_State', 'Country_Region'):
+        if col in df.columns:
+            text = df[col].astype(str).str.strip()
+            df[col] = text.where(~df[col].isna() & ~text.isin(['', 'None', 'nan']))
+    country = df['Country_Region']
+    province = df['Province_State'] if 'Province_State' in df.columns else pd.Series(np.nan, index=df.index)
+    df['Province_State'] = province.where(~country.isin(list(_country_provinces)), country.map(_country_provinces))
+    df['Country_Region'] = country.replace(country_aliases)
+
+    df_out = pd.DataFrame({'date': report_date(path)}, index=df.index)
+    for col in report_columns[1:]:
+        if col not in df.columns:
+            df_out[col] = np.nan
+        elif col in report_fields or col in ('Lat', 'Long_'):
+            df_out[col] = pd.to_numeric(df[col], errors='coerce')
+        else:
+            df_out[col] = df[col]
+    # FIPS as integer code when given, e.g. '01001' & '1001.0' -> 1001
+    df_out['FIPS'] = pd.to_numeric(df_out['FIPS'], errors='coerce')
+    return df_out
+
+
+# Signature of a file, to detect modified files
+def _signature(path):
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+# Parse a directory of daily reports, only the new or modified files
+def ingest_daily_reports(directory, cache=None, workers=1, verbose=True):
+    '''Provide a dataframe with all the rows of all daily reports of a directory, normalized to report_columns
+        directory:  <string> folder with the MM-DD-YYYY.csv files (csse_covid_19_daily_reports)
+        cache:      <string> file keeping the parsed rows, the files parsed by a previous run
+                    and unchanged since are not parsed again. No cache if None
+        workers:    <int> number of processes parsing the files, 1 to parse in the current process
+        verbose:    <boolean> display the number of files parsed
+        '''
+    files = {name: os.path.join(directory, name) for name in sorted(os.listdir(directory))
+             if report_date(name) is not None}
+    signatures = {name: _signature(path) for name, path in files.items()}
+
+    # keep the rows of the unchanged files from the cache
+    cached_files, frames = {}, []
+    if cache is not None and os.path.exists(cache):
+        stored = pd.read_pickle(cache)
+        cached_files = {name: sig for name, sig in stored['files'].items() if signatures.get(name) == sig}
+        keep = stored['data']['file'].isin(list(cached_files))
+        frames.append(stored['data'][keep])
+    new_files = [name for name in files if name not in cached_files]
+
+    paths = [files[name] for name in new_files]
+    if workers > 1 and len(paths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(read_daily_report, paths, chunksize=max(1, len(paths) // (4 * workers))))
+    else:
+        parsed = [read_daily_report(path) for path in paths]
+    for name, df in zip(new_files, parsed):
+        frames.append(df.assign(file=name))
+    if verbose: print('%d daily reports parsed, %d from cache' %(len(new_files), len(cached_files)))
+
+    if frames:
+        df_all = pd.concat(frames, ignore_index=True)
+    else:
+        df_all = pd.DataFrame(columns=list(report_columns) + ['file'])
+    df_all = df_all.sort_values(['date', 'Country_Region', 'Province_State', 'Admin2'], kind='stable',
+                                na_position='first').reset_index(drop=True)
+    if cache is not None:
+        pd.to_pickle({'files': signatures, 'data': df_all}, cache)
+    return df_all.drop(columns='file')
+
+
+# Build the JHU time series layout from the daily reports
+def daily_reports_timeseries(df_reports, field='Confirmed'):
+    '''Provide a dataframe with the layout of the JHU time series files, one row per Province/State:
+    Province/State, Country/Region, Lat, Long, then one column per day ('1/22/20', ...)
+        df_reports: <dataframe> output of ingest_daily_reports
+        field:      <string> column of the reports, 'Confirmed', 'Deaths', 'Recovered' or 'Active'
+        Counties (Admin2) are summed within their Province/State. A place missing from a report
+        is 0 that day (e.g. the national row of a country once reported by province), days
+        without report file take the values of the last report.
+        '''
+    if field not in report_counts:
+        raise ValueError('Not valid field %s, options are %s' %(field, ', '.join(report_counts)))
+    # groupby drops NaN keys, provinces are grouped with '' for the mainland rows
+    df = df_reports.assign(Province_State=df_reports['Province_State'].fillna(''))
+    keys = ['Country_Region', 'Province_State']
+    values = df.groupby(keys + ['date'])[field].sum(min_count=1).unstack('date').fillna(0)
+    # one column per day as in the time series, the days without report file repeat the last report
+    if values.shape[1]:
+        values = values.reindex(columns=pd.date_range(values.columns.min(), values.columns.max()))
+    values = values.ffill(axis=1).fillna(0)
+    coords = df.groupby(keys)[['Lat', 'Long_']].mean().reindex(values.index)
+
+    dates = pd.DatetimeIndex(values.columns)
+    df_out = pd.DataFrame({
+        'Province/State': values.index.get_level_values('Province_State').to_numpy(),
+        'Country/Region': values.index.get_level_values('Country_Region').to_numpy(),
+        'Lat': coords['Lat'].to_numpy(),
+        'Long': coords['Long_'].to_numpy(),
+    })
+    df_out['Province/State'] = df_out['Province/State'].where(df_out['Province/State'] != '')
+    labels = ['%d/%d/%s' %(d.month, d.day, d.strftime('%y')) for d in dates]
+    df_values = pd.DataFrame(dataPrecision.as_counts(values.to_numpy(dtype=np.int64)), columns=labels)
+    return pd.concat([df_out, df_values], axis=1)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+import concurrent.futures
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Stochastic SIR model (see notebooks/test_graphs_functions/sir_model.ipynb
+# for the deterministic version). Many realizations are run together by
+# tau-leaping: at each step of tau days the state of all runs is one array
+# and the transitions are drawn at once,
+#   new infections ~ Binomial(S, 1 - exp(-beta * I / N * tau))
+#   new recoveries ~ Binomial(I, 1 - exp(-gamma * tau))
+# binomial draws never move more people than a compartment holds. The runs
+# are split in fixed batches of batch_runs realizations, each with its own
+# random generator spawned from the seed, so the draws do not depend on
+# the number of workers. In the current process the batches share one
+# state array and only the quantiles of each day are kept. With a process
+# pool, each worker runs a group of batches and sends back their daily
+# S & I; the parent joins them in batch order and takes the same exact
+# quantiles (days x runs values, a few MB for thousands of runs).
+#
+#   out = dataSIR.sir_ensemble(N=100000, I0=1, beta=.5, gamma=.16, days=80, runs=5000, seed=0)
+#   out['I'][0.5]       # median of the infected per day
+sir_outputs = ('S', 'I', 'R', 'new_cases', 'cumulative')
+# Realizations per batch, one random generator each
+batch_runs = 250
+
+
+# Random generators of the batches, reproducible from one seed
+def _batch_seeds(seed, num_batches):
+    if isinstance(seed, np.random.Generator):
+        seed = int(seed.integers(2**63))
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(num_batches)
+
+
+# Advance all runs of one day, each batch (slice of the runs) drawn from its own generator
+def _sir_day(S, I, N, beta, gamma, steps, batches):
+    dt = 1. / steps
+    p_rec = -np.expm1(-gamma * dt)
+    for _ in range(steps):
+        p_inf = -np.expm1(-beta * I / N * dt)
+        for part, rng in batches:
+            infections = rng.binomial(S[part], p_inf[part])
+            recoveries = rng.binomial(I[part], p_rec)
+            S[part] -= infections
+            I[part] += infections - recoveries
+    return S, I
+
+
+# Slices of the runs and generators of a list of (runs, seed) batches
+def _batch_parts(sizes, seeds):
+    edges = np.cumsum([0] + list(sizes))
+    return [(slice(a, b), np.random.default_rng(s)) for a, b, s in zip(edges[:-1], edges[1:], seeds)]
+
+
+# Values of one day of all runs
+def _day_values(S, I, S_prev, N):
+    return {'S': S, 'I': I, 'R': N - S - I, 'new_cases': S_prev - S, 'cumulative': N - S}
+
+
+# Summary of one day of all runs
+def _day_summary(S, I, S_prev, N, quantiles):
+    values = _day_values(S, I, S_prev, N)
+    return {key: np.append(np.quantile(v, quantiles), v.mean()) for key, v in values.items()}
+
+
+# Run a group of batches, return the daily S & I of their runs (days+1 x runs)
+def _sir_batches(args):
+    N, I0, R0, beta, gamma, days, steps, sizes, seeds = args
+    batches = _batch_parts(sizes, seeds)
+    runs = sum(sizes)
+    dtype = np.int32 if N < 2**31 else np.int64
+    S = np.full(runs, N - I0 - R0, dtype=np.int64)
+    I = np.full(runs, I0, dtype=np.int64)
+    S_days = np.empty((days + 1, runs), dtype=dtype)
+    I_days = np.empty((days + 1, runs), dtype=dtype)
+    S_days[0], I_days[0] = S, I
+    for d in range(1, days + 1):
+        S, I = _sir_day(S, I, N, beta, gamma, steps, batches)
+        S_days[d], I_days[d] = S, I
+    return S_days, I_days
+
+
+# Run an ensemble of stochastic SIR realizations
+def sir_ensemble(N, I0, R0=0, beta=.5, gamma=.16, days=80, runs=1000, tau=.25,
+                 quantiles=(.05, .25, .5, .75, .95), seed=None, workers=1):
+    '''Provide the quantiles per day of an ensemble of stochastic SIR realizations (tau-leaping)
+        N:          <int> total population
+        I0:         <int> initial number of infected
+        R0:         <int> initial number of recovered
+        beta:       <float> contact or transmission rate in 1/days
+        gamma:      <float> recovery rate in 1/days
+        days:       <int> number of days simulated
+        runs:       <int> number of realizations
+        tau:        <float> time step in days, rounded so a day is a whole number of steps
+        quantiles:  <list> quantiles computed per day over all runs
+        seed:       <int/SeedSequence/Generator> seed of the random draws, the output is reproducible
+                    for a given seed, whatever the number of workers
+        workers:    <int> number of processes, the batches of runs are split among them
+        Return a dictionary of dataframes (days x quantiles + 'mean'), keys:
+            'S', 'I', 'R':      compartments at the end of each day
+            'new_cases':        new infections during each day (0 for day 0)
+            'cumulative':       cumulative infections, N - S
+        '''
+    if I0 < 0 or R0 < 0 or I0 + R0 > N:
+        raise ValueError('Initial infected and recovered must be within the population')
+    if tau <= 0 or tau > 1:
+        raise ValueError('Time step tau must be within (0, 1] days')
+    steps = max(1, int(round(1. / tau)))
+    quantiles = list(quantiles)
+    index = pd.RangeIndex(days + 1, name='day')
+    columns = quantiles + ['mean']
+
+    sizes = [min(batch_runs, runs - start) for start in range(0, runs, batch_runs)]
+    seeds = _batch_seeds(seed, len(sizes))
+
+    if workers <= 1 or len(sizes) == 1:
+        # all runs in one state array, only the quantiles of each day are kept
+        batches = _batch_parts(sizes, seeds)
+        S = np.full(runs, N - I0 - R0, dtype=np.int64)
+        I = np.full(runs, I0, dtype=np.int64)
+        rows = [_day_summary(S, I, S, N, quantiles)]
+        for _ in range(days):
+            S_prev = S.copy()
+            S, I = _sir_day(S, I, N, beta, gamma, steps, batches)
+            rows.append(_day_summary(S, I, S_prev, N, quantiles))
+        return {key: pd.DataFrame([row[key] for row in rows], index=index, columns=columns) for key in sir_outputs}
+
+    # consecutive groups of batches, joined back in batch order
+    groups = [g for g in np.array_split(np.arange(len(sizes)), workers) if len(g)]
+    tasks = [(N, I0, R0, beta, gamma, days, steps, [sizes[k] for k in g], [seeds[k] for k in g]) for g in groups]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        results = list(pool.map(_sir_batches, tasks))
+    S_days = np.hstack([r[0] for r in results]).astype(np.int64)
+    I_days = np.hstack([r[1] for r in results]).astype(np.int64)
+    del results
+
+    rows = [_day_summary(S_days[0], I_days[0], S_days[0], N, quantiles)]
+    rows += [_day_summary(S_days[d], I_days[d], S_days[d - 1], N, quantiles) for d in range(1, days + 1)]
+    return {key: pd.DataFrame([row[key] for row in rows], index=index, columns=columns) for key in sir_outputs}
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Day-of-week reporting cycle of the daily counts. Every region follows
+#   log(1 + y(t)) = trend(t) + s(weekday(t))         ('multiplicative')
+#   y(t) = trend(t) + s(weekday(t))                  ('additive')
+# the trend is piecewise linear with a knot every knot_days days and the
+# seven weekday effects sum to 0. All regions share the same design
+# matrix (days x parameters), so the least squares problems of all regions
+# are one solve with one right-hand side per region.
+#
+#   df_daily = dataQuery.QuerySession(df_ctry).query().diff().clip(0).collect()
+#   out = dataSeasonal.weekly_decomposition(df_daily)
+#   out['adjusted']     # daily counts without the weekday cycle
+#   out['factors']      # (regions x weekdays), e.g. Monday .7, Friday 1.2
+seasonal_modes = ('multiplicative', 'additive')
+weekday_names = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+# Design matrix of the trend and the weekday effects
+def weekly_design(dates, knot_days=14):
+    '''Provide the (days x parameters) design matrix: piecewise linear trend (one hat function per knot)
+    then six weekday effects coded against Sunday, so the seven effects sum to 0
+        dates:      <DatetimeIndex> days of the series
+        knot_days:  <int> days between the knots of the trend
+        '''
+    dates = pd.DatetimeIndex(dates)
+    t = np.arange(len(dates), dtype=float)
+    knots = np.arange(0, max(len(dates) - 1, 1) + knot_days, knot_days, dtype=float)
+    # hat functions, linear interpolation between consecutive knots
+    trend = np.clip(1 - np.abs(t[:, None] - knots[None, :]) / knot_days, 0, None)
+    trend = trend[:, trend.any(axis=0)]
+
+    weekday = dates.dayofweek.to_numpy()
+    effects = (weekday[:, None] == np.arange(6)[None, :]).astype(float)
+    effects[weekday == 6] = -1
+    return np.hstack([trend, effects])
+
+
+# Decompose the daily counts of all regions
+def weekly_decomposition(df_daily, mode='multiplicative', knot_days=14):
+    '''Provide the trend, weekday factors, adjusted series and residuals of daily counts
+        df_daily:   <dataframe> daily counts, one row per region and one column per day (DatetimeIndex)
+        mode:       <string> 'multiplicative' (fit on log(1 + y), factors are ratios) or 'additive'
+        knot_days:  <int> days between the knots of the piecewise linear trend
+        Return a dictionary of dataframes:
+            'trend':    trend per region and day
+            'factors':  (regions x weekdays) ratio to the trend ('multiplicative') or difference ('additive')
+            'adjusted': daily counts without the weekday cycle, y / factor or y - effect
+            'residual': y - fitted, the fit being trend * factor or trend + effect
+        Missing values are ignored by the fit of their region
+        '''
+    if mode not in seasonal_modes:
+        raise ValueError('Not valid mode %s, options are %s' %(mode, ', '.join(seasonal_modes)))
+    dates = pd.DatetimeIndex(df_daily.columns)
+    values = df_daily.to_numpy(dtype=np.float64)
+    design = weekly_design(dates, knot_days)
+    num_trend = design.shape[1] - 6
+
+    target = np.log1p(np.clip(values, 0, None)) if mode == 'multiplicative' else values.copy()
+    missing = np.isnan(target)
+    coefs = np.zeros((len(values), design.shape[1]))
+    # one solve per pattern of missing days, usually a single one for all regions
+    patterns, groups = np.unique(missing, axis=0, return_inverse=True)
+    for k, pattern in enumerate(patterns):
+        keep = ~pattern
+        if keep.any():
+            rows = np.flatnonzero(groups.ravel() == k)
+            coefs[rows] = np.linalg.lstsq(design[keep], target[np.ix_(rows, keep)].T, rcond=None)[0].T
+
+    trend = coefs[:, :num_trend] @ design[:, :num_trend].T
+    effects = np.hstack([coefs[:, num_trend:], -coefs[:, num_trend:].sum(axis=1, keepdims=True)])
+    weekday = dates.dayofweek.to_numpy()
+    if mode == 'multiplicative':
+        # effects on the log scale, factors with a geometric mean of 1
+        factors = np.exp(effects)
+        fitted = np.expm1(trend + effects[:, weekday])
+        trend = np.expm1(trend)
+        adjusted = values / factors[:, weekday]
+    else:
+        factors = effects
+        fitted = trend + effects[:, weekday]
+        adjusted = values - effects[:, weekday]
+
+    def frame(data):
+        return pd.DataFrame(dataPrecision.as_metric(data), index=df_daily.index, columns=df_daily.columns)
+
+    return {
+        'trend': frame(trend),
+        'factors': pd.DataFrame(dataPrecision.as_metric(factors), index=df_daily.index, columns=list(weekday_names)),
+        'adjusted': frame(adjusted),
+        'residual': frame(values - fitted),
+    }
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Versioned store of the successive releases of a (regions x days) matrix,
+# JHU rewrites past values so a chart can only be reproduced from the data
+# published at that time. Each release is kept as a delta against the
+# previous one: the (row, column, old value, new value) of the changed
+# cells only, plus the rows and columns present in the release. Regions
+# and days get a fixed position when first seen, in order of appearance.
+# The matrix as of a release is rebuilt by replaying the deltas from the
+# closest keyframe, a full copy kept every `keyframe` releases once built.
+#
+#   store = SnapshotStore()
+#   store.add(dataFun.get_matrix_from_JHU(df_c), '2020-05-01')
+#   df_then = store.as_of('2020-05-01')
+#   store.revised_regions(last=7)
+
+
+class SnapshotStore:
+    '''Delta store of the releases of a cumulative matrix, with as-of reconstruction
+        keyframe:   <int> number of releases between two full copies kept to speed up as_of
+
+        add(df_matrix, release):    store a new release
+        as_of(date):                matrix as published at a date (last release before or on that date)
+        revisions(region, last):    table of the revised cells of past days
+        revised_regions(last):      regions with revised past days within the last releases
+        stats():                    table of the cells stored per release
+        save(path) / load(path):    store on disk as a numpy .npz file
+        '''
+
+    def __init__(self, keyframe=30):
+        self.keyframe = keyframe
+        self.releases = []
+        self._labels = []
+        self._dates = []
+        self._row_pos = {}
+        self._col_pos = {}
+        # per release: union shape, present rows & columns, changed cells
+        self._shapes = []
+        self._present = []
+        self._cells = []
+        self._keyframes = {}
+        self._current = np.zeros((0, 0), dtype=np.int64)
+
+    # Positions of labels in the store, new labels are appended
+    @staticmethod
+    def _positions(keys, known, ordered):
+        pos = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            if key not in known:
+                known[key] = len(ordered)
+                ordered.append(key)
+            pos[i] = known[key]
+        return pos
+
+    def add(self, df_matrix, release):
+        '''Store a new release as the delta against the previous one
+            df_matrix:  <dataframe> cumulative data, one row per region and one column per day,
+                        see dataFun.get_matrix_from_JHU
+            release:    <string/datetime> publication date, after the last release of the store
+            Return the number of cells stored for this release
+            '''
+        release = pd.Timestamp(release)
+        if self.releases and release <= self.releases[-1]:
+            raise ValueError('Release %s is not after the last release %s' %(release.date(), self.releases[-1].date()))
+        if not df_matrix.index.is_unique:
+            raise ValueError('Region labels of the release must be unique')
+
+        rows = self._positions(list(df_matrix.index), self._row_pos, self._labels)
+        cols = self._positions(list(pd.DatetimeIndex(df_matrix.columns)), self._col_pos, self._dates)
+        num_rows, num_cols = len(self._labels), len(self._dates)
+
+        # grow the current state, new cells start at 0
+        state = np.zeros((num_rows, num_cols), dtype=np.int64)
+        state[:self._current.shape[0], :self._current.shape[1]] = self._current
+
+        block = df_matrix.fillna(0).to_numpy(dtype=np.int64)
+        old = state[np.ix_(rows, cols)]
+        r, c = np.nonzero(block != old)
+        cells = (rows[r], cols[c], old[r, c], block[r, c])
+        state[cells[0], cells[1]] = cells[3]
+
+        self.releases.append(release)
+        self._shapes.append((num_rows, num_cols))
+        self._present.append((rows, cols))
+        self._cells.append(cells)
+        self._current = state
+        return r.size
+
+    # Index of the last release published before or on a date
+    def _release_index(self, date):
+        if not self.releases:
+            raise ValueError('The store is empty')
+        if date is None:
+            return len(self.releases) - 1
+        k = int(pd.DatetimeIndex(self.releases).searchsorted(pd.Timestamp(date), side='right')) - 1
+        if k < 0:
+            raise ValueError('No release before %s, first release is %s' %(date, self.releases[0].date()))
+        return k
+
+    # Full (union rows x union columns) state after release k
+    def _state(self, k, replay=False):
+        if k == len(self.releases) - 1 and not replay:
+            return self._current
+        start = max([j for j in self._keyframes if j <= k], default=-1)
+        num_rows, num_cols = self._shapes[k]
+        state = np.zeros((num_rows, num_cols), dtype=np.int64)
+        if start >= 0:
+            kf = self._keyframes[start]
+            state[:kf.shape[0], :kf.shape[1]] = kf
+
+        for j in range(start + 1, k + 1):
+            rows, cols, _, values = self._cells[j]
+            state[rows, cols] = values
+            if self.keyframe and (j + 1) % self.keyframe == 0 and j not in self._keyframes:
+                self._keyframes[j] = state[:self._shapes[j][0], :self._shapes[j][1]].copy()
+        return state
+
+    def as_of(self, date=None, release=None):
+        '''Provide the matrix (regions x days) as published at a date
+            date:       <string/datetime> the last release published before or on that date is used,
+                        last release if None
+            release:    <int> position of the release in store.releases, used instead of date
+            '''
+        k = self._release_index(date) if release is None else range(len(self.releases))[release]
+        rows, cols = self._present[k]
+        order = np.argsort(np.array(self._dates, dtype='datetime64[ns]')[cols], kind='stable')
+        cols = cols[order]
+        values = self._state(k)[np.ix_(rows, cols)]
+        return pd.DataFrame(dataPrecision.as_counts(values),
+                            index=pd.Index([self._labels[i] for i in rows], name='region'),
+                            columns=pd.DatetimeIndex([self._dates[j] for j in cols]))
+
+    def revisions(self, region=None, last=None):
+        '''Provide the table of the revised cells, changes of days already published by the previous release
+            region: <string> only the revisions of this region, all regions if None
+            last:   <int> only the last releases, all releases if None
+            Columns: release, region, date, old, new
+            '''
+        first = 1 if last is None else max(1, len(self.releases) - last)
+        frames = []
+        for k in range(first, len(self.releases)):
+            rows, cols, old, new = self._cells[k]
+            prev_rows, prev_cols = self._present[k - 1]
+            # cells published by the previous release
+            published = np.isin(rows, prev_rows) & np.isin(cols, prev_cols)
+            if region is not None:
+                published &= rows == self._row_pos.get(region, -1)
+            idx = np.flatnonzero(published)
+            frames.append(pd.DataFrame({
+                'release': self.releases[k],
+                'region': [self._labels[i] for i in rows[idx]],
+                'date': pd.DatetimeIndex([self._dates[j] for j in cols[idx]]),
+                'old': old[idx],
+                'new': new[idx],
+            }))
+        if not frames:
+            return pd.DataFrame(columns=['release', 'region', 'date', 'old', 'new'])
+        return pd.concat(frames, ignore_index=True)
+
+    def revised_regions(self, last=1):
+        '''Provide the regions with revised past days within the last releases
+            last:   <int> number of releases considered
+            Return a dataframe indexed by region, sorted by number of revised cells:
+                revised_cells, releases (number of releases revising the region), net_change, last_revision
+            '''
+        df_rev = self.revisions(last=last)
+        if df_rev.empty:
+            return pd.DataFrame(columns=['revised_cells', 'releases', 'net_change', 'last_revision'],
+                                index=pd.Index([], name='region'))
+        df_rev['change'] = df_rev['new'] - df_rev['old']
+        groups = df_rev.groupby('region')
+        df_out = pd.DataFrame({
+            'revised_cells': groups.size(),
+            'releases': groups['release'].nunique(),
+            'net_change': groups['change'].sum(),
+            'last_revision': groups['release'].max(),
+        })
+        return df_out.sort_values('revised_cells', ascending=False, kind='stable')
+
+    def stats(self):
+        '''Provide a table per release with the size of the release and the number of cells stored'''
+        return pd.DataFrame({
+            'regions': [len(p[0]) for p in self._present],
+            'days': [len(p[1]) for p in self._present],
+            'stored_cells': [len(c[0]) for c in self._cells],
+        }, index=pd.DatetimeIndex(self.releases, name='release'))
+
+    def save(self, path):
+        '''Write the store to a numpy .npz file'''
+        def concat(arrays):
+            return np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+
+        np.savez_compressed(
+            path,
+            keyframe=np.array(self.keyframe),
+            releases=np.array(self.releases, dtype='datetime64[ns]'),
+            labels=np.array(self._labels, dtype=str),
+            dates=np.array(self._dates, dtype='datetime64[ns]'),
+            shapes=np.array(self._shapes, dtype=np.int64).reshape(-1, 2),
+            present_rows=concat([p[0] for p in self._present]),
+            present_cols=concat([p[1] for p in self._present]),
+            present_sizes=np.array([(len(p[0]), len(p[1])) for p in self._present], dtype=np.int64).reshape(-1, 2),
+            cells=np.hstack([np.vstack(c) for c in self._cells]) if self._cells else np.zeros((4, 0), dtype=np.int64),
+            cell_sizes=np.array([len(c[0]) for c in self._cells], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path):
+        '''Read a store written by save'''
+        with np.load(path, allow_pickle=False) as data:
+            store = cls(keyframe=int(data['keyframe']))
+            store._labels = [str(label) for label in data['labels']]
+            store._dates = list(pd.DatetimeIndex(data['dates']))
+            store._row_pos = {key: pos for pos, key in enumerate(store._labels)}
+            store._col_pos = {key: pos for pos, key in enumerate(store._dates)}
+            store._shapes = [tuple(s) for s in data['shapes']]
+
+            row_ends = np.cumsum(data['present_sizes'][:, 0])
+            col_ends = np.cumsum(data['present_sizes'][:, 1])
+            cell_ends = np.cumsum(data['cell_sizes'])
+            rows = np.split(data['present_rows'], row_ends[:-1])
+            cols = np.split(data['present_cols'], col_ends[:-1])
+            cells = np.split(data['cells'], cell_ends[:-1], axis=1)
+            for release, r, c, cell in zip(pd.DatetimeIndex(data['releases']), rows, cols, cells):
+                store.releases.append(release)
+                store._present.append((r, c))
+                store._cells.append(tuple(cell))
+
+        if store.releases:
+            store._current = store._state(len(store.releases) - 1, replay=True)
+        return store
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+# import local functions
+import covid19_analysis.dataPrecision as dataPrecision
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Function library for the JHU US county time series
+# (time_series_covid19_confirmed_US.csv & time_series_covid19_deaths_US.csv).
+# Counties are mapped to their state through the FIPS code, rows are
+# sorted by state so the counties of a state are a contiguous block and
+# all state roll-ups come from one grouped sum.
+
+
+# Find the state FIPS code of each row of the US dataset
+def state_codes(df_us):
+    '''Provide the state FIPS code of each row of the JHU US dataset
+        df_us:  <dataframe> Dataset read from JHU repository (US time series)
+        Counties use FIPS // 1000, territories have a 2 digits FIPS, 'Out of XX' (800XX)
+        and 'Unassigned' (900XX) rows use the last digits. Rows without FIPS (e.g. Dukes and
+        Nantucket, Kansas City) take the code of the other rows of their Province_State,
+        places without any FIPS (e.g. cruise ships) get their own code from 1000 on
+        '''
+    fips = pd.to_numeric(df_us['FIPS'], errors='coerce').to_numpy(dtype=np.float64)
+    codes = np.where(fips < 100, fips, np.where(fips >= 80000, fips % 1000, fips // 1000))
+    names = df_us['Province_State'].astype(str).to_numpy()
+    known = ~np.isnan(fips)
+    if (~known).any():
+        # most frequent code of every state name among the rows with FIPS
+        by_name = pd.Series(codes[known]).groupby(names[known]).agg(lambda c: c.mode().iloc[0])
+        mapped = pd.Series(names[~known]).map(by_name).to_numpy(dtype=np.float64, copy=True)
+        unknown = np.isnan(mapped)
+        mapped[unknown] = 1000 + pd.factorize(names[~known][unknown])[0]
+        codes[~known] = mapped
+    return codes.astype(np.int64)
+
+
+# Position of the first day column of the US dataset
+def _first_date_col(df_us):
+    if 'Population' in df_us.columns:
+        return df_us.columns.get_loc('Population') + 1
+    return df_us.columns.get_loc('Combined_Key') + 1
+
+
+class CountyIndex:
+    '''Index of the JHU US dataset: county -> state -> nation
+        df_us:  <dataframe> Dataset read from JHU repository (US time series)
+
+        county(fips):                   timeseries of a county from its FIPS code
+        county_by_name(state, county):  timeseries of a county from its state and Admin2 names
+        state(state):                   timeseries of a state from its name or FIPS code
+        nation():                       timeseries of the whole US
+        counties(state):                dataframe (counties x days) of one state, without copy
+        matrix(level):                  dataframe for all 'county' or 'state' rows
+        population:                     Series with the population per county (deaths file only)
+        '''
+
+    def __init__(self, df_us):
+        codes = state_codes(df_us)
+        order = np.argsort(codes, kind='stable')
+        df_us = df_us.iloc[order]
+        codes = codes[order]
+        first_col = _first_date_col(df_us)
+
+        self.dates = pd.to_datetime(df_us.columns[first_col:])
+        self._values = dataPrecision.as_counts(df_us.iloc[:, first_col:].fillna(0).to_numpy(dtype=np.int64))
+        self._fips = df_us['FIPS'].to_numpy()
+        self._names = df_us['Admin2'].fillna('').to_numpy()
+        self.population = df_us['Population'].set_axis(df_us['Combined_Key']) if 'Population' in df_us.columns else None
+
+        # state blocks: [start, end) rows of each state code
+        self.state_fips, starts = np.unique(codes, return_index=True)
+        self._bounds = np.append(starts, len(codes))
+        self.states = pd.Index(df_us['Province_State'].to_numpy()[starts], name='state')
+
+        # one grouped sum for all states, the nation from the states
+        if len(codes):
+            self._state_values = dataPrecision.as_counts(np.add.reduceat(self._values, starts, axis=0, dtype=np.int64))
+        else:
+            self._state_values = np.zeros((0, len(self.dates)), dtype=dataPrecision.count_dtype())
+        self._nation = dataPrecision.as_counts(self._state_values.sum(axis=0, dtype=np.int64))
+
+        # lookups by FIPS, by state and by (state, county) names
+        if not self.states.is_unique:
+            duplicated = self.states[self.states.duplicated()].unique()
+            raise ValueError('Several state codes for the states %s' %(', '.join(map(str, duplicated))))
+        valid = ~pd.isna(self._fips)
+        self._by_fips = dict(zip(self._fips[valid].astype(np.int64), np.flatnonzero(valid)))
+        self._by_state = {name: pos for pos, name in enumerate(self.states)}
+        self._by_state.update({int(code): pos for pos, code in enumerate(self.state_fips)})
+        self._by_name = {key: pos for pos, key in enumerate(zip(df_us['Province_State'], self._names))}
+        self._labels = pd.Index(df_us['Combined_Key'].to_numpy(), name='county')
+
+    # Provide a row of values as a timeseries
+    def _series(self, row):
+        return pd.Series(data=row, index=self.dates)
+
+    def county(self, fips):
+        '''Provide the timeseries of a county from its FIPS code'''
+        return self._series(self._values[self._by_fips[int(fips)]])
+
+    def county_by_name(self, state_name, county_name):
+        '''Provide the timeseries of a county from its state name and county (Admin2) name'''
+        return self._series(self._values[self._by_name[(state_name, county_name)]])
+
+    def state(self, state):
+        '''Provide the timeseries of a state from its name or its FIPS code'''
+        return self._series(self._state_values[self._by_state[state]])
+
+    def nation(self):
+        '''Provide the timeseries for the whole US'''
+        return self._series(self._nation)
+
+    def counties(self, state):
+        '''Provide the dataframe (counties x days) of a state from its name or its FIPS code'''
+        pos = self._by_state[state]
+        start, end = self._bounds[pos], self._bounds[pos + 1]
+        return pd.DataFrame(self._values[start:end], index=self._labels[start:end], columns=self.dates)
+
+    def matrix(self, level='county'):
+        '''Provide all the rows of a level, 'county' or 'state', as a dataframe (rows x days)'''
+        if level == 'county':
+            return pd.DataFrame(self._values, index=self._labels, columns=self.dates)
+        elif level == 'state':
+            return pd.DataFrame(self._state_values, index=self.states, columns=self.dates)
+        raise ValueError('Not valid level %s, options are county and state' %(level))
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Console script generating the charts of dataPlot and dataPlot_datagouv
+from local source files, without notebook and without display.
+
+Example, nightly report for three countries and two departments on four cores:
+
+    covid19_report --cases confirmed.csv --death deaths.csv --recov recovered.csv
+        --datagouv donnees-hospitalieres.csv --countries France Italy Spain
+        --departments 75 13 --charts all --output report --workers 4
+"""
+
+import argparse
+import concurrent.futures
+import importlib.util
+import logging
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+
+from covid19_analysis import __version__
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+_logger = logging.getLogger(__name__)
+
+# Charts drawn for each country, for the list of countries, for each department and for all regions
+country_charts = ('cum', 'rates', 'daily', 'growth')
+group_charts = ('last_daily', 'growing_ratio', 'countries_comp')
+dep_charts = ('dep_hosp', 'dep_daily', 'dep_cumulative')
+region_charts = ('regions_comp',)
+all_charts = country_charts + group_charts + dep_charts + region_charts
+
+# Data loaded once per worker process, for the source files and precision in _worker_data['key']
+_worker_data = {}
+
+
+def parse_args(args):
+    '''Parse command line parameters, return a argparse.Namespace
+        args:   <list> command line parameters as list of strings
+        '''
+    parser = argparse.ArgumentParser(
+        description='Generate covid19_analysis charts from local source files')
+    parser.add_argument('--version', action='version', version='covid19_analysis {ver}'.format(ver=__version__))
+    parser.add_argument('--cases', help='JHU confirmed cases time series (csv)')
+    parser.add_argument('--death', help='JHU deaths time series (csv)')
+    parser.add_argument('--recov', help='JHU recovered time series (csv)')
+    parser.add_argument('--datagouv', help='datagouv hospital data per department (csv, ; separated)')
+    parser.add_argument('--datagouv-age', dest='datagouv_age', help='datagouv hospital data per region and age class (csv, ; separated)')
+    parser.add_argument('--countries', nargs='*', default=[], help='JHU country names')
+    parser.add_argument('--departments', nargs='*', default=[], help='datagouv department codes')
+    parser.add_argument('--charts', nargs='*', default=['all'], choices=('all',) + all_charts, metavar='CHART',
+                        help='charts to render, all by default, options: %s' %(', '.join(all_charts)))
+    parser.add_argument('-o', '--output', default='.', help='output folder')
+    parser.add_argument('-f', '--format', default='html', choices=('html', 'png', 'svg', 'pdf'),
+                        help='output format, static images require orca (plotly 4.5) or kaleido (plotly >= 4.9)')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--dtype', default='default', choices=('default', 'compact', 'auto'),
+                        help='precision of the loaded data, compact & auto use about half the memory')
+    parser.add_argument('-v', '--verbose', dest='loglevel', help='set loglevel to INFO',
+                        action='store_const', const=logging.INFO)
+    parser.add_argument('-vv', '--very-verbose', dest='loglevel', help='set loglevel to DEBUG',
+                        action='store_const', const=logging.DEBUG)
+    return parser.parse_args(args)
+
+
+def setup_logging(loglevel):
+    '''Setup basic logging
+        loglevel:   <int> minimum loglevel for emitting messages
+        '''
+    logformat = '[%(asctime)s] %(levelname)s:%(name)s:%(message)s'
+    logging.basicConfig(level=loglevel, stream=sys.stdout, format=logformat, datefmt='%Y-%m-%d %H:%M:%S')
+
+
+# Build the list of (chart, target) to render
+def build_tasks(charts, countries, departments, has_age=False):
+    '''Provide the list of (chart, target) tasks, target is a country, a department code or None'''
+    if 'all' in charts:
+        charts = all_charts
+    tasks = []
+    for chart in charts:
+        if chart in country_charts:
+            tasks += [(chart, c) for c in countries]
+        elif chart in group_charts and countries:
+            tasks.append((chart, None))
+        elif chart in dep_charts:
+            tasks += [(chart, d) for d in departments]
+        elif chart in region_charts and has_age:
+            tasks.append((chart, None))
+    return tasks
+
+
+# Engine exporting the static images
+def image_engine():
+    '''Provide the name of the engine exporting static images, 'kaleido' or 'orca', None if none is installed'''
+    if importlib.util.find_spec('kaleido') is not None:
+        return 'kaleido'
+    try:
+        import plotly.io.orca as orca
+        orca.validate_executable()
+        return 'orca'
+    except (ImportError, AttributeError, ValueError):
+        return None
+
+
+# Read the source files, once in each process (a process pool initializer needs python 3.7)
+def _load_data(paths, dtype_mode='default'):
+    key = (sorted(paths.items()), dtype_mode)
+    if _worker_data.get('key') == key:
+        return _worker_data
+
+    import covid19_analysis.dataHierarchy as dataHierarchy
+    import covid19_analysis.dataPrecision as dataPrecision
+
+    t_start = time.perf_counter()
+    dataPrecision.set_dtype_mode(dtype_mode)
+    data = {'key': key, 'paths': paths}
+    for name in ('cases', 'death', 'recov'):
+        if paths.get(name):
+            data[name] = dataPrecision.compact_frame(pd.read_csv(paths[name]))
+            data[name + '_index'] = dataHierarchy.HierarchyIndex(data[name])
+    if paths.get('datagouv'):
+        df_gouv = dataPrecision.compact_frame(pd.read_csv(paths['datagouv'], sep=';', dtype={'dep': str}))
+        data['datagouv'] = df_gouv[df_gouv['sexe'] == 0]
+    if paths.get('datagouv_age'):
+        data['datagouv_age'] = dataPrecision.compact_frame(pd.read_csv(paths['datagouv_age'], sep=';'))
+    data['load_time'] = time.perf_counter() - t_start
+    data['load_reported'] = False
+
+    _worker_data.clear()
+    _worker_data.update(data)
+    return _worker_data
+
+
+# Build the figure of one task
+def build_figure(chart, target, data):
+    '''Provide the plotly figure of one chart
+        chart:  <string> chart type, see all_charts
+        target: <string> country name or department code, None for charts of several places
+        data:   <dict> source dataframes as loaded by the workers
+        '''
+    import covid19_analysis.dataPlot as dataPlot
+    import covid19_analysis.dataPlot_datagouv as dataPlot_datagouv
+
+    if chart in country_charts:
+        ts_case = data['cases_index'].country(target)
+        ts_death = data['death_index'].country(target)
+        ts_recov = data['recov_index'].country(target)
+        if chart == 'cum':
+            return dataPlot.disp_cum_jhu(ts_case, ts_recov, ts_death, target, show=False)
+        if chart == 'rates':
+            return dataPlot.disp_country_rates_jhu(ts_case, ts_recov, ts_death, target, show=False)
+        if chart == 'daily':
+            df_ts = pd.DataFrame({'cases': ts_case, 'death': ts_death, 'recov': ts_recov})
+            return dataPlot.disp_daily_cases(df_ts, target, show=False)
+        return dataPlot.growth_rates(ts_case, show=False)
+
+    if chart in group_charts:
+        countries = data['countries']
+        if chart == 'last_daily':
+            return dataPlot.last_daily_cases(data['cases'], countries, show=False)
+        if chart == 'growing_ratio':
+            return dataPlot.growing_ratio_countries(data['cases'], countries, show=False)
+        return dataPlot.disp_countries_comp(data['cases'], countries, show=False)
+
+    if chart in dep_charts:
+        df_dep = data['datagouv'][data['datagouv']['dep'] == target]
+        name = 'département ' + target
+        if chart == 'dep_hosp':
+            return dataPlot_datagouv.disp_dep_hosp(df_dep, name, show=False)
+        if chart == 'dep_daily':
+            return dataPlot_datagouv.disp_daily_cases(df_dep, name, show=False)
+        return dataPlot_datagouv.disp_cumulative(df_dep, name, show=False)
+
+    return dataPlot_datagouv.disp_regions_comp(data['datagouv_age'], show=False)
+
+
+# Render and write one chart in a worker process
+def _render(task):
+    chart, target, countries, output, fmt, paths, dtype_mode = task
+    data = _load_data(paths, dtype_mode)
+    data['countries'] = countries
+
+    t_start = time.perf_counter()
+    fig = build_figure(chart, target, data)
+    t_render = time.perf_counter()
+
+    name = chart if target is None else chart + '_' + re.sub(r'[^\w-]+', '_', target)
+    path = os.path.join(output, name + '.' + fmt)
+    if fmt == 'html':
+        fig.write_html(path, include_plotlyjs='cdn')
+    else:
+        fig.write_image(path)
+    t_write = time.perf_counter()
+
+    # load time is reported by the first task of each worker
+    load_time = 0. if data['load_reported'] else data['load_time']
+    data['load_reported'] = True
+    return {'chart': chart, 'path': path, 'load': load_time,
+            'render': t_render - t_start, 'write': t_write - t_render}
+
+
+# Run all tasks, in this process or in a pool of workers
+def run_report(paths, tasks, countries, output='.', fmt='html', workers=1, dtype_mode='default'):
+    '''Render all tasks and return the list of results with their timings
+        paths:      <dict> source files, keys cases, death, recov, datagouv & datagouv_age
+        tasks:      <list> (chart, target) tasks, see build_tasks
+        countries:  <list> countries used by the charts of several countries
+        output:     <string> output folder
+        fmt:        <string> output format, html, png, svg or pdf
+        workers:    <int> number of worker processes, 1 to run in the current process
+        dtype_mode: <string> precision policy of the loaded data, see dataPrecision
+        '''
+    os.makedirs(output, exist_ok=True)
+    # every task carries the source files, each worker reads them with its first task
+    jobs = [(chart, target, countries, output, fmt, paths, dtype_mode) for chart, target in tasks]
+    if workers <= 1:
+        return [_render(job) for job in jobs]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render, jobs))
+
+
+# Display the timings per stage and per chart
+def print_timings(results, wall_time, workers):
+    '''Print the time spent per stage (summed over workers) and per chart type'''
+    print('%-16s %10s' %('stage', 'time [s]'))
+    for stage in ('load', 'render', 'write'):
+        print('%-16s %10.3f' %(stage, sum(r[stage] for r in results)))
+    print('%-16s %10.3f  (%d charts, %d workers)' %('wall', wall_time, len(results), workers))
+
+    print('\n%-16s %6s %10s %10s' %('chart', 'count', 'render', 'write'))
+    for chart in all_charts:
+        res = [r for r in results if r['chart'] == chart]
+        if res:
+            print('%-16s %6d %10.3f %10.3f' %(chart, len(res), sum(r['render'] for r in res), sum(r['write'] for r in res)))
+
+
+def main(args):
+    '''Main entry point allowing external calls
+        args:   <list> command line parameters as list of strings
+        '''
+    args = parse_args(args)
+    setup_logging(args.loglevel)
+
+    paths = {'cases': args.cases, 'death': args.death, 'recov': args.recov,
+             'datagouv': args.datagouv, 'datagouv_age': args.datagouv_age}
+    tasks = build_tasks(args.charts, args.countries, args.departments, has_age=args.datagouv_age is not None)
+
+    # check the files needed by the requested charts
+    needed = set()
+    for chart, _ in tasks:
+        if chart in country_charts:
+            needed.update(('cases', 'death', 'recov'))
+        elif chart in group_charts:
+            needed.add('cases')
+        elif chart in dep_charts:
+            needed.add('datagouv')
+    missing = sorted(n for n in needed if not paths[n])
+    if missing:
+        _logger.error('Missing source files: %s', ', '.join('--' + n for n in missing))
+        return 1
+    if not tasks:
+        _logger.warning('Nothing to render, check the countries, departments and charts options')
+        return 0
+    if args.format != 'html' and image_engine() is None:
+        _logger.error('Static images need orca (plotly 4.5) or kaleido (plotly >= 4.9), use --format html otherwise')
+        return 1
+
+    _logger.info('Rendering %d charts with %d workers', len(tasks), args.workers)
+    t_start = time.perf_counter()
+    results = run_report(paths, tasks, args.countries, args.output, args.format, args.workers, args.dtype)
+    print_timings(results, time.perf_counter() - t_start, args.workers)
+    return 0
+
+
+def run():
+    '''Entry point for console_scripts'''
+    sys.exit(main(sys.argv[1:]))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import pandas as pd
+import numpy as np
+
+from covid19_analysis.dataAnomaly import rolling_median_mad, anomaly_mask
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Rolling median & MAD of one row by pandas, windows completed as in rolling_median_mad
+def brute_force(row, window, center):
+    half = window // 2
+    pad = (half, half) if center else (window - 1, 0)
+    padded = pd.Series(np.pad(np.nan_to_num(row), pad, mode='reflect'))
+    rolling = padded.rolling(window)
+    median = rolling.median().to_numpy()[window - 1:]
+    mad = rolling.apply(lambda a: np.median(np.abs(a - np.median(a))), raw=True).to_numpy()[window - 1:]
+    return median, mad
+
+
+@pytest.mark.parametrize('window', [3, 7, 15])
+@pytest.mark.parametrize('center', [True, False])
+def test_rolling_median_mad_brute_force(window, center):
+    rng = np.random.default_rng(window)
+    # few distinct values for many ties, some missing days
+    values = rng.integers(0, 6, (5, 60)).astype(float)
+    values[rng.random(values.shape) < .1] = np.nan
+    values[1] = 3.
+    median, mad = rolling_median_mad(values, window, center)
+    for k, row in enumerate(values):
+        exp_median, exp_mad = brute_force(row, window, center)
+        np.testing.assert_array_equal(median[k], exp_median)
+        np.testing.assert_array_equal(mad[k], exp_mad)
+
+
+def test_anomaly_mask_spike():
+    values = pd.Series(np.r_[np.full(20, 100.), 1000., np.full(20, 100.), np.nan])
+    mask = anomaly_mask(values)
+    assert mask.sum() == 1 and mask.iloc[20]
+    assert not mask.iloc[-1]
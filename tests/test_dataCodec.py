@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import pandas as pd
+import numpy as np
+
+import covid19_analysis.dataCodec as dataCodec
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Cumulative counts with negative corrections, constant rows and values at the integer limits
+def synthetic_values():
+    rng = np.random.default_rng(0)
+    values = np.cumsum(rng.poisson(50, (4, 30)) * rng.choice([1, -1], (4, 30), p=[.9, .1]), axis=1)
+    limits = np.iinfo(np.int64)
+    extra = np.array([
+        np.zeros(30, dtype=np.int64),
+        np.resize([np.iinfo(np.int32).max, np.iinfo(np.int32).min, 2**31, -2**31 - 1], 30),
+        np.resize([limits.max, limits.min, 0, -1, limits.max], 30),
+    ])
+    return np.vstack([values, extra])
+
+
+@pytest.mark.parametrize('compress', dataCodec.codec_compressors)
+def test_values_round_trip(compress):
+    values = synthetic_values()
+    data = dataCodec.encode_values(values, compress)
+    np.testing.assert_array_equal(dataCodec.decode_values(data, values.shape, compress), values)
+
+
+def test_varint_limits():
+    values = np.array([0, 1, 127, 128, 2**32, 2**63, 2**64 - 1], dtype=np.uint64)
+    np.testing.assert_array_equal(dataCodec.varint_decode(dataCodec.varint_encode(values)), values)
+    with pytest.raises(ValueError):
+        dataCodec.varint_decode(dataCodec.varint_encode(values)[:-1])
+
+
+def test_matrix_round_trip(tmp_path):
+    values = synthetic_values()[:4]
+    df = pd.DataFrame(values, index=pd.Index(['France', 'Italy', 'Spain', 'US'], name='country'),
+                      columns=pd.date_range('2020-01-22', periods=values.shape[1]))
+    path = str(tmp_path / 'matrix.c19')
+    dataCodec.write_matrix(path, df, 'lzma')
+    df_read = dataCodec.read_matrix(path)
+    np.testing.assert_array_equal(df_read.to_numpy(), values)
+    assert df_read.index.equals(df.index) and df_read.index.name == 'country'
+    assert df_read.columns.equals(df.columns)
+
+    daily = dataCodec.decode_matrix(dataCodec.encode_matrix(df), daily=True, clip=False)
+    np.testing.assert_array_equal(daily.to_numpy()[:, 1:], np.diff(values, axis=1))
+    clipped = dataCodec.decode_matrix(dataCodec.encode_matrix(df), daily=True)
+    np.testing.assert_array_equal(clipped.to_numpy()[:, 1:], np.diff(values, axis=1).clip(0))
+    assert (clipped.to_numpy()[:, 0] == 0).all()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+import covid19_analysis.dataFetch as dataFetch
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Stand-in server: /cases.csv & /hosp.csv with validators, every file fails while broken is set
+class StandInHandler(BaseHTTPRequestHandler):
+    files = {
+        '/cases.csv': (b'Province/State,Country/Region,Lat,Long,1/22/20\n,France,46.2,2.2,0\n', '"v1"'),
+        '/hosp.csv': (b'dep;sexe;jour;hosp\n75;0;2020-03-18;10\n', '"h1"'),
+    }
+    last_modified = 'Wed, 20 May 2020 10:00:00 GMT'
+    broken = False
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')))
+        if self.broken or self.path not in self.files:
+            self.send_response(500 if self.broken else 404)
+            self.end_headers()
+            return
+        content, etag = self.files[self.path]
+        if self.headers.get('If-None-Match') == etag or self.headers.get('If-Modified-Since') == self.last_modified:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.last_modified)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandInHandler.broken = False
+    StandInHandler.requests = []
+    httpd = HTTPServer(('127.0.0.1', 0), StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' %(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def sources(url):
+    return {'cases': url + '/cases.csv', 'datagouv': url + '/hosp.csv'}
+
+
+def test_download_200(server, tmp_path):
+    contents = dataFetch.fetch_sources(sources(server), cache_dir=str(tmp_path), retries=0)
+    assert contents['cases'] == StandInHandler.files['/cases.csv'][0]
+    assert contents['datagouv'] == StandInHandler.files['/hosp.csv'][0]
+    assert (tmp_path / 'cases.json').is_file() and (tmp_path / 'cases.data').is_file()
+    df = dataFetch.read_sources(contents)
+    assert df['datagouv']['hosp'].iloc[0] == 10
+    assert all(etag is None for _, etag, _ in StandInHandler.requests)
+
+
+def test_not_modified_304(server, tmp_path):
+    dataFetch.fetch_sources(sources(server), cache_dir=str(tmp_path), retries=0)
+    StandInHandler.requests = []
+    contents = dataFetch.fetch_sources(sources(server), cache_dir=str(tmp_path), retries=0)
+    assert contents['cases'] == StandInHandler.files['/cases.csv'][0]
+    sent = dict((path, (etag, since)) for path, etag, since in StandInHandler.requests)
+    assert sent['/cases.csv'] == ('"v1"', StandInHandler.last_modified)
+    assert sent['/hosp.csv'] == ('"h1"', StandInHandler.last_modified)
+
+
+def test_fallback_to_cache(server, tmp_path):
+    dataFetch.fetch_sources(sources(server), cache_dir=str(tmp_path), retries=0)
+    StandInHandler.broken = True
+    contents = dataFetch.fetch_sources(sources(server), cache_dir=str(tmp_path), retries=0)
+    assert contents['cases'] == StandInHandler.files['/cases.csv'][0]
+
+    # no previous download, the error is raised
+    session = dataFetch.build_session(retries=0)
+    with pytest.raises(requests.RequestException):
+        dataFetch.fetch_source(session, 'recov', server + '/recov.csv', str(tmp_path))
+    session.close()
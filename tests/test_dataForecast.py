@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+from covid19_analysis.dataForecast import fit_growth
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Noisy exponential growth, the second region has no cases during the first days of the window
+def synthetic_growth(num_days=21, zero_days=8, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_days)
+    values = np.vstack([50 * np.exp(.1 * t), 5 * np.exp(.2 * t)]) * rng.normal(1, .03, (2, num_days))
+    values[1, :zero_days] = 0
+    dates = pd.date_range('2020-03-01', periods=num_days)
+    return pd.DataFrame(np.round(values), index=['A', 'B'], columns=dates)
+
+
+def test_dof_counts_all_days():
+    df = synthetic_growth()
+    fit = fit_growth(df, window=21)
+    assert fit.converged.all()
+    residuals = df.to_numpy() - fit.fitted().to_numpy()
+    sse = (residuals ** 2).sum(axis=1)
+    # zero days are in the squared error, and so in the degrees of freedom
+    np.testing.assert_allclose(fit._sigma2, sse / (df.shape[1] - 2), rtol=1e-6)
+    np.testing.assert_allclose(fit.rmse.to_numpy(), np.sqrt(sse / df.shape[1]), rtol=1e-6)
+    out = fit.forecast(days=3)
+    assert (out['upper'] >= out['mean']).all().all()
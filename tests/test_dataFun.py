@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+import covid19_analysis.dataFun as dataFun
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+def synthetic_jhu(num_days=10):
+    df = pd.DataFrame(np.arange(3 * num_days).reshape(3, num_days),
+                      columns=pd.date_range('2020-01-22', periods=num_days).strftime('%m/%d/%y'))
+    df.insert(0, 'Long', 1.)
+    df.insert(0, 'Lat', 2.)
+    df.insert(0, 'Country/Region', ['France', 'France', 'Italy'])
+    df.insert(0, 'Province/State', [np.nan, 'Reunion', np.nan])
+    return df
+
+
+def test_timeseries_cache_messages(capsys):
+    df = synthetic_jhu()
+    dataFun.timeseries_cache.clear()
+    outputs = []
+    for _ in range(2):
+        ts = dataFun.get_timeseries_from_JHU(df, 'France')
+        outputs.append(capsys.readouterr().out)
+        np.testing.assert_array_equal(ts.to_numpy(), df.iloc[0, 4:].to_numpy())
+    assert 'Only mainland' in outputs[0] and outputs[0] == outputs[1]
+    assert dataFun.timeseries_cache.info()['hits'] == 1
+
+    ts = dataFun.get_timeseries_from_JHU(df, 'all', verbose=False)
+    np.testing.assert_array_equal(ts.to_numpy(), df.iloc[:, 4:].sum().to_numpy())
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+from covid19_analysis.dataHierarchy import HierarchyIndex
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+def synthetic_jhu(num_days=10):
+    df = pd.DataFrame(np.arange(4 * num_days).reshape(4, num_days),
+                      columns=pd.date_range('2020-01-22', periods=num_days).strftime('%m/%d/%y'))
+    df.insert(0, 'Long', 1.)
+    df.insert(0, 'Lat', 2.)
+    df.insert(0, 'Country/Region', ['France', 'France', 'Italy', 'Spain'])
+    df.insert(0, 'Province/State', [np.nan, 'Reunion', np.nan, np.nan])
+    return df
+
+
+def test_matrix_with_all():
+    df = synthetic_jhu()
+    index = HierarchyIndex(df)
+    for mainland in (True, False):
+        df_ctry = index.matrix(['France', 'all'], mainland)
+        np.testing.assert_array_equal(df_ctry.loc['all'].to_numpy(), df.iloc[:, 4:].sum().to_numpy())
+    np.testing.assert_array_equal(index.matrix(['France'], True).iloc[0].to_numpy(), df.iloc[0, 4:].to_numpy())
+    np.testing.assert_array_equal(index.matrix(['France'], False).iloc[0].to_numpy(), df.iloc[:2, 4:].sum().to_numpy())
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import pandas as pd
+import numpy as np
+
+from covid19_analysis.dataMetrics import MetricsEngine
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Small cumulative matrix, with a region without cases (NaN doubling times) and a negative correction
+def synthetic_matrix(num_days=12):
+    dates = pd.date_range('2020-03-01', periods=num_days)
+    values = np.array([
+        np.zeros(num_days),
+        np.arange(num_days) ** 2,
+        np.r_[np.arange(1, num_days) * 10, 95],
+    ], dtype=np.int64)
+    return pd.DataFrame(values, index=['A', 'B', 'C'], columns=dates)
+
+
+def test_check_mode_update():
+    df = synthetic_matrix()
+    engine = MetricsEngine(df.iloc[:, :5], window=3, check=True)
+    engine.update(df)
+    assert engine.verify()
+    assert engine.cumulative.shape == df.shape
+    assert np.isnan(engine.doubling.loc['A']).all()
+    assert engine.daily.loc['C'].iloc[-1] == 0
+
+
+def test_check_mode_append_beyond_capacity():
+    df = synthetic_matrix(40)
+    engine = MetricsEngine(df.iloc[:, :2], window=7, check=True)
+    for date in df.columns[2:]:
+        engine.append(date, df[date].to_numpy())
+    assert engine.verify()
+    np.testing.assert_array_equal(engine.cumulative.to_numpy(), df.to_numpy())
+
+
+def test_verify_detects_difference():
+    engine = MetricsEngine(synthetic_matrix(), window=3)
+    engine._arrays['rolling'][1, 4] += 1
+    with pytest.raises(AssertionError):
+        engine.verify()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import pandas as pd
+import numpy as np
+
+pytest.importorskip('plotly')
+import covid19_analysis.dataPlot as dataPlot
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Small JHU dataset, cumulative cases with a few negative corrections
+def synthetic_jhu(num_days=120, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [(np.nan, 'France'), ('Reunion', 'France'), (np.nan, 'Italy'), (np.nan, 'Spain')]
+    daily = rng.poisson(40, (len(rows), num_days)) * rng.choice([1, -1], (len(rows), num_days), p=[.92, .08])
+    df = pd.DataFrame(np.cumsum(daily, axis=1),
+                      columns=pd.date_range('2020-01-22', periods=num_days).strftime('%m/%d/%y'))
+    df.insert(0, 'Long', 1.)
+    df.insert(0, 'Lat', 2.)
+    df.insert(0, 'Country/Region', [r[1] for r in rows])
+    df.insert(0, 'Province/State', [r[0] for r in rows])
+    return df
+
+
+def assert_one_point_extends(patch, num_traces):
+    assert patch['restyle']['traces'] == []
+    assert patch['extend']['traces'] == list(range(num_traces))
+    assert all(len(x) == 1 for x in patch['extend']['data']['x'])
+    assert patch['points'] == num_traces
+
+
+def test_last_daily_cases_update():
+    df = synthetic_jhu()
+    countries = ['France', 'Italy', 'Spain']
+    fig = dataPlot.last_daily_cases(df.iloc[:, :-2], countries, center=False, show=False)
+    for end in (-1, None):
+        fig, patch = dataPlot.last_daily_cases(df.iloc[:, :end], countries, center=False, base=fig)
+        assert_one_point_extends(patch, len(countries))
+
+
+def test_disp_daily_cases_update():
+    ts = synthetic_jhu().iloc[:, 4:].sum().clip(0)
+    ts.index = pd.to_datetime(ts.index)
+    df_ts = pd.DataFrame({'cases': ts, 'death': ts // 10, 'recov': ts // 2})
+    args = dict(trend=True, anomalies='show', center=False)
+    fig = dataPlot.disp_daily_cases(df_ts.iloc[:-1], 'World', show=False, **args)
+    new, patch = dataPlot.disp_daily_cases(df_ts, 'World', base=fig, **args)
+    # bars & trends get the new day, the anomaly markers are unchanged unless the new day is flagged
+    assert patch['restyle']['traces'] == []
+    assert patch['extend']['traces'][:5] == [0, 1, 2, 3, 4]
+    assert all(len(x) == 1 for x in patch['extend']['data']['x'])
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+import covid19_analysis.dataPopulation as dataPopulation
+from covid19_analysis.dataGouv import HospitalTensor
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Hospital file of a few departments over three days
+def synthetic_gouv(deps=('75', '92', '1', '2A', '971')):
+    dates = pd.date_range('2020-03-18', periods=3)
+    rows = [(d, 0, day.strftime('%Y-%m-%d'), k + i, i) for k, d in enumerate(deps) for i, day in enumerate(dates)]
+    return pd.DataFrame(rows, columns=['dep', 'sexe', 'jour', 'hosp', 'rea'])
+
+
+def test_regions_sum_departments():
+    regions = dataPopulation.get_regions()
+    assert regions['75'] == '11' and regions['2A'] == '94' and regions['971'] == '01'
+    dep_pop = dataPopulation.get_population('dep')
+    reg_pop = dataPopulation.get_population('reg')
+    totals = dep_pop.groupby(regions.reindex(dep_pop.index).to_numpy()).sum()
+    pd.testing.assert_series_equal(totals.sort_index(), reg_pop.sort_index(), check_names=False)
+
+
+def test_mainland_aggregates_sum_provinces():
+    pop = dataPopulation.get_population('jhu')
+    for country in ('China', 'Australia', 'Canada'):
+        provinces = pop[pop.index.str.startswith(country + ' - ')]
+        assert pop[country] == provinces.sum()
+    assert 'China - Hong Kong' in pop.index and 'China - Macau' in pop.index
+
+
+def test_tensor_regions_from_table():
+    tensor = HospitalTensor(synthetic_gouv())
+    assert list(tensor.regs) == ['01', '11', '84', '94']
+    np.testing.assert_array_equal(tensor.matrix('hosp', level='reg').loc['11'].to_numpy(), [1, 3, 5])
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import pandas as pd
+import numpy as np
+
+from covid19_analysis.dataQuery import QuerySession
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Cumulative matrix with negative corrections and missing values
+def synthetic_matrix(num_days=60):
+    rng = np.random.default_rng(0)
+    values = np.cumsum(rng.poisson(30, (4, num_days)) * rng.choice([1, -1], (4, num_days), p=[.9, .1]), axis=1)
+    df = pd.DataFrame(values.astype(float), index=['France', 'Italy', 'Spain', 'US'],
+                      columns=pd.date_range('2020-03-01', periods=num_days))
+    df.iloc[1, 20:23] = np.nan
+    return df
+
+
+# Eager pandas version of diff, clip, rolling (partial windows at the edges) and window
+def eager(df, periods, center, num_days):
+    df_out = df.diff(axis=1).iloc[:, 1:].clip(lower=0)
+    df_out = df_out.T.rolling(periods, center=center, min_periods=1).mean().T
+    return df_out.loc[:, df_out.columns >= df_out.columns[-1] - pd.Timedelta(days=num_days)]
+
+
+@pytest.mark.parametrize('center', [False, True])
+def test_plan_matches_pandas(center):
+    df = synthetic_matrix()
+    session = QuerySession(df)
+    labels = ['Spain', 'Italy']
+    df_lazy = session.query().select(labels).diff().clip(0).rolling(7, center).window(num_days=20).collect()
+    df_eager = eager(df.loc[labels], 7, center, 20)
+    np.testing.assert_allclose(df_lazy.to_numpy(), df_eager.to_numpy(), rtol=1e-12)
+    assert list(df_lazy.index) == labels and df_lazy.columns.equals(df_eager.columns)
+
+    # same plan again and a longer one, from the cached prefix
+    np.testing.assert_allclose(session.query().select(labels).diff().clip(0).rolling(7, center).window(
+        num_days=20).collect().to_numpy(), df_eager.to_numpy(), rtol=1e-12)
+    df_start = session.query().select(labels).diff().clip(0).window('2020-03-10', '2020-04-10').collect()
+    df_exp = df.loc[labels].diff(axis=1).clip(lower=0).loc[:, '2020-03-10':'2020-04-10']
+    np.testing.assert_allclose(df_start.to_numpy(), df_exp.to_numpy(), rtol=1e-12)
+
+
+def test_normalize_factors():
+    df = synthetic_matrix()
+    session = QuerySession(df)
+    population = pd.Series([67e6, 60e6, 47e6, 330e6], index=df.index)
+    df_series = session.query().normalize(population).collect()
+    np.testing.assert_allclose(df_series.to_numpy(), df.div(population, axis=0).to_numpy())
+    # array factors, one value per row of the query, are part of the cache key
+    factor = np.array([2., 4.])
+    for _ in range(2):
+        df_array = session.query().select(['France', 'US']).normalize(factor).collect()
+        np.testing.assert_allclose(df_array.to_numpy(), df.loc[['France', 'US']].to_numpy() / factor[:, None])
+    df_other = session.query().select(['France', 'US']).normalize(np.array([1., 1.])).collect()
+    np.testing.assert_allclose(df_other.to_numpy(), df.loc[['France', 'US']].to_numpy())
+    np.testing.assert_allclose(session.query().normalize(10).collect().to_numpy(), df.to_numpy() / 10)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from covid19_analysis.dataSIR import sir_ensemble, sir_outputs
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+def test_workers_agree_large_population():
+    args = dict(N=67000000, I0=10, days=20, runs=600, seed=1)
+    single = sir_ensemble(workers=1, **args)
+    pooled = sir_ensemble(workers=2, **args)
+    for key in sir_outputs:
+        np.testing.assert_array_equal(single[key].to_numpy(), pooled[key].to_numpy())
+    # day 0 is the initial state in all runs
+    assert (single['I'].iloc[0] == 10).all()
+    assert single['I'].iloc[-1][0.05] < single['I'].iloc[-1][0.95]
+
+
+def test_reproducible_and_conserved():
+    first = sir_ensemble(N=5000, I0=5, days=30, runs=300, seed=3)
+    second = sir_ensemble(N=5000, I0=5, days=30, runs=300, seed=3)
+    for key in sir_outputs:
+        np.testing.assert_array_equal(first[key].to_numpy(), second[key].to_numpy())
+    total = first['S']['mean'] + first['I']['mean'] + first['R']['mean']
+    np.testing.assert_allclose(total, 5000)
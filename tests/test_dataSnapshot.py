@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import pandas as pd
+import numpy as np
+
+from covid19_analysis.dataSnapshot import SnapshotStore
+
+__author__ = "J SAYRITUPAC"
+__copyright__ = "J SAYRITUPAC"
+__license__ = "mit"
+
+
+# Successive releases, one more day each, a past value of France revised by the third one
+def releases():
+    dates = pd.date_range('2020-03-01', periods=6)
+    base = pd.DataFrame([[1, 2, 4, 8, 16, 32], [0, 1, 1, 2, 3, 5]], index=['France', 'Italy'], columns=dates)
+    out = [base.iloc[:, :3], base.iloc[:, :4], base.iloc[:, :5].copy(), base.copy()]
+    out[2].loc['France', dates[1]] = 3
+    out[3].loc['France', dates[1]] = 3
+    out[3].loc['Spain'] = [0, 0, 1, 1, 2, 4]
+    return out
+
+
+@pytest.mark.parametrize('keyframe', [0, 2])
+def test_as_of_revision(keyframe):
+    store = SnapshotStore(keyframe=keyframe)
+    versions = releases()
+    for k, df in enumerate(versions):
+        store.add(df, pd.Timestamp('2020-04-01') + pd.Timedelta(days=k))
+
+    # before the revision, the value first published
+    before = store.as_of('2020-04-02')
+    assert before.loc['France', '2020-03-02'] == 2
+    np.testing.assert_array_equal(before.to_numpy(), versions[1].to_numpy())
+    # after it, the revised value; a date between releases uses the last one before
+    after = store.as_of('2020-04-03 12:00')
+    assert after.loc['France', '2020-03-02'] == 3
+    np.testing.assert_array_equal(after.to_numpy(), versions[2].to_numpy())
+    # new region of the last release
+    assert list(store.as_of().index) == ['France', 'Italy', 'Spain']
+    assert list(store.as_of(release=0).columns) == list(versions[0].columns)
+    with pytest.raises(ValueError):
+        store.as_of('2020-03-31')
+
+    df_rev = store.revisions('France')
+    assert len(df_rev) == 1
+    assert df_rev.iloc[0][['old', 'new']].tolist() == [2, 3]
+    assert df_rev.iloc[0]['release'] == pd.Timestamp('2020-04-03')
+    assert store.revisions('Italy').empty
+
+
+def test_save_load(tmp_path):
+    store = SnapshotStore(keyframe=2)
+    for k, df in enumerate(releases()):
+        store.add(df, pd.Timestamp('2020-04-01') + pd.Timedelta(days=k))
+    path = str(tmp_path / 'store.npz')
+    store.save(path)
+    loaded = SnapshotStore.load(path)
+    for k in range(len(store.releases)):
+        df_loaded, df_stored = loaded.as_of(release=k), store.as_of(release=k)
+        np.testing.assert_array_equal(df_loaded.to_numpy(), df_stored.to_numpy())
+        assert df_loaded.index.equals(df_stored.index) and df_loaded.columns.equals(df_stored.columns)